@@ -3,18 +3,32 @@
 #----------------------------------------------------------------------------#
 
 import json
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, make_response, jsonify
+from datetime import datetime, timedelta, timezone
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, make_response, jsonify, stream_with_context, abort
 from flask_moment import Moment
+from werkzeug.datastructures import MultiDict
 from flask_sqlalchemy import SQLAlchemy
 import logging
-from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from constants import state_choices, genre_choices
 from flask_migrate import Migrate
-from models import Venue, Show, Artist, db
+from models import Venue, Show, Artist, Genre, db
+from queries import venues_by_area, artists_list, venue_detail, artist_detail, upcoming_counts, shows_page, iter_shows
+from queries import entity_validators, listing_validators
+from search import venue_search, artist_search
+from facets import venue_facets, artist_facets
+from cache import page_cache, cached_page, conditional_get, page_csrf_token
+from formatters import format_datetime, format_phone
+from commands import fyyur_cli
+from instrumentation import instrumentation
+from logs import app_logging
+from exporter import EXPORT_KINDS, export_batches, iter_csv, iter_jsonl
+from deletion import delete_record
+from scheduling import occurrences, schedule_shows
+from calendars import parse_calendar_args, show_calendar
+from importer import parse_start_time
+from partitions import archived_until
 
 
 #----------------------------------------------------------------------------#
@@ -24,50 +38,26 @@ from models import Venue, Show, Artist, db
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+db.init_app(app)
 migrate = Migrate(app, db)
-
-#----------------------------------------------------------------------------#
-# Validators.
-#----------------------------------------------------------------------------#
-
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  try:
-      returnedDate = babel.dates.format_datetime(date, format, locale='en')
-  except:
-      returnedDate = str(date)
-  return returnedDate
-
-def format_phone(phone):
-  phone=phone.replace('-','')
-  if(len(phone)==10):
-    phone = phone[:3] +'-' +phone[3:6]+'-'+phone[6:]
-  return phone
-
-app.jinja_env.filters['datetime'] = format_datetime
-
-
-
+page_cache.init_app(app)
+instrumentation.init_app(app)
+app.cli.add_command(fyyur_cli)
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
-
 app.jinja_env.filters['datetime'] = format_datetime
+app.jinja_env.globals['csrf_token'] = page_csrf_token
+
+# Renders a template chunk by chunk through Jinja's generate()
+def stream_template(template_name, **context):
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  stream = template.stream(context)
+  stream.enable_buffering(5)
+  return stream
 
 #----------------------------------------------------------------------------#
 # Controllers.
@@ -82,32 +72,12 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@conditional_get(lambda: listing_validators('venues', upcoming=True))
+@cached_page('venues')
 def venues():
-  cities_dict = {}
-  data = []
-  venues_list = Venue.query.all()
-  
-  for venue in venues_list:
-    city_state = venue.city+'$split$'+venue.state
-    if city_state in cities_dict:
-      cities_dict[city_state].append(venue)
-    else:
-      cities_dict[city_state] = [venue]
-
-  for city in cities_dict:
-    entry = {}
-    city_state = city.split('$split$')
-    entry['city'] = city_state[0]
-    entry['state'] = city_state[1]
-    entry['venues'] = []
-    for venue in cities_dict[city]:
-      venue_dict = {}
-      venue_dict['id'] = venue.id
-      venue_dict['name'] = venue.name
-      venue_dict['num_upcoming_shows'] = venue.num_upcoming_shows()
-      entry['venues'].append(venue)
-    data.append(entry)
-
+  # venues grouped by city/state with their upcoming shows counted in one query
+  # ?genre= only lists the venues having that genre
+  data = venues_by_area(genre=request.args.get('genre'))
   return render_template('pages/venues.html', areas=data)
 
 @app.route('/venues/search', methods=['POST'])
@@ -115,28 +85,36 @@ def search_venues():
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
   search_term=request.form.get('search_term', '')
-  venues = Venue.query.filter(Venue.name.ilike(f'%{search_term}%')).all()
-  data = []
-  response={}
-  response['count'] = len(venues)
-  for venue in venues:
-    entry = {}
-    entry['id'] = venue.id
-    entry['name'] = venue.name
-    entry['num_upcoming_shows'] = venue.num_upcoming_shows()
-    data.append(entry)
-  response['data'] =data
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  page = request.form.get('page', 1, type=int)
+  response = venue_search.search(search_term, limit=app.config['SEARCH_RESULTS_PER_PAGE'], page=page)
+  counts = upcoming_counts(Show.venue_id, [entry['id'] for entry in response['data']])
+  for entry in response['data']:
+    entry['num_upcoming_shows'] = counts[entry['id']]
+  return render_template('pages/search_venues.html', results=response, search_term=search_term)
+
+@app.route('/venues/browse')
+def browse_venues():
+  # filtered page of venues with the city/state/genre/seeking_talent/has_upcoming_shows facet counts
+  filters = venue_facets.parse_filters(request.args)
+  result = venue_facets.browse(filters, page=request.args.get('page', 1, type=int), limit=app.config['BROWSE_PER_PAGE'])
+  return jsonify(success=True, **result)
+
+@app.route('/venues/typeahead')
+def typeahead_venues():
+  # id and name of the venues matching ?q=, for the pickers of the new show form
+  limit = min(request.args.get('limit', app.config['TYPEAHEAD_LIMIT'], type=int), app.config['TYPEAHEAD_LIMIT'])
+  return jsonify(success=True, data=venue_search.typeahead(request.args.get('q', ''), limit=max(limit, 1)))
 
 @app.route('/venues/<int:venue_id>')
+@conditional_get(lambda venue_id: entity_validators(Venue, venue_id))
+@cached_page('venue:{venue_id}')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  try:
-    venue = Venue.query.get(venue_id)
-    print('venue from db is', venue)
-    return render_template('pages/show_venue.html', venue=venue)
-  except:
-    return(render_template('errors/404.html'))
+  venue = venue_detail(venue_id, app.config['DETAIL_SHOWS_LIMIT'], count_cap=app.config['DETAIL_SHOWS_COUNT_CAP'])
+  if venue is None:
+    return(render_template('errors/404.html'), 404)
+  page_cache.tag(*['artist:%d' % show['artist_id'] for show in venue['upcoming_shows'] + venue['past_shows']])
+  return render_template('pages/show_venue.html', venue=venue)
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -165,7 +143,7 @@ def create_venue_submission():
     venue.state = form.state.data
     venue.address = form.address.data
     venue.phone = format_phone(form.phone.data)
-    venue.genres = ','.join(request.form.getlist('genres'))
+    venue.genres = Genre.from_names(request.form.getlist('genres'))
     venue.facebook_link = form.facebook_link.data
     venue.website = form.website.data
     venue.image_link = form.image_link.data
@@ -187,35 +165,39 @@ def create_venue_submission():
 
   return render_template('pages/home.html')
 
-@app.route('/venues/<venue_id>/Delete', methods=['GET'])
+@app.route('/venues/<int:venue_id>/Delete', methods=['POST', 'DELETE'])
 def delete_venue(venue_id):
+  if not DeleteForm().validate():
+    # the redirect renders the page again, with a fresh token
+    flash('The delete form has expired, please try again.', 'error')
+    return redirect(url_for('show_venue', venue_id=venue_id))
   error = False 
-  print('Deleting venue')
+  scheduled = False
   try:  
-    venue = Venue.query.get(venue_id)
-    db.session.delete(venue)
-    db.session.commit()
-  except:
+    scheduled = delete_record(Venue, venue_id)
+  except Exception:
     error=True
+    app.logger.exception('could not delete venue %s', venue_id)
     db.session.rollback()
   finally:
     db.session.close()
   if error:
-    flash('An error occured. Venue ' +str(venue_id) + ' Could not be listed.', 'error')
-    return redirect(url_for('venues'))
+    flash('An error occured. Venue ' +str(venue_id) + ' could not be deleted.', 'error')
+  elif scheduled:
+    # large show histories are deleted in batches by background workers
+    flash('Venue ' + str(venue_id) +' is being deleted.')
   else:
     flash('Venue ' + str(venue_id) +' was successfully deleted.')
-    return redirect(url_for('venues'))
+  return redirect(url_for('venues'))
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@conditional_get(lambda: listing_validators('artists'))
+@cached_page('artists')
 def artists():
-  artists_list = Artist.query.all()
-  data=[]
-  for artist in artists_list:
-    entry = {'id':artist.id ,'name':artist.name }
-    data.append(entry)
+  # ?genre= only lists the artists having that genre
+  data = artists_list(genre=request.args.get('genre'))
   return render_template('pages/artists.html', artists=data)
 
 @app.route('/artists/search', methods=['POST'])
@@ -223,27 +205,59 @@ def search_artists():
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
   search_term=request.form.get('search_term', '')
-  artists = Artist.query.filter(Artist.name.ilike(f'%{search_term}%')).all()
-  data = []
-  response={}
-  response['count'] = len(artists)
-  for artist in artists:
-    entry = {}
-    entry['id'] = artist.id
-    entry['name'] = artist.name
-    entry['num_upcoming_shows'] = artist.num_upcoming_shows()
-    data.append(entry)
-  response['data'] =data
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  page = request.form.get('page', 1, type=int)
+  response = artist_search.search(search_term, limit=app.config['SEARCH_RESULTS_PER_PAGE'], page=page)
+  counts = upcoming_counts(Show.artist_id, [entry['id'] for entry in response['data']])
+  for entry in response['data']:
+    entry['num_upcoming_shows'] = counts[entry['id']]
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
+
+@app.route('/artists/browse')
+def browse_artists():
+  # filtered page of artists with the city/state/genre/seeking_venues/has_upcoming_shows facet counts
+  filters = artist_facets.parse_filters(request.args)
+  result = artist_facets.browse(filters, page=request.args.get('page', 1, type=int), limit=app.config['BROWSE_PER_PAGE'])
+  return jsonify(success=True, **result)
+
+@app.route('/artists/typeahead')
+def typeahead_artists():
+  # id and name of the artists matching ?q=, for the pickers of the new show form
+  limit = min(request.args.get('limit', app.config['TYPEAHEAD_LIMIT'], type=int), app.config['TYPEAHEAD_LIMIT'])
+  return jsonify(success=True, data=artist_search.typeahead(request.args.get('q', ''), limit=max(limit, 1)))
 
 @app.route('/artists/<int:artist_id>')
+@conditional_get(lambda artist_id: entity_validators(Artist, artist_id))
+@cached_page('artist:{artist_id}')
 def show_artist(artist_id):
-  # shows the venue page with the given venue_id
-  try:
-    artist = Artist.query.get(artist_id)
-    return render_template('pages/show_artist.html', artist=artist)
-  except:
-    return(render_template('errors/404.html'))
+  # shows the artist page with the given artist_id
+  artist = artist_detail(artist_id, app.config['DETAIL_SHOWS_LIMIT'], count_cap=app.config['DETAIL_SHOWS_COUNT_CAP'])
+  if artist is None:
+    return(render_template('errors/404.html'), 404)
+  page_cache.tag(*['venue:%d' % show['venue_id'] for show in artist['upcoming_shows'] + artist['past_shows']])
+  return render_template('pages/show_artist.html', artist=artist)
+
+@app.route('/artists/<int:artist_id>/Delete', methods=['POST', 'DELETE'])
+def delete_artist(artist_id):
+  if not DeleteForm().validate():
+    flash('The delete form has expired, please try again.', 'error')
+    return redirect(url_for('show_artist', artist_id=artist_id))
+  error = False 
+  scheduled = False
+  try:  
+    scheduled = delete_record(Artist, artist_id)
+  except Exception:
+    error=True
+    app.logger.exception('could not delete artist %s', artist_id)
+    db.session.rollback()
+  finally:
+    db.session.close()
+  if error:
+    flash('An error occured. Artist ' +str(artist_id) + ' could not be deleted.', 'error')
+  elif scheduled:
+    flash('Artist ' + str(artist_id) +' is being deleted.')
+  else:
+    flash('Artist ' + str(artist_id) +' was successfully deleted.')
+  return redirect(url_for('artists'))
 
 #  Update
 #  ----------------------------------------------------------------
@@ -254,7 +268,7 @@ def edit_artist(artist_id):
   artist_data={
     "id": artist.id,
     "name": artist.name,
-    "genres": artist.genres.split(','),
+    "genres": artist.genre_names,
     "city": artist.city,
     "state": artist.state,
     "phone": artist.phone,
@@ -269,7 +283,7 @@ def edit_artist(artist_id):
   form.state.data =artist.state
   form.state.choices=state_choices
   form.genres.choices.clear()
-  form.genres.data = artist.genres
+  form.genres.data = artist.genre_names
   form.genres.choices = genre_choices
   form.phone.data = artist.phone
   form.facebook_link.data = artist.facebook_link
@@ -300,7 +314,7 @@ def edit_artist_submission(artist_id):
     artist.city = form.city.data
     artist.state = form.state.data
     artist.phone = format_phone(form.phone.data)
-    artist.genres = ','.join(request.form.getlist('genres'))
+    artist.genres = Genre.from_names(request.form.getlist('genres'))
     artist.facebook_link = form.facebook_link.data
     artist.website = form.website.data
     artist.image_link = form.image_link.data
@@ -333,7 +347,7 @@ def edit_venue(venue_id):
   form.state.data =venue.state
   form.state.choices=state_choices
   form.genres.choices.clear()
-  form.genres.data = venue.genres
+  form.genres.data = venue.genre_names
   form.genres.choices = genre_choices
   form.address.data = venue.address
   form.phone.data = venue.phone
@@ -365,7 +379,7 @@ def edit_venue_submission(venue_id):
     venue.state = form.state.data
     venue.address = form.address.data
     venue.phone = format_phone(form.phone.data)
-    venue.genres = ','.join(request.form.getlist('genres'))
+    venue.genres = Genre.from_names(request.form.getlist('genres'))
     venue.facebook_link = form.facebook_link.data
     venue.website = form.website.data
     venue.image_link = form.image_link.data
@@ -410,7 +424,7 @@ def create_artist_submission():
     artist.city = form.city.data
     artist.state = form.state.data
     artist.phone = format_phone(form.phone.data)
-    artist.genres = ','.join(request.form.getlist('genres'))
+    artist.genres = Genre.from_names(request.form.getlist('genres'))
     artist.facebook_link = form.facebook_link.data
     artist.website = form.website.data
     artist.image_link = form.image_link.data
@@ -435,45 +449,59 @@ def create_artist_submission():
 
 @app.route('/shows')
 def shows():
-  # displays list of shows at /shows
-  data=[]
-  shows = Show.query.order_by(db.desc(Show.start_time)).all()
-  for show in shows:
-    data.append(
-      {
-        "venue_id": show.venue.id,
-    "venue_name": show.venue.name,
-    "artist_id": show.artist.id,
-    "artist_name": show.artist.name,
-    "artist_image_link": show.artist.image_link,
-    "start_time": str(show.start_time)
-      }
-    )
-
-  return render_template('pages/shows.html', shows=data)
+  # displays list of shows at /shows, one keyset page at a time
+  # ?stream=1 renders every show as it is read from the database instead
+  if request.args.get('stream', type=int):
+    return Response(stream_with_context(stream_template('pages/shows.html', shows=iter_shows())))
+  try:
+    data, next_cursor = shows_page(app.config['SHOWS_PER_PAGE'], request.args.get('cursor'))
+  except ValueError:
+    abort(400)
+  return render_template('pages/shows.html', shows=data, next_cursor=next_cursor)
+
+@app.route('/shows/calendar')
+def shows_calendar():
+  # number of shows and first shows of each day, week or month between ?from= and ?to=,
+  # e.g. /shows/calendar?unit=day&from=2035-04-01&to=2035-05-01&city=Austin;
+  # also filters on state, venue_id and artist_id, ?per_bucket= sets the number of shows
+  try:
+    unit, start, end, filters = parse_calendar_args(request.args, app.config['CALENDAR_MAX_BUCKETS'])
+  except ValueError as e:
+    return jsonify(success=False, errors=[str(e)]), 400
+  limit = min(max(request.args.get('per_bucket', app.config['CALENDAR_SHOWS_PER_BUCKET'], type=int), 0),
+              app.config['CALENDAR_MAX_SHOWS_PER_BUCKET'])
+  buckets = show_calendar(unit, start, end, filters, limit)
+  return jsonify(success=True, unit=unit, start=start.isoformat(), end=end.isoformat(), buckets=buckets)
 
 @app.route('/shows/create')
 def create_shows():
-  artists_ids = [(artist.id,artist.name+' (id:'+str(artist.id)+')') for artist in Artist.query.all()]
-  venues_ids = [(venue.id,venue.name+' (id:'+str(venue.id)+')') for venue in Venue.query.all()]
+  # artists and venues are picked through /artists/typeahead and /venues/typeahead
   form = ShowForm()
-  form.venue_id.choices = venues_ids
-  form.artist_id.choices = artists_ids
-  return render_template('forms/new_show.html', form=form , data={'artists_ids':artists_ids,'venues_ids':venues_ids})
+  return render_template('forms/new_show.html', form=form)
 
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
+  form = ShowForm()
   error = False
   try:
-    show = Show()
-    show.start_time = request.form['start_time']
-    show.venue_id = request.form['venue_id']
-    show.artist_id = request.form['artist_id']
-    db.session.add(show)
-    db.session.commit()
-  except Exception as e:
+    form.validate()
+    errors = form.artist_id.errors + form.venue_id.errors
+    if(len(errors)>0):
+      flash(','.join(errors), 'error')
+      return render_template('forms/new_show.html', form=form)
+    start_time = parse_start_time(request.form['start_time'])
+    errors = archived_errors([start_time])
+    if errors:
+      flash(','.join(errors), 'error')
+      return render_template('forms/new_show.html', form=form)
+    rows, conflicts = schedule_shows(form.venue_id.data, form.artist_id.data, [start_time], show_length())
+    if conflicts:
+      db.session.rollback()
+      flash(booking_conflict_message(conflicts), 'error')
+      return render_template('forms/new_show.html', form=form)
+  except Exception:
     error = True
-    print(e)
+    app.logger.exception('could not create the show starting at %s', request.form.get('start_time'))
     db.session.rollback()
   finally:
     db.session.close()
@@ -483,6 +511,106 @@ def create_show_submission():
     flash('Show starting at' + request.form['start_time'] + ' was successfully listed!')
   return render_template('pages/home.html')
 
+@app.route('/shows/schedule', methods=['POST'])
+def schedule_show_series():
+  # books every occurrence of a recurrence rule at once, e.g.
+  # {"venue_id": 1, "artist_id": 2, "start_time": "2035-04-03T21:00", "frequency": "weekly", "count": 52};
+  # nothing is booked when one of them overlaps a show of the venue or the artist
+  if request.is_json:
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+      return jsonify(success=False, errors=['The body must be a JSON object']), 400
+    # browsers can't send a JSON body cross-site without a CORS preflight,
+    # so only JSON requests skip the CSRF token
+    form = ShowForm(formdata=MultiDict(data), meta={'csrf': False})
+  else:
+    data = request.form
+    form = ShowForm()
+  form.validate()
+  errors = form.errors.get('csrf_token', []) + form.artist_id.errors + form.venue_id.errors
+  start_times = []
+  try:
+    count = int(data.get('count', 1))
+    if count > app.config['SCHEDULE_MAX_SHOWS']:
+      errors.append('At most %d shows can be scheduled at once' % app.config['SCHEDULE_MAX_SHOWS'])
+    elif not data.get('start_time'):
+      errors.append('start_time is required')
+    else:
+      start_times = occurrences(parse_start_time(data['start_time']), data.get('frequency', 'weekly'),
+                                count, int(data.get('interval', 1)))
+      errors += archived_errors(start_times)
+  except (TypeError, ValueError, OverflowError) as e:
+    errors.append(str(e))
+  if errors:
+    return jsonify(success=False, errors=errors), 400
+  try:
+    rows, conflicts = schedule_shows(form.venue_id.data, form.artist_id.data, start_times, show_length())
+    if conflicts:
+      db.session.rollback()
+      return jsonify(success=False, errors=[booking_conflict_message(conflicts)], conflicts=[{
+        'start_time': start_time.isoformat(),
+        'show_id': show.id,
+        'show_start_time': show.start_time.isoformat(),
+        'booked': 'venue' if show.venue_id == form.venue_id.data else 'artist',
+      } for start_time, show in conflicts]), 409
+  except Exception:
+    db.session.rollback()
+    raise
+  finally:
+    db.session.close()
+  return jsonify(success=True, scheduled=len(rows), start_times=[row['start_time'].isoformat() for row in rows]), 201
+
+# Shows dated in the range archived by `flask fyyur partitions` are refused (Postgres)
+def archived_errors(start_times):
+  until = archived_until()
+  if until is not None and start_times and min(start_times) < until:
+    return ['Shows before %s are archived and can no longer be booked' % until.date().isoformat()]
+  return []
+
+def show_length():
+  return timedelta(minutes=app.config['SHOW_LENGTH_MINUTES'])
+
+def booking_conflict_message(conflicts):
+  return 'The venue or the artist is already booked on ' + ', '.join(
+    sorted({format_datetime(start_time) for start_time, show in conflicts}))
+
+@app.route('/export/<kind>')
+def export(kind):
+  # streams every venue/artist/show as csv (default) or ?format=jsonl,
+  # ?since=<ISO time, UTC unless it has an offset> limits it to the rows changed or deleted after that time
+  if kind not in EXPORT_KINDS:
+    abort(404)
+  format = request.args.get('format', 'csv')
+  if format not in ('csv', 'jsonl'):
+    abort(400)
+  since = request.args.get('since')
+  if since:
+    try:
+      since = datetime.fromisoformat(since)
+    except ValueError:
+      abort(400)
+    if since.tzinfo is not None:
+      # the updated_at/deleted_at columns are naive UTC
+      since = since.astimezone(timezone.utc).replace(tzinfo=None)
+  batches = export_batches(kind, since or None)
+  if format == 'csv':
+    chunks, mimetype = iter_csv(kind, batches, incremental=bool(since)), 'text/csv'
+  else:
+    chunks, mimetype = iter_jsonl(kind, batches), 'application/x-ndjson'
+  response = Response(stream_with_context(chunks), mimetype=mimetype)
+  response.headers['Content-Disposition'] = 'attachment; filename=%s.%s' % (kind, format)
+  return response
+
+@app.route('/cache/stats')
+def cache_stats():
+  # hit/miss counters of the rendered-page cache
+  return jsonify(success=True, **page_cache.stats())
+
+@app.route('/logs/stats')
+def log_stats():
+  # records waiting to be written and dropped because the log queue was full
+  return jsonify(success=True, **app_logging.stats())
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -492,14 +620,11 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
+# Request ids everywhere; outside debug, JSON lines written to a rotated
+# LOG_FILE by a background thread (see logs.py)
+app_logging.init_app(app)
 if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
     app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
 #----------------------------------------------------------------------------#
@@ -0,0 +1,218 @@
+#----------------------------------------------------------------------------#
+# Load benchmark.
+# For each dataset size N, a worker process loads N venues, N artists and
+# 10N shows from generator.py into a fresh SQLite database, then requests
+# every interactive route through the Flask test client and, with --server,
+# through a real WSGI server. It records p50/p99 latency, queries per request
+# and the peak RSS of the worker. Results are compared with the baseline file
+# (a regression makes the run exit with status 1) or saved as the new one.
+#
+#   python bench.py --sizes 1000,10000 --server
+#   python bench.py --sizes 1000,10000 --server --save
+#----------------------------------------------------------------------------#
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.client import HTTPConnection
+from urllib.parse import urlencode
+
+parser = argparse.ArgumentParser(description='Benchmark the Fyyur routes at several dataset sizes')
+parser.add_argument('--sizes', default='1000,10000', help='comma separated numbers of venues/artists')
+parser.add_argument('--requests', type=int, default=50, help='timed requests per route')
+parser.add_argument('--server', action='store_true', help='also measure through a WSGI server')
+parser.add_argument('--page-cache', action='store_true', help='keep the rendered-page cache on')
+parser.add_argument('--baseline', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json'))
+parser.add_argument('--save', action='store_true', help='write the results to the baseline file')
+parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p50 slowdown before a regression')
+parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+# Shows are generated per venue/artist, the anchor keeps past/upcoming splits stable
+SHOWS_PER_ENTITY = 10
+ANCHOR = datetime(2026, 1, 1)
+
+# Slowdowns under this many milliseconds are treated as noise
+NOISE_MS = 1.0
+
+# (method, path, form); {venue_id}/{artist_id} take a different existing id on every request
+ROUTES = [
+  ('GET', '/', None),
+  ('GET', '/venues', None),
+  ('GET', '/artists', None),
+  ('GET', '/shows', None),
+  ('GET', '/venues/{venue_id}', None),
+  ('GET', '/artists/{artist_id}', None),
+  ('POST', '/venues/search', {'search_term': 'Velvet Hall'}),
+  ('POST', '/artists/search', {'search_term': 'Neon'}),
+  ('GET', '/venues/browse?genre=Jazz', None),
+  ('GET', '/artists/browse?city=Austin', None),
+  ('GET', '/venues/typeahead?q=gold', None),
+  ('GET', '/artists/typeahead?q=mid', None),
+  ('GET', '/shows/create', None),
+]
+
+def percentile(timings, fraction):
+  timings = sorted(timings)
+  return timings[int(fraction * (len(timings) - 1))]
+
+#----------------------------------------------------------------------------#
+# Worker: one dataset size, results printed as JSON.
+#----------------------------------------------------------------------------#
+
+def run_worker(size):
+  from sqlalchemy import event
+  from app import app
+  from models import db
+  from cache import page_cache
+  from generator import Generator
+  from importer import Importer
+
+  with app.app_context():
+    db.create_all()
+    generator = Generator(anchor=ANCHOR)
+    start = time.perf_counter()
+    for kind, rows in (
+      ('venues', generator.venues(size)),
+      ('artists', generator.artists(size)),
+      ('shows', generator.shows(size * SHOWS_PER_ENTITY, size, size)),
+    ):
+      Importer(kind).run(rows)
+    load_seconds = time.perf_counter() - start
+    engine = db.engine
+
+  if not args.page_cache:
+    page_cache.backend = None
+  statements = []
+  event.listen(engine, 'before_cursor_execute', lambda *arguments: statements.append(1))
+  ids = random.Random(size)
+
+  def client_request(method, path, form):
+    client = app.test_client()
+    response = client.open(path, method=method, data=form)
+    return response.status_code
+
+  connection = None
+  if args.server:
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+      def log_request(self, *arguments):
+        pass
+
+    server = make_server('127.0.0.1', 0, app, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    connection = HTTPConnection('127.0.0.1', server.server_port)
+
+  def server_request(method, path, form):
+    body = urlencode(form) if form else None
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'} if form else {}
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    response.read()
+    return response.status
+
+  results = {}
+  for method, pattern, form in ROUTES:
+    route = '%s %s' % (method, pattern)
+    results[route] = {}
+    modes = [('client', client_request)] + ([('server', server_request)] if args.server else [])
+    for mode, request in modes:
+      paths = [pattern.format(venue_id=ids.randint(1, size), artist_id=ids.randint(1, size))
+               for i in range(args.requests + 1)]
+      status = request(method, paths[0], form)
+      timings = []
+      del statements[:]
+      for path in paths[1:]:
+        start = time.perf_counter()
+        request(method, path, form)
+        timings.append((time.perf_counter() - start) * 1000)
+      results[route][mode] = {
+        'status': status,
+        'p50_ms': round(percentile(timings, 0.5), 2),
+        'p99_ms': round(percentile(timings, 0.99), 2),
+        'queries': round(len(statements) / len(timings), 2),
+      }
+
+  print(json.dumps({
+    'size': size,
+    'rows': {'venues': size, 'artists': size, 'shows': size * SHOWS_PER_ENTITY},
+    'load_seconds': round(load_seconds, 1),
+    'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    'routes': results,
+  }))
+
+#----------------------------------------------------------------------------#
+# Driver: one worker per size, then the comparison with the baseline.
+#----------------------------------------------------------------------------#
+
+def run_size(size):
+  environment = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+  command = [sys.executable, os.path.abspath(__file__), '--worker', str(size), '--requests', str(args.requests)]
+  if args.server:
+    command.append('--server')
+  if args.page_cache:
+    command.append('--page-cache')
+  output = subprocess.run(command, env=environment, stdout=subprocess.PIPE, check=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+  return json.loads(output.decode().strip().splitlines()[-1])
+
+# Returns the regressions of `current` against `baseline`, as printable lines
+def compare(current, baseline):
+  regressions = []
+  for route, modes in current['routes'].items():
+    for mode, result in modes.items():
+      before = baseline['routes'].get(route, {}).get(mode)
+      if before is None:
+        continue
+      slower = result['p50_ms'] - before['p50_ms']
+      if slower > NOISE_MS and result['p50_ms'] > before['p50_ms'] * (1 + args.tolerance):
+        regressions.append('%s [%s] p50 %.1fms -> %.1fms' % (route, mode, before['p50_ms'], result['p50_ms']))
+      if result['queries'] > before['queries']:
+        regressions.append('%s [%s] queries %.1f -> %.1f' % (route, mode, before['queries'], result['queries']))
+  return regressions
+
+def main():
+  sizes = [int(size) for size in args.sizes.split(',')]
+  baseline = {}
+  if os.path.exists(args.baseline):
+    with open(args.baseline) as file:
+      baseline = {entry['size']: entry for entry in json.load(file)['sizes']}
+
+  results = []
+  regressions = []
+  for size in sizes:
+    result = run_size(size)
+    results.append(result)
+    print('\n%d venues/artists, %d shows (loaded in %.1fs), peak RSS %.0fMB' % (
+      size, result['rows']['shows'], result['load_seconds'], result['peak_rss_mb']))
+    for route, modes in result['routes'].items():
+      for mode, timing in modes.items():
+        print('  %-32s %-6s %3d  p50=%7.2fms  p99=%7.2fms  queries=%.1f' % (
+          route, mode, timing['status'], timing['p50_ms'], timing['p99_ms'], timing['queries']))
+    if size in baseline:
+      regressions += ['%d: %s' % (size, line) for line in compare(result, baseline[size])]
+
+  if args.save:
+    with open(args.baseline, 'w') as file:
+      json.dump({'requests': args.requests, 'sizes': results}, file, indent=2)
+      file.write('\n')
+    print('\nbaseline saved to %s' % args.baseline)
+  elif regressions:
+    print('\nregressions against %s:' % args.baseline)
+    for line in regressions:
+      print('  ' + line)
+    sys.exit(1)
+
+if args.worker:
+  run_worker(args.worker)
+else:
+  main()
@@ -0,0 +1,46 @@
+#----------------------------------------------------------------------------#
+# Date formatting benchmark.
+# Formats the start times of N shows (hourly slots, so values repeat the way
+# they do on real pages) with the old parse-every-call filter and with the
+# memoized one in formatters.py.
+#
+#   python bench_formatters.py --shows 100000
+#----------------------------------------------------------------------------#
+
+import argparse
+import time
+from datetime import datetime, timedelta
+import babel.dates
+import dateutil.parser
+import formatters
+
+parser = argparse.ArgumentParser(description='Benchmark the datetime template filter')
+parser.add_argument('--shows', type=int, default=100000)
+parser.add_argument('--slots', type=int, default=2000)
+args = parser.parse_args()
+
+# The filter as it was: start times were passed as strings and re-parsed
+def format_datetime_parsed(value, format='medium'):
+  date = dateutil.parser.parse(value)
+  if format == 'full':
+    format = "EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+    format = "EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format, locale='en')
+
+start = datetime(2035, 1, 1, 18, 0)
+times = [start + timedelta(hours=i % args.slots) for i in range(args.shows)]
+strings = [str(value) for value in times]
+
+def run(label, function, values):
+  begin = time.perf_counter()
+  for value in values:
+    function(value, 'full')
+  elapsed = time.perf_counter() - begin
+  print(f'{label:24} {elapsed * 1000:8.0f}ms  {elapsed / len(values) * 1e6:6.2f}us/show')
+
+run('parsed strings', format_datetime_parsed, strings)
+formatters.format_datetime.cache_clear()
+run('datetime, cold cache', formatters.format_datetime, times)
+run('datetime, warm cache', formatters.format_datetime, times)
+print(formatters.format_datetime.cache_info())
@@ -0,0 +1,112 @@
+#----------------------------------------------------------------------------#
+# Shows partitioning benchmark (Postgres).
+# Fills a flat shows table and one partitioned like migration a7c3e91d5b02
+# (cold archive, monthly hot partitions, default) with the same N shows, two
+# thirds of them in the past, then times the upcoming-show queries of the
+# site on both and counts the partitions their plans scan.
+#
+#   DATABASE_URL=postgresql://localhost/fyyur python bench_partitions.py --shows 1000000
+#----------------------------------------------------------------------------#
+
+import argparse
+import os
+import re
+import time
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import create_engine, text
+
+parser = argparse.ArgumentParser(description='Compare upcoming show queries on a flat and a partitioned shows table')
+parser.add_argument('--url', default=os.environ.get('DATABASE_URL'), help='postgres database, defaults to DATABASE_URL')
+parser.add_argument('--shows', type=int, default=1000000)
+parser.add_argument('--venues', type=int, default=10000)
+parser.add_argument('--repeat', type=int, default=50, help='timed runs per query')
+parser.add_argument('--keep', action='store_true', help='keep the bench_partitions schema')
+args = parser.parse_args()
+
+SCHEMA = 'bench_partitions'
+NOW = datetime(2026, 1, 15, 12, 0)
+# shows spread over two years before NOW and one after it
+DAYS_BEFORE, DAYS_AFTER = 730, 365
+MONTHS_AHEAD = 12
+
+QUERIES = [
+  ('upcoming counts per venue',
+   'SELECT venue_id, count(*) FROM {table} WHERE start_time > :now GROUP BY venue_id'),
+  ('upcoming shows of a venue',
+   'SELECT id, start_time FROM {table} WHERE venue_id = :venue AND start_time > :now ORDER BY start_time LIMIT 10'),
+  ('next 50 shows',
+   'SELECT id, venue_id, start_time FROM {table} WHERE start_time > :now ORDER BY start_time LIMIT 50'),
+  ('shows of next week',
+   "SELECT count(*) FROM {table} WHERE start_time > :now AND start_time < :now + interval '7 days'"),
+]
+
+def create_tables(connection):
+  connection.execute('DROP SCHEMA IF EXISTS %s CASCADE' % SCHEMA)
+  connection.execute('CREATE SCHEMA %s' % SCHEMA)
+  columns = 'id integer NOT NULL, artist_id integer NOT NULL, venue_id integer NOT NULL, start_time timestamp NOT NULL'
+  connection.execute('CREATE TABLE {0}.flat ({1}, PRIMARY KEY (id))'.format(SCHEMA, columns))
+  connection.execute('CREATE TABLE {0}.partitioned ({1}, PRIMARY KEY (id, start_time)) '
+                     'PARTITION BY RANGE (start_time)'.format(SCHEMA, columns))
+  current = datetime(NOW.year, NOW.month, 1)
+  connection.execute("CREATE TABLE {0}.partitioned_archive PARTITION OF {0}.partitioned "
+                     "FOR VALUES FROM (MINVALUE) TO ('{1}')".format(SCHEMA, current))
+  for i in range(MONTHS_AHEAD + 1):
+    month = current + relativedelta(months=i)
+    connection.execute("CREATE TABLE {0}.partitioned_{1:%Y_%m} PARTITION OF {0}.partitioned "
+                       "FOR VALUES FROM ('{2}') TO ('{3}')".format(SCHEMA, month, month, month + relativedelta(months=1)))
+  connection.execute('CREATE TABLE {0}.partitioned_default PARTITION OF {0}.partitioned DEFAULT'.format(SCHEMA))
+
+def load(connection):
+  connection.execute('SELECT setseed(0.42)')
+  connection.execute(text('''
+    INSERT INTO {0}.flat
+    SELECT i, 1 + (random() * (:venues - 1))::int, 1 + (random() * (:venues - 1))::int,
+           :start + (random() * :days) * interval '1 day'
+    FROM generate_series(1, :shows) AS i
+  '''.format(SCHEMA)), venues=args.venues, shows=args.shows,
+    start=NOW - relativedelta(days=DAYS_BEFORE), days=DAYS_BEFORE + DAYS_AFTER)
+  connection.execute('INSERT INTO {0}.partitioned SELECT * FROM {0}.flat'.format(SCHEMA))
+  for table in ('flat', 'partitioned'):
+    for name, index_columns in (('venue_id_start_time', 'venue_id, start_time'), ('start_time', 'start_time')):
+      connection.execute('CREATE INDEX {1}_{2} ON {0}.{1} ({3})'.format(SCHEMA, table, name, index_columns))
+    connection.execute('ANALYZE {0}.{1}'.format(SCHEMA, table))
+
+# Number of distinct tables read by the plan of a statement
+def scanned_tables(connection, statement, params):
+  plan = '\n'.join(row[0] for row in connection.execute(text('EXPLAIN ' + statement), **params))
+  return len(set(re.findall(r'(?:Seq Scan|Index Scan using \w+|Index Only Scan using \w+|Bitmap Heap Scan) on (\w+)', plan)))
+
+def time_query(connection, statement, params):
+  timings = []
+  for i in range(args.repeat + 1):
+    start = time.perf_counter()
+    connection.execute(text(statement), **params).fetchall()
+    timings.append((time.perf_counter() - start) * 1000)
+  timings = sorted(timings[1:])
+  return timings[len(timings) // 2]
+
+def main():
+  if not args.url or not args.url.startswith('postgres'):
+    parser.error('a postgres --url (or DATABASE_URL) is needed')
+  engine = create_engine(args.url)
+  with engine.connect() as connection:
+    connection = connection.execution_options(autocommit=True)
+    start = time.perf_counter()
+    create_tables(connection)
+    load(connection)
+    print('%d shows loaded in %.1fs, %d upcoming\n' % (args.shows, time.perf_counter() - start, connection.execute(
+      text('SELECT count(*) FROM {0}.flat WHERE start_time > :now'.format(SCHEMA)), now=NOW).scalar()))
+    params = {'now': NOW, 'venue': 1}
+    print('%-28s %12s %12s %10s' % ('query', 'flat p50', 'partitioned', 'tables'))
+    try:
+      for label, query in QUERIES:
+        flat = time_query(connection, query.format(table=SCHEMA + '.flat'), params)
+        partitioned = time_query(connection, query.format(table=SCHEMA + '.partitioned'), params)
+        tables = scanned_tables(connection, query.format(table=SCHEMA + '.partitioned'), params)
+        print('%-28s %10.2fms %10.2fms %10d' % (label, flat, partitioned, tables))
+    finally:
+      if not args.keep:
+        connection.execute('DROP SCHEMA %s CASCADE' % SCHEMA)
+
+main()
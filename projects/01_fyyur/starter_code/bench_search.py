@@ -0,0 +1,65 @@
+#----------------------------------------------------------------------------#
+# Search benchmark.
+# Loads N venues into the database given by DATABASE_URL (a temporary SQLite
+# file by default) and times ranked searches for exact, substring and
+# misspelled terms.
+#
+#   python bench_search.py --rows 1000000
+#----------------------------------------------------------------------------#
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+parser = argparse.ArgumentParser(description='Benchmark the venue name search')
+parser.add_argument('--rows', type=int, default=1000000)
+parser.add_argument('--repeat', type=int, default=20)
+args = parser.parse_args()
+
+if 'DATABASE_URL' not in os.environ:
+  os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_search.db')
+
+from app import app
+from models import db, Venue
+from search import venue_search
+
+WORDS = ['The', 'Musical', 'Hop', 'Park', 'Square', 'Live', 'Music', 'Coffee', 'Dueling', 'Pianos',
+         'Bar', 'Jazz', 'Club', 'Blue', 'Note', 'Hall', 'Arena', 'Lounge', 'Garden', 'Theatre']
+TERMS = ['The Musical Hop', 'Music', 'Musicl Hop', 'Jaz Clb', 'Ho']
+
+def load(rows):
+  generator = random.Random(42)
+  batch = []
+  for i in range(rows):
+    name = ' '.join(generator.sample(WORDS, 3)) + ' ' + str(i)
+    batch.append({'name': name, 'address': '1 Main St', 'city': 'Austin',
+                  'state': 'TX', 'seeking_talent': True})
+    if len(batch) == 10000:
+      db.session.execute(Venue.__table__.insert(), batch)
+      batch = []
+  if batch:
+    db.session.execute(Venue.__table__.insert(), batch)
+  db.session.commit()
+
+with app.app_context():
+  db.create_all()
+  if Venue.query.count() < args.rows:
+    start = time.perf_counter()
+    load(args.rows - Venue.query.count())
+    print(f'loaded {args.rows} venues in {time.perf_counter() - start:.1f}s')
+
+  start = time.perf_counter()
+  venue_search.search('warm up')
+  print(f'first search (index build) {(time.perf_counter() - start) * 1000:.0f}ms')
+
+  for term in TERMS:
+    timings = []
+    for i in range(args.repeat):
+      start = time.perf_counter()
+      results = venue_search.search(term, limit=20)
+      timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f'{term!r:20} matches={results["count"]:<8} '
+          f'p50={timings[len(timings) // 2] * 1000:.1f}ms max={timings[-1] * 1000:.1f}ms')
@@ -0,0 +1,328 @@
+import hashlib
+import pickle
+import threading
+import time
+import uuid
+from datetime import datetime
+from collections import OrderedDict
+from functools import wraps
+import flask
+from flask import g, request
+from flask_wtf.csrf import generate_csrf
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from models import Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# In-process caches.
+#----------------------------------------------------------------------------#
+
+class TTLCache:
+  # Thread-safe mapping whose entries expire `ttl` seconds after being set.
+  # Once `maxsize` entries are stored the least recently used one is evicted.
+  def __init__(self, ttl, maxsize=1024):
+    self.ttl = ttl
+    self.maxsize = maxsize
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+
+  def get(self, key, default=None):
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        return default
+      expires, value = entry
+      if expires < time.monotonic():
+        del self.entries[key]
+        return default
+      self.entries.move_to_end(key)
+      return value
+
+  def set(self, key, value):
+    with self.lock:
+      self.entries[key] = (time.monotonic() + self.ttl, value)
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.maxsize:
+        self.entries.popitem(last=False)
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+
+#----------------------------------------------------------------------------#
+# Rendered-page cache.
+# Pages are stored with the tags of the entities they show ('venue:1',
+# 'artist:4', 'venues' for the listing, 'shows' for any show...). Each tag has a version taken
+# from a global epoch; committing a change to a Venue, Artist or Show bumps
+# the versions of its tags, and a cached page is only served while all its
+# tags still have the versions it was rendered with.
+#----------------------------------------------------------------------------#
+
+class MemoryBackend:
+  # Pages in an LRU with TTL, tag versions in a dict, both local to the process.
+  # The versions restart at 0 and differ between workers, so validators built
+  # from them include the token of this backend.
+  def __init__(self, ttl, maxsize):
+    self.pages = TTLCache(ttl, maxsize)
+    self.versions = {}
+    self.current = 0
+    self.token = uuid.uuid4().hex[:8]
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    return self.pages.get(key)
+
+  def set(self, key, value):
+    self.pages.set(key, value)
+
+  def epoch(self):
+    return self.current
+
+  def tag_versions(self, tags):
+    return [self.versions.get(tag, 0) for tag in tags]
+
+  def bump(self, tags):
+    with self.lock:
+      self.current += 1
+      for tag in tags:
+        self.versions[tag] = self.current
+
+  def clear(self):
+    with self.lock:
+      self.pages.clear()
+      self.versions.clear()
+      self.current = 0
+      self.token = uuid.uuid4().hex[:8]
+
+
+class RedisBackend:
+  # Pages and tag versions shared by every process through redis (optional dependency)
+  def __init__(self, url, ttl, prefix='fyyur:page:'):
+    import redis
+    self.client = redis.Redis.from_url(url)
+    self.ttl = ttl
+    self.prefix = prefix
+    # versions are shared, validators are the same in every worker
+    self.token = 'redis'
+
+  def get(self, key):
+    value = self.client.get(self.prefix + key)
+    return None if value is None else pickle.loads(value)
+
+  def set(self, key, value):
+    self.client.setex(self.prefix + key, self.ttl, pickle.dumps(value))
+
+  def epoch(self):
+    return int(self.client.get(self.prefix + 'epoch') or 0)
+
+  def tag_versions(self, tags):
+    if not tags:
+      return []
+    return [int(version or 0) for version in self.client.mget([self.prefix + 'tag:' + tag for tag in tags])]
+
+  def bump(self, tags):
+    current = self.client.incr(self.prefix + 'epoch')
+    pipeline = self.client.pipeline()
+    for tag in tags:
+      pipeline.set(self.prefix + 'tag:' + tag, current)
+    pipeline.execute()
+
+  def clear(self):
+    keys = list(self.client.scan_iter(self.prefix + '*'))
+    if keys:
+      self.client.delete(*keys)
+
+
+class PageCache:
+  def __init__(self):
+    self.backend = None
+    self.hits = 0
+    self.misses = 0
+    self.stores = 0
+    self.invalidations = 0
+
+  # PAGE_CACHE_URL selects a shared redis backend, the default is in-process
+  def init_app(self, app):
+    ttl = app.config.get('PAGE_CACHE_SECONDS', 300)
+    url = app.config.get('PAGE_CACHE_URL')
+    if url:
+      self.backend = RedisBackend(url, ttl)
+    else:
+      self.backend = MemoryBackend(ttl, app.config.get('PAGE_CACHE_SIZE', 1024))
+
+  def stats(self):
+    return {
+      'hits': self.hits,
+      'misses': self.misses,
+      'stores': self.stores,
+      'invalidations': self.invalidations
+    }
+
+  def clear(self):
+    if self.backend is not None:
+      self.backend.clear()
+    self.hits = self.misses = self.stores = self.invalidations = 0
+
+  def get(self, key):
+    entry = self.backend.get(key)
+    if entry is not None:
+      tags, versions, page = entry
+      if self.backend.tag_versions(tags) == versions:
+        self.hits += 1
+        return page
+    self.misses += 1
+    return None
+
+  # Stores a page rendered from data read after `epoch`, unless one of its
+  # tags was invalidated in the meantime
+  def set(self, key, page, tags, epoch):
+    tags = sorted(tags)
+    versions = self.backend.tag_versions(tags)
+    if any(version > epoch for version in versions):
+      return
+    self.backend.set(key, (tags, versions, page))
+    self.stores += 1
+
+  # Current versions of the tags, for other caches validating entries the same way (see facets.py)
+  def tag_versions(self, tags):
+    if self.backend is None:
+      return None
+    return self.backend.tag_versions(sorted(tags))
+
+  def invalidate(self, tags):
+    if self.backend is None or not tags:
+      return
+    self.backend.bump(tags)
+    self.invalidations += len(tags)
+
+  # Adds tags to the page being rendered, e.g. the venues listed on an artist page
+  def tag(self, *tags):
+    if 'page_cache_tags' in g:
+      g.page_cache_tags.update(tags)
+
+
+page_cache = PageCache()
+
+# Cached pages are shared by every session, so the CSRF tokens of their forms
+# are rendered as this placeholder and filled in on each response
+CSRF_PLACEHOLDER = '__page_csrf_token__'
+
+# csrf_token() of the templates
+def page_csrf_token():
+  if 'page_cache_tags' in g:
+    return CSRF_PLACEHOLDER
+  return generate_csrf()
+
+# Caches the HTML returned by a GET view, keyed by its path and query string.
+# Tags are formatted with the view arguments ('venue:{venue_id}'). Error
+# responses and pages carrying flashed messages are never cached.
+def cached_page(*tags):
+  def decorator(view):
+    @wraps(view)
+    def wrapper(**kwargs):
+      if page_cache.backend is None or flask.session.get('_flashes'):
+        return view(**kwargs)
+      key = request.full_path
+      # behind conditional_get, pages are also keyed by their validator, which
+      # changes with time-dependent content (shows starting) the tags don't follow
+      if g.get('page_validator'):
+        key += '#' + g.page_validator
+      page = page_cache.get(key)
+      if page is not None:
+        return page.replace(CSRF_PLACEHOLDER, generate_csrf())
+      epoch = page_cache.backend.epoch()
+      g.page_cache_tags = {tag.format(**kwargs) for tag in tags}
+      response = view(**kwargs)
+      if isinstance(response, str):
+        page_cache.set(key, response, g.page_cache_tags, epoch)
+        return response.replace(CSRF_PLACEHOLDER, generate_csrf())
+      return response
+    return wrapper
+  return decorator
+
+# Answers conditional GETs from validators(**view_args) -> (etag, last_modified),
+# which must be much cheaper than the view. A matching If-None-Match (or
+# If-Modified-Since, when there is a last_modified) gets a 304 without calling
+# the view; other responses are sent with ETag, Last-Modified and
+# Cache-Control: no-cache.
+def conditional_get(validators):
+  def decorator(view):
+    @wraps(view)
+    def wrapper(**kwargs):
+      if flask.session.get('_flashes'):
+        return view(**kwargs)
+      found = validators(**kwargs)
+      if found is None:
+        return view(**kwargs)
+      etag = hashlib.sha1(found[0].encode()).hexdigest()
+      g.page_validator = etag
+      last_modified = found[1].replace(microsecond=0) if found[1] else None
+      if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+      else:
+        since = request.if_modified_since
+        not_modified = since is not None and last_modified is not None and since.replace(tzinfo=None) >= last_modified
+      if not_modified:
+        response = flask.Response(status=304)
+      else:
+        response = flask.make_response(view(**kwargs))
+      response.set_etag(etag)
+      if last_modified is not None:
+        response.last_modified = last_modified
+      response.cache_control.no_cache = True
+      return response
+    return wrapper
+  return decorator
+
+#----------------------------------------------------------------------------#
+# Invalidation.
+# The tags touched by a flush are collected on the session and only bumped
+# once the transaction commits. Bulk Query.update()/delete() statements don't
+# go through the flush and must call page_cache.invalidate() themselves.
+#----------------------------------------------------------------------------#
+
+# Tags of the calendar buckets holding shows starting at these times
+def show_day_tags(start_times):
+  return {'shows:%s' % (value.date().isoformat() if isinstance(value, datetime) else str(value)[:10])
+          for value in start_times if value is not None}
+
+# Venue/artist changes drop the whole calendar ('calendar'): they change names,
+# cities, or remove shows through the ON DELETE CASCADE foreign keys
+def changed_tags(obj):
+  if isinstance(obj, Venue):
+    return {'venues', 'venue:%s' % obj.id, 'calendar'}
+  if isinstance(obj, Artist):
+    return {'artists', 'artist:%s' % obj.id, 'calendar'}
+  if isinstance(obj, Show):
+    # the current and, for moved shows, previous venue, artist and day;
+    # the venues listing carries the upcoming show counts
+    state = inspect(obj)
+    tags = {'venues', 'shows'}
+    for attribute, prefix in (('venue_id', 'venue:'), ('artist_id', 'artist:')):
+      history = state.attrs[attribute].history
+      values = list(history.added) + list(history.unchanged) + list(history.deleted)
+      tags.update(prefix + str(value) for value in values if value is not None)
+    history = state.attrs['start_time'].history
+    tags.update(show_day_tags(list(history.added) + list(history.unchanged) + list(history.deleted)))
+    return tags
+  return set()
+
+@event.listens_for(Session, 'after_flush')
+def collect_page_tags(session, flush_context):
+  tags = session.info.setdefault('page_cache_tags', set())
+  for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+    tags.update(changed_tags(obj))
+  # venues/artists that lost shows to a cascaded delete (see models.touch_updated_at)
+  for model, ids in session.info.pop('cascaded', {}).items():
+    tags.update('%s:%s' % ('venue' if model is Venue else 'artist', id) for id in ids)
+    if ids:
+      tags.add('shows')
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_page_tags(session):
+  page_cache.invalidate(session.info.pop('page_cache_tags', set()))
+
+@event.listens_for(Session, 'after_soft_rollback')
+def discard_page_tags(session, previous_transaction):
+  session.info.pop('page_cache_tags', None)
+  session.info.pop('cascaded', None)
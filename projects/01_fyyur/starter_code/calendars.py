@@ -0,0 +1,173 @@
+from datetime import date, datetime, timedelta
+from urllib.parse import urlencode
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import func
+from models import Venue, Artist, Show, db
+from cache import page_cache
+
+#----------------------------------------------------------------------------#
+# Shows calendar.
+# Shows between two dates are grouped in day, week (from Monday) or month
+# buckets, truncating start_time in the database (date_trunc on Postgres,
+# date() modifiers on SQLite). One query over the start_time index returns,
+# with window functions, the number of shows of every bucket and its first
+# shows. Each bucket is cached on its own, tagged with the days it covers,
+# so adding a show only drops the buckets of its day.
+#----------------------------------------------------------------------------#
+
+UNITS = {
+  'day': relativedelta(days=1),
+  'week': relativedelta(weeks=1),
+  'month': relativedelta(months=1),
+}
+
+# Range shown when the request has no `to`, in buckets of the unit
+DEFAULT_BUCKETS = {'day': 31, 'week': 12, 'month': 12}
+
+FILTERS = ('city', 'state', 'venue_id', 'artist_id')
+
+# First instant of the bucket containing `moment`
+def truncate(moment, unit):
+  moment = datetime(moment.year, moment.month, moment.day)
+  if unit == 'week':
+    return moment - timedelta(days=moment.weekday())
+  if unit == 'month':
+    return moment.replace(day=1)
+  return moment
+
+def bucket_column(unit):
+  if db.engine.dialect.name == 'postgresql':
+    return func.date_trunc(unit, Show.start_time)
+  if unit == 'week':
+    return func.date(Show.start_time, 'weekday 0', '-6 days')
+  if unit == 'month':
+    return func.date(Show.start_time, 'start of month')
+  return func.date(Show.start_time)
+
+# Buckets come back as timestamps from Postgres and as 'YYYY-MM-DD' strings from SQLite
+def as_datetime(value):
+  if isinstance(value, str):
+    value = datetime.fromisoformat(value)
+  if not isinstance(value, datetime):
+    value = datetime(value.year, value.month, value.day)
+  return value
+
+def parse_date(value):
+  try:
+    return datetime.fromisoformat(value)
+  except ValueError:
+    raise ValueError('dates must be in the YYYY-MM-DD format')
+
+# Returns (unit, start, end, filters) from the request arguments, raises ValueError when invalid
+def parse_calendar_args(args, max_buckets, today=None):
+  unit = args.get('unit', 'day')
+  if unit not in UNITS:
+    raise ValueError('unit must be one of ' + ', '.join(UNITS))
+  start = truncate(parse_date(args['from']) if args.get('from') else (today or date.today()), unit)
+  if args.get('to'):
+    end = truncate(parse_date(args['to']) - timedelta(microseconds=1), unit) + UNITS[unit]
+  else:
+    end = start + UNITS[unit] * DEFAULT_BUCKETS[unit]
+  if end <= start:
+    raise ValueError('to must be after from')
+  if len(bucket_starts(unit, start, end)) > max_buckets:
+    raise ValueError('at most %d buckets can be requested' % max_buckets)
+  filters = {}
+  for name in FILTERS:
+    value = args.get(name)
+    if value in (None, ''):
+      continue
+    filters[name] = int(value) if name.endswith('_id') else value
+  return unit, start, end, filters
+
+def bucket_starts(unit, start, end):
+  starts = []
+  moment = start
+  while moment < end:
+    starts.append(moment)
+    moment += UNITS[unit]
+  return starts
+
+def conditions(filters):
+  conditions = []
+  if 'city' in filters:
+    conditions.append(Venue.city == filters['city'])
+  if 'state' in filters:
+    conditions.append(Venue.state == filters['state'])
+  if 'venue_id' in filters:
+    conditions.append(Show.venue_id == filters['venue_id'])
+  if 'artist_id' in filters:
+    conditions.append(Show.artist_id == filters['artist_id'])
+  return conditions
+
+# {bucket start: (count, first `limit` shows)} for the buckets having shows between start and end
+def bucket_rows(unit, start, end, filters, limit):
+  bucket = bucket_column(unit)
+  ranked = db.session.query(
+      Show.id,
+      Show.start_time,
+      Venue.id.label('venue_id'),
+      Venue.name.label('venue_name'),
+      Artist.id.label('artist_id'),
+      Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link'),
+      bucket.label('bucket'),
+      func.row_number().over(partition_by=bucket, order_by=(Show.start_time, Show.id)).label('position'),
+      func.count().over(partition_by=bucket).label('total')
+    ).join(Venue, Show.venue_id == Venue.id) \
+    .join(Artist, Show.artist_id == Artist.id) \
+    .filter(Show.start_time >= start, Show.start_time < end, *conditions(filters)) \
+    .subquery()
+  # the first row of every bucket is kept for its count, even when no show is asked for
+  rows = db.session.query(ranked) \
+    .filter(ranked.c.position <= max(limit, 1)) \
+    .order_by(ranked.c.bucket, ranked.c.position) \
+    .all()
+  buckets = {}
+  for row in rows:
+    count, shows = buckets.setdefault(as_datetime(row.bucket), (row.total, []))
+    if len(shows) < limit:
+      shows.append({
+        'id': row.id,
+        'start_time': row.start_time.isoformat(),
+        'venue_id': row.venue_id,
+        'venue_name': row.venue_name,
+        'artist_id': row.artist_id,
+        'artist_name': row.artist_name,
+        'artist_image_link': row.artist_image_link,
+      })
+  return buckets
+
+# Tags of the shows starting on each day of a bucket, see cache.show_day_tags
+def bucket_tags(unit, start):
+  end = start + UNITS[unit]
+  return ['calendar'] + ['shows:%s' % (start + timedelta(days=i)).date().isoformat() for i in range((end - start).days)]
+
+def bucket_key(unit, start, filters, limit):
+  return 'calendar:%s:%s:%d?%s' % (unit, start.date().isoformat(), limit, urlencode(sorted(filters.items())))
+
+# The buckets between start and end, each with its count and first `limit` shows.
+# Cached buckets are reused, the others are read with one query spanning them.
+def show_calendar(unit, start, end, filters, limit):
+  starts = bucket_starts(unit, start, end)
+  cached = {}
+  if page_cache.backend is not None:
+    for bucket in starts:
+      entry = page_cache.get(bucket_key(unit, bucket, filters, limit))
+      if entry is not None:
+        cached[bucket] = entry
+  missing = [bucket for bucket in starts if bucket not in cached]
+  if missing:
+    epoch = page_cache.backend.epoch() if page_cache.backend is not None else None
+    rows = bucket_rows(unit, missing[0], missing[-1] + UNITS[unit], filters, limit)
+    for bucket in missing:
+      count, shows = rows.get(bucket, (0, []))
+      cached[bucket] = {
+        'start': bucket.isoformat(),
+        'end': (bucket + UNITS[unit]).isoformat(),
+        'count': count,
+        'shows': shows,
+      }
+      if epoch is not None:
+        page_cache.set(bucket_key(unit, bucket, filters, limit), cached[bucket], bucket_tags(unit, bucket), epoch)
+  return [cached[bucket] for bucket in starts]
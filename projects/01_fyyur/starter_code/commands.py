@@ -0,0 +1,121 @@
+import sys
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from importer import Importer, read_rows, MAX_REPORTED_ERRORS
+from generator import Generator
+from exporter import EXPORT_KINDS, EXPORT_FORMATS, export_batches, iter_csv, iter_jsonl, write_parquet, next_since
+from partitions import is_partitioned, maintain_partitions, partition_sizes
+
+#----------------------------------------------------------------------------#
+# Commands.
+# Registered on the app as `flask fyyur ...`.
+#----------------------------------------------------------------------------#
+
+fyyur_cli = AppGroup('fyyur', help='Fyyur maintenance commands.')
+
+@fyyur_cli.command('import')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--batch-size', default=10000, show_default=True, help='Rows written per transaction.')
+def import_command(kind, path, format, batch_size):
+  """Bulk load venues, artists or shows from a CSV or JSON lines file.
+
+  Shows reference their venue and artist by venue_name/artist_name (or
+  venue_id/artist_id). Genres are comma separated in CSV files.
+  """
+  def report(imported, elapsed):
+    click.echo('%d %s imported, %.0f rows/s' % (imported, kind, imported / elapsed if elapsed else 0))
+
+  importer = Importer(kind, batch_size=batch_size, report=report)
+  elapsed = importer.run(read_rows(path, format))
+  for number, errors in importer.errors:
+    click.echo('row %d skipped: %s' % (number, '; '.join(errors)), err=True)
+  if importer.skipped > MAX_REPORTED_ERRORS:
+    click.echo('... %d more rows skipped' % (importer.skipped - MAX_REPORTED_ERRORS), err=True)
+  click.echo('imported %d %s in %.1fs (%.0f rows/s), %d rows skipped' % (
+    importer.imported, kind, elapsed, importer.imported / elapsed if elapsed else 0, importer.skipped
+  ))
+
+@fyyur_cli.command('export')
+@click.argument('kind', type=click.Choice(EXPORT_KINDS))
+@click.option('--format', type=click.Choice(EXPORT_FORMATS), default='csv', show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), help='Defaults to stdout (csv and jsonl only).')
+@click.option('--since', type=click.DateTime(), help='Only rows changed or deleted after this UTC time.')
+def export_command(kind, format, output, since):
+  """Stream venues, artists or shows to a CSV, JSON lines or Parquet file.
+
+  The `--since` to pass to the next incremental export is printed on stderr.
+  Incremental exports have an op column: upsert, or delete for the ids of
+  the rows deleted since then.
+  """
+  started = datetime.utcnow()
+  rows = 0
+  def counted(batches):
+    nonlocal rows
+    for batch in batches:
+      rows += len(batch)
+      yield batch
+
+  batches = counted(export_batches(kind, since))
+  if format == 'parquet':
+    if output is None:
+      raise click.UsageError('Parquet exports need --output')
+    write_parquet(kind, batches, output, incremental=since is not None)
+  else:
+    chunks = iter_csv(kind, batches, incremental=since is not None) if format == 'csv' else iter_jsonl(kind, batches)
+    file = open(output, 'w', newline='') if output else sys.stdout
+    try:
+      for chunk in chunks:
+        file.write(chunk)
+    finally:
+      if output:
+        file.close()
+  click.echo('exported %d %s in %.1fs, next --since %s' % (
+    rows, kind, (datetime.utcnow() - started).total_seconds(), next_since(started).isoformat(timespec='seconds')
+  ), err=True)
+
+@fyyur_cli.command('generate')
+@click.option('--venues', default=1000, show_default=True)
+@click.option('--artists', default=1000, show_default=True)
+@click.option('--shows', default=10000, show_default=True)
+@click.option('--seed', default=42, show_default=True)
+@click.option('--anchor', type=click.DateTime(['%Y-%m-%d']), help='Date the shows are spread around, defaults to today.')
+def generate_command(venues, artists, shows, seed, anchor):
+  """Load a deterministic synthetic dataset (see generator.py).
+
+  Shows dated in an archived range (see `partitions`) are skipped.
+  """
+  generator = Generator(seed=seed, anchor=anchor)
+  for kind, rows in (
+    ('venues', generator.venues(venues)),
+    ('artists', generator.artists(artists)),
+    ('shows', generator.shows(shows, venues, artists)),
+  ):
+    importer = Importer(kind)
+    elapsed = importer.run(rows)
+    click.echo('generated %d %s in %.1fs, %d rows skipped' % (importer.imported, kind, elapsed, importer.skipped))
+
+@fyyur_cli.command('partitions')
+@click.option('--ahead', type=int, help='Months to keep partitions ready for, defaults to SHOW_PARTITION_MONTHS_AHEAD.')
+@click.option('--archive-before', type=click.DateTime(['%Y-%m-%d']),
+              help='Detach the partitions ending before this date to the archive schema.')
+@click.option('--dry-run', is_flag=True, help='Only print what would be done.')
+def partitions_command(ahead, archive_before, dry_run):
+  """Create the coming monthly shows partitions and archive old ones (Postgres).
+
+  Archived shows are no longer listed on the venue and artist pages, and
+  new shows dated in the archived range are refused.
+  Run it at least monthly, e.g. from cron.
+  """
+  if not is_partitioned():
+    raise click.ClickException('shows is not a partitioned table, see migration a7c3e91d5b02')
+  if ahead is None:
+    ahead = current_app.config['SHOW_PARTITION_MONTHS_AHEAD']
+  for action in maintain_partitions(ahead, archive_before, dry_run=dry_run):
+    click.echo(('would ' if dry_run else '') + action)
+  for name, start, end, rows in partition_sizes():
+    click.echo('%-16s %-10s %-10s ~%d rows' % (
+      name, start.date().isoformat() if start else '-', end.date().isoformat() if end else '-', rows))
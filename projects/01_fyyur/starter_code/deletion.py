@@ -0,0 +1,134 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import func
+from models import Venue, Artist, Show, db, log_deleted_shows
+from cache import page_cache, show_day_tags
+
+#----------------------------------------------------------------------------#
+# Deletion.
+# A venue or artist is deleted with one DELETE statement, its shows going with
+# the ON DELETE CASCADE foreign keys without being loaded. When it has more
+# than BACKGROUND_DELETE_SHOWS shows the cascade would hold its locks for a
+# long time, so a background worker first deletes the shows in transactions
+# of DELETE_BATCH_SIZE rows, then the venue/artist itself. Background deletes
+# run on a pool of BACKGROUND_DELETE_WORKERS threads, at most
+# BACKGROUND_DELETE_PENDING at a time, and a venue/artist already being
+# deleted isn't deleted twice.
+#----------------------------------------------------------------------------#
+
+# (foreign key of the model in shows, foreign key of the other side, other model)
+SHOW_SIDES = {
+  Venue: (Show.venue_id, Show.artist_id, Artist),
+  Artist: (Show.artist_id, Show.venue_id, Venue),
+}
+
+def tag_prefix(model):
+  return 'venue:' if model is Venue else 'artist:'
+
+# Whether the venue/artist has more than `limit` shows, counting at most limit + 1
+def has_more_shows_than(model, id, limit):
+  fk_column = SHOW_SIDES[model][0]
+  first = db.session.query(Show.id).filter(fk_column == id).limit(limit + 1).subquery()
+  return db.session.query(func.count()).select_from(first).scalar() > limit
+
+class BackgroundDeletes:
+  def __init__(self):
+    self.executor = None
+    self.in_flight = set()
+    self.lock = threading.Lock()
+
+  # Queues the delete, unless the same venue/artist is already queued or
+  # being deleted. Raises RuntimeError when `pending` deletes are waiting.
+  def submit(self, app, model, id):
+    config = app.config
+    key = (model, id)
+    with self.lock:
+      if key in self.in_flight:
+        return
+      if len(self.in_flight) >= config['BACKGROUND_DELETE_PENDING']:
+        raise RuntimeError('too many deletes in progress, %s %s was not deleted' % (model.__name__, id))
+      if self.executor is None:
+        self.executor = ThreadPoolExecutor(max_workers=config['BACKGROUND_DELETE_WORKERS'],
+                                           thread_name_prefix='fyyur-delete')
+      self.in_flight.add(key)
+    try:
+      self.executor.submit(self.run, app, model, id, config['DELETE_BATCH_SIZE'])
+    except Exception:
+      self.done(key)
+      raise
+
+  def run(self, app, model, id, batch_size):
+    try:
+      delete_in_background(app, model, id, batch_size)
+    finally:
+      self.done((model, id))
+
+  def done(self, key):
+    with self.lock:
+      self.in_flight.discard(key)
+
+  def is_deleting(self, model, id):
+    with self.lock:
+      return (model, id) in self.in_flight
+
+
+background_deletes = BackgroundDeletes()
+
+# Deletes the venue/artist, in the background when its history is large.
+# Returns True when the delete was handed (or had already been handed) to
+# the background workers.
+def delete_record(model, id):
+  id = int(id)
+  if background_deletes.is_deleting(model, id):
+    return True
+  record = model.query.get(id)
+  if record is None:
+    raise LookupError('%s %s does not exist' % (model.__name__, id))
+  config = current_app.config
+  if has_more_shows_than(model, record.id, config['BACKGROUND_DELETE_SHOWS']):
+    background_deletes.submit(current_app._get_current_object(), model, record.id)
+    return True
+  db.session.delete(record)
+  db.session.commit()
+  return False
+
+# Failures are logged with their traceback, the shows already deleted stay deleted
+def delete_in_background(app, model, id, batch_size):
+  with app.app_context():
+    try:
+      deleted = delete_shows_in_batches(model, id, batch_size)
+      record = model.query.get(id)
+      if record is not None:
+        db.session.delete(record)
+        db.session.commit()
+      app.logger.info('deleted %s %s and its %d shows', model.__name__, id, deleted)
+    except Exception:
+      db.session.rollback()
+      app.logger.exception('could not delete %s %s', model.__name__, id)
+    finally:
+      db.session.remove()
+
+# Deletes the shows of a venue/artist `batch_size` at a time, one transaction
+# per batch. Bulk deletes skip the session events, so each batch logs its
+# shows as deleted, touches updated_at and invalidates the pages of both
+# sides itself.
+def delete_shows_in_batches(model, id, batch_size):
+  fk_column, other_column, other = SHOW_SIDES[model]
+  deleted = 0
+  while True:
+    rows = db.session.query(Show.id, other_column, Show.start_time).filter(fk_column == id).limit(batch_size).all()
+    if not rows:
+      return deleted
+    other_ids = sorted({row[1] for row in rows})
+    now = datetime.utcnow()
+    show_ids = Show.id.in_([row[0] for row in rows])
+    log_deleted_shows(db.session.connection(), show_ids, now)
+    Show.query.filter(show_ids).delete(synchronize_session=False)
+    model.query.filter(model.id == id).update({model.updated_at: now}, synchronize_session=False)
+    other.query.filter(other.id.in_(other_ids)).update({other.updated_at: now}, synchronize_session=False)
+    db.session.commit()
+    page_cache.invalidate(['venues', 'shows', tag_prefix(model) + str(id)] + [tag_prefix(other) + str(other_id) for other_id in other_ids]
+                          + sorted(show_day_tags(row[2] for row in rows)))
+    deleted += len(rows)
@@ -0,0 +1,183 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from models import Venue, Artist, Show, Genre, Deletion, venue_genres, artist_genres, db
+
+#----------------------------------------------------------------------------#
+# Bulk export.
+# Rows are read through a server-side cursor (stream_results + yield_per) and
+# written out as they arrive, so memory stays constant whatever the size of
+# the catalog. With `since`, only the venues/artists updated after that time
+# are exported, and for shows all the shows of those venues (a venue's
+# updated_at is bumped whenever one of its shows is added or removed, so a
+# consumer can replace the shows it holds for each exported venue).
+# Incremental exports carry an `op` field: 'upsert' for those rows, then
+# 'delete' with the id of each row deleted after `since`, read from the
+# deletions log (shows removed along with their venue/artist included).
+#----------------------------------------------------------------------------#
+
+# Rows fetched from the database at a time
+EXPORT_BATCH_SIZE = 1000
+
+# The next `since` is taken this long before the export started, so rows
+# committed while it ran are exported again rather than missed
+EXPORT_OVERLAP = timedelta(minutes=5)
+
+ENTITY_COLUMNS = {
+  'venues': [
+    'id', 'name', 'address', 'city', 'state', 'phone', 'website', 'facebook_link',
+    'seeking_talent', 'seeking_description', 'image_link', 'created_at', 'updated_at'
+  ],
+  'artists': [
+    'id', 'name', 'city', 'state', 'phone', 'website', 'facebook_link',
+    'seeking_venues', 'seeking_description', 'image_link', 'created_at', 'updated_at'
+  ],
+}
+
+SHOW_COLUMNS = ['id', 'venue_id', 'artist_id', 'start_time']
+
+EXPORT_KINDS = ('venues', 'artists', 'shows')
+EXPORT_FORMATS = ('csv', 'jsonl', 'parquet')
+
+def export_columns(kind, incremental=False):
+  columns = SHOW_COLUMNS if kind == 'shows' else ENTITY_COLUMNS[kind] + ['genres']
+  return ['op'] + columns if incremental else columns
+
+def stream(query, batch_size):
+  return query.order_by(None).execution_options(stream_results=True).yield_per(batch_size)
+
+# Yields lists of up to batch_size rows (dicts) of the given kind, ordered by
+# id; with `since`, the changed rows then the deleted ones, marked by `op`
+def export_batches(kind, since=None, batch_size=EXPORT_BATCH_SIZE):
+  if since is None:
+    yield from changed_batches(kind, since, batch_size)
+    return
+  for batch in changed_batches(kind, since, batch_size):
+    for row in batch:
+      row['op'] = 'upsert'
+    yield batch
+  yield from deleted_batches(kind, since, batch_size)
+
+# Ids of the rows of this kind deleted after `since`, as {'op': 'delete', 'id': id}
+def deleted_batches(kind, since, batch_size):
+  query = db.session.query(Deletion.record_id) \
+    .filter(Deletion.kind == kind, Deletion.deleted_at > since)
+  batch = []
+  for record_id, in stream(query.order_by(Deletion.id), batch_size):
+    batch.append({'op': 'delete', 'id': record_id})
+    if len(batch) == batch_size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+def changed_batches(kind, since, batch_size):
+  if kind == 'shows':
+    query = db.session.query(*[getattr(Show, column) for column in SHOW_COLUMNS])
+    if since is not None:
+      query = query.filter(Show.venue_id.in_(db.session.query(Venue.id).filter(Venue.updated_at > since)))
+    batch = []
+    for row in stream(query.order_by(Show.id), batch_size):
+      batch.append(row._asdict())
+      if len(batch) == batch_size:
+        yield batch
+        batch = []
+    if batch:
+      yield batch
+    return
+
+  model, link_table, link_column = {
+    'venues': (Venue, venue_genres, venue_genres.c.venue_id),
+    'artists': (Artist, artist_genres, artist_genres.c.artist_id),
+  }[kind]
+  query = db.session.query(*[getattr(model, column) for column in ENTITY_COLUMNS[kind]])
+  if since is not None:
+    query = query.filter(model.updated_at > since)
+  batch = []
+  for row in stream(query.order_by(model.id), batch_size):
+    batch.append(row._asdict())
+    if len(batch) == batch_size:
+      yield add_genres(batch, link_table, link_column)
+      batch = []
+  if batch:
+    yield add_genres(batch, link_table, link_column)
+
+# Fills the genres of a batch of venues/artists with one query
+def add_genres(batch, link_table, link_column):
+  genres = {}
+  rows = db.session.query(link_column, Genre.name) \
+    .join(Genre, Genre.id == link_table.c.genre_id) \
+    .filter(link_column.in_([row['id'] for row in batch])) \
+    .order_by(Genre.name)
+  for id, name in rows:
+    genres.setdefault(id, []).append(name)
+  for row in batch:
+    row['genres'] = genres.get(row['id'], [])
+  return batch
+
+def plain(value):
+  return value.isoformat() if isinstance(value, datetime) else value
+
+#----------------------------------------------------------------------------#
+# Formats.
+# csv and jsonl are produced as text chunks, one per batch, and can be
+# streamed over HTTP. Parquet (pyarrow, optional) is written to a file with
+# one row group per batch.
+#----------------------------------------------------------------------------#
+
+# Deleted rows only fill the op and id columns of incremental exports
+def iter_csv(kind, batches, incremental=False):
+  columns = export_columns(kind, incremental)
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  writer.writerow(columns)
+  for batch in batches:
+    for row in batch:
+      writer.writerow([
+        ','.join(row[column]) if column == 'genres' and column in row else plain(row.get(column))
+        for column in columns
+      ])
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+  if buffer.tell():
+    yield buffer.getvalue()
+
+def iter_jsonl(kind, batches):
+  for batch in batches:
+    yield ''.join(json.dumps({column: plain(value) for column, value in row.items()}) + '\n' for row in batch)
+
+# Parquet schema of an export, from the column types rather than the first
+# batch, in which a nullable column may only hold None
+def parquet_schema(kind, incremental=False):
+  import pyarrow
+  types = {int: pyarrow.int64(), str: pyarrow.string(), bool: pyarrow.bool_(), datetime: pyarrow.timestamp('us')}
+  table = {'venues': Venue, 'artists': Artist, 'shows': Show}[kind].__table__
+  fields = []
+  for column in export_columns(kind, incremental):
+    if column == 'op':
+      fields.append(pyarrow.field('op', pyarrow.string()))
+    elif column == 'genres':
+      fields.append(pyarrow.field('genres', pyarrow.list_(pyarrow.string())))
+    else:
+      fields.append(pyarrow.field(column, types[table.c[column].type.python_type]))
+  return pyarrow.schema(fields)
+
+def write_parquet(kind, batches, path, incremental=False):
+  try:
+    import pyarrow
+    import pyarrow.parquet
+  except ImportError:
+    raise RuntimeError('Parquet exports need pyarrow (pip install pyarrow)')
+  schema = parquet_schema(kind, incremental)
+  writer = pyarrow.parquet.ParquetWriter(path, schema)
+  try:
+    for batch in batches:
+      writer.write_table(pyarrow.Table.from_pylist(batch, schema=schema))
+  finally:
+    writer.close()
+
+# Start of the export, minus EXPORT_OVERLAP: the `since` of the next incremental export
+def next_since(started):
+  return started - EXPORT_OVERLAP
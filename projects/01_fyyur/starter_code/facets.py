@@ -0,0 +1,170 @@
+from datetime import datetime
+from sqlalchemy import and_, exists, func, literal, select, tuple_, union_all
+from cache import TTLCache, page_cache
+from models import Venue, Artist, Show, Genre, venue_genres, artist_genres, db
+
+#----------------------------------------------------------------------------#
+# Faceted browse.
+# A browse returns one page of the filtered venues/artists plus, for each
+# facet, the number of matching entities per value. All the facet counts
+# come from a single GROUPING SETS query (a UNION ALL of GROUP BYs on
+# databases without grouping sets) and are cached for a few seconds. Cached
+# counts carry the page cache versions of the tags they depend on, and are
+# dropped as soon as a commit bumps one of them, like the rendered pages.
+#----------------------------------------------------------------------------#
+
+# Facet counts are served from memory for at most this many seconds; the
+# has_upcoming_shows counts drift as shows start
+COUNTS_CACHE_SECONDS = 30
+
+FACETS = ('city', 'state', 'genre', 'seeking', 'has_upcoming_shows')
+BOOLEAN_FACETS = ('seeking', 'has_upcoming_shows')
+
+def parse_bool(value):
+  return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+
+class FacetedBrowse:
+  def __init__(self, model, link_column, show_fk, seeking_column, tags):
+    self.model = model
+    # page cache tags whose invalidation drops the cached counts
+    self.tags = tags
+    self.link_column = link_column
+    self.show_fk = show_fk
+    self.seeking_column = seeking_column
+    self.counts_cache = TTLCache(COUNTS_CACHE_SECONDS)
+
+  # Name of the seeking facet as exposed to clients (seeking_talent / seeking_venues)
+  @property
+  def seeking_name(self):
+    return self.seeking_column.key
+
+  # Reads the facet filters from request arguments, ignoring unknown or empty ones
+  def parse_filters(self, args):
+    filters = {}
+    for facet in FACETS:
+      name = self.seeking_name if facet == 'seeking' else facet
+      value = args.get(name)
+      if value in (None, ''):
+        continue
+      filters[facet] = parse_bool(value) if facet in BOOLEAN_FACETS else value
+    return filters
+
+  def conditions(self, filters, now):
+    model = self.model
+    has_upcoming = self.has_upcoming(now)
+    conditions = []
+    if 'city' in filters:
+      conditions.append(model.city == filters['city'])
+    if 'state' in filters:
+      conditions.append(model.state == filters['state'])
+    if 'genre' in filters:
+      conditions.append(model.id.in_(
+        select([self.link_column])
+          .select_from(self.link_column.table.join(Genre, Genre.id == self.link_column.table.c.genre_id))
+          .where(Genre.name == filters['genre'])
+      ))
+    if 'seeking' in filters:
+      conditions.append(self.seeking_column == filters['seeking'])
+    if 'has_upcoming_shows' in filters:
+      conditions.append(has_upcoming if filters['has_upcoming_shows'] else ~has_upcoming)
+    return conditions
+
+  def has_upcoming(self, now):
+    return exists().where(and_(self.show_fk == self.model.id, Show.start_time > now))
+
+  # One row per (entity, genre) with every facet value as a column
+  def facts(self, filters, now):
+    model = self.model
+    link_table = self.link_column.table
+    return db.session.query(
+        model.id.label('id'),
+        model.city.label('city'),
+        model.state.label('state'),
+        Genre.name.label('genre'),
+        self.seeking_column.label('seeking'),
+        self.has_upcoming(now).label('has_upcoming_shows')
+      ).outerjoin(link_table, self.link_column == model.id) \
+      .outerjoin(Genre, Genre.id == link_table.c.genre_id) \
+      .filter(*self.conditions(filters, now)) \
+      .subquery()
+
+  # Returns (total, {facet: {value: count}}) for the filtered entities
+  def counts(self, filters, now=None):
+    key = tuple(sorted(filters.items()))
+    # read before counting, so a commit racing the query makes the entry stale
+    versions = page_cache.tag_versions(self.tags)
+    cached = self.counts_cache.get(key)
+    if cached is not None and cached[0] == versions:
+      return cached[1]
+    if now is None:
+      now = datetime.now()
+    facts = self.facts(filters, now)
+    entities = func.count(facts.c.id.distinct())
+    if db.engine.dialect.name == 'postgresql':
+      rows = self.grouping_sets_rows(facts, entities)
+    else:
+      rows = self.union_rows(facts, entities)
+
+    total = 0
+    facets = {facet: {} for facet in FACETS}
+    for facet, value, count in rows:
+      if facet is None:
+        total = count
+      elif value is not None:
+        if facet in BOOLEAN_FACETS:
+          value = 'true' if value else 'false'
+        facets[facet][value] = count
+    facets[self.seeking_name] = facets.pop('seeking')
+    result = (total, facets)
+    self.counts_cache.set(key, (versions, result))
+    return result
+
+  # GROUP BY GROUPING SETS ((city), (state), (genre), (seeking), (has_upcoming_shows), ())
+  def grouping_sets_rows(self, facts, entities):
+    columns = [facts.c[facet] for facet in FACETS]
+    groupings = [func.grouping(column) for column in columns]
+    query = select(columns + groupings + [entities]) \
+      .group_by(func.grouping_sets(*[tuple_(column) for column in columns] + [tuple_()]))
+    rows = []
+    for row in db.session.execute(query):
+      grouped = [facet for facet, grouping in zip(FACETS, row[len(FACETS):-1]) if grouping == 0]
+      if grouped:
+        rows.append((grouped[0], row[grouped[0]], row[-1]))
+      else:
+        rows.append((None, None, row[-1]))
+    return rows
+
+  # Same counts as grouping_sets_rows, as a UNION ALL of one GROUP BY per facet
+  def union_rows(self, facts, entities):
+    branches = [
+      select([literal(facet).label('facet'), facts.c[facet].label('value'), entities.label('count')])
+        .group_by(facts.c[facet])
+      for facet in FACETS
+    ]
+    branches.append(select([literal(None).label('facet'), literal(None).label('value'), entities.label('count')]))
+    return [tuple(row) for row in db.session.execute(union_all(*branches))]
+
+  # The filtered page, ordered by name, with the facet counts
+  def browse(self, filters, page=1, limit=20, now=None):
+    if now is None:
+      now = datetime.now()
+    model = self.model
+    page = max(page, 1)
+    rows = db.session.query(model.id, model.name, model.city, model.state) \
+      .filter(*self.conditions(filters, now)) \
+      .order_by(model.name, model.id) \
+      .limit(limit) \
+      .offset((page - 1) * limit) \
+      .all()
+    total, facets = self.counts(filters, now)
+    return {
+      'total': total,
+      'page': page,
+      'data': [{'id': row.id, 'name': row.name, 'city': row.city, 'state': row.state} for row in rows],
+      'facets': facets
+    }
+
+
+venue_facets = FacetedBrowse(Venue, venue_genres.c.venue_id, Show.venue_id, Venue.seeking_talent, ['venues', 'shows'])
+artist_facets = FacetedBrowse(Artist, artist_genres.c.artist_id, Show.artist_id, Artist.seeking_venues, ['artists', 'shows'])
@@ -0,0 +1,46 @@
+from datetime import datetime
+from functools import lru_cache
+import babel
+import babel.dates
+import dateutil.parser
+
+#----------------------------------------------------------------------------#
+# Date formatting for the templates.
+# Show pages format the same few timestamps over and over, so the babel
+# patterns and locales are resolved once and formatted values are memoized.
+#----------------------------------------------------------------------------#
+
+PATTERNS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+# Number of distinct (value, format, locale) results kept in memory
+FORMATTED_CACHE_SIZE = 50000
+
+@lru_cache(maxsize=None)
+def get_locale(name):
+  return babel.Locale.parse(name)
+
+@lru_cache(maxsize=None)
+def get_pattern(format):
+  return babel.dates.parse_pattern(PATTERNS.get(format, format))
+
+@lru_cache(maxsize=FORMATTED_CACHE_SIZE)
+def format_datetime(value, format='medium', locale='en'):
+  # datetime objects are formatted directly, strings are still accepted
+  if not isinstance(value, datetime):
+    value = dateutil.parser.parse(value)
+  if value.tzinfo is None:
+    value = value.replace(tzinfo=babel.dates.UTC)
+  return get_pattern(format).apply(value, get_locale(locale))
+
+#----------------------------------------------------------------------------#
+# Phone numbers.
+#----------------------------------------------------------------------------#
+
+def format_phone(phone):
+  phone=phone.replace('-','')
+  if(len(phone)==10):
+    phone = phone[:3] +'-' +phone[3:6]+'-'+phone[6:]
+  return phone
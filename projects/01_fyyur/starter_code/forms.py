@@ -5,6 +5,7 @@ from wtforms.validators import DataRequired, URL,ValidationError
 from wtforms.widgets.html5 import NumberInput,DateTimeLocalInput,TelInput,URLInput
 from wtforms.fields.html5 import TelField
 from constants import state_choices , genre_choices
+from models import Venue, Artist, db
 
 def validate_phone_number(form,phone):
     if(len(str(phone.data))):
@@ -16,12 +17,23 @@ def validate_phone_number(form,phone):
         except:
             raise ValidationError('Invalid phone number, please enter a 10 digits phone number')
 
+# Checks the submitted id through the primary key instead of a preloaded choices list
+def record_exists(model, message):
+    def validate(form, field):
+        if field.data is None or not db.session.query(model.query.filter(model.id == field.data).exists()).scalar():
+            raise ValidationError(message)
+    return validate
+
+# Carries the CSRF token of the delete buttons
+class DeleteForm(FlaskForm):
+    pass
+
 class ShowForm(FlaskForm):
-    artist_id = SelectField(
-        'artist_id', validators=[DataRequired()]
+    artist_id = IntegerField(
+        'artist_id', validators=[DataRequired(), record_exists(Artist, 'There is no artist with this id')]
     )
-    venue_id = SelectField(
-        'venue_id', validators=[DataRequired()]
+    venue_id = IntegerField(
+        'venue_id', validators=[DataRequired(), record_exists(Venue, 'There is no venue with this id')]
     )
     start_time = DateTimeField(
         'start_time',
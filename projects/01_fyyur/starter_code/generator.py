@@ -0,0 +1,110 @@
+import itertools
+import random
+from datetime import datetime, timedelta
+
+#----------------------------------------------------------------------------#
+# Synthetic data.
+# Deterministic venues, artists and shows for benchmarks: the same seed and
+# anchor date always give the same rows. Cities, genres, venues and artists
+# follow skewed (Zipf-like) popularities, and shows fall on evenings, more
+# often on weekends, over the two years before and the year after the anchor.
+# Rows are in the format read by importer.Importer, which skips the shows
+# dated in an archived range of the partitioned table.
+#----------------------------------------------------------------------------#
+
+# (city, state, weight), roughly by size of the live music scene
+CITIES = [
+  ('New York', 'NY', 20), ('Los Angeles', 'CA', 14), ('Chicago', 'IL', 9), ('San Francisco', 'CA', 8),
+  ('Nashville', 'TN', 7), ('Austin', 'TX', 6), ('Seattle', 'WA', 6), ('Houston', 'TX', 5),
+  ('Philadelphia', 'PA', 5), ('New Orleans', 'LA', 5), ('Boston', 'MA', 5), ('Atlanta', 'GA', 5),
+  ('Phoenix', 'AZ', 4), ('San Diego', 'CA', 4), ('Dallas', 'TX', 4), ('Denver', 'CO', 4),
+  ('Portland', 'OR', 4), ('Miami', 'FL', 4), ('Detroit', 'MI', 3), ('Minneapolis', 'MN', 3),
+]
+
+# Genres from the most to the least common
+GENRES = [
+  'Rock n Roll', 'Pop', 'Hip-Hop', 'Alternative', 'Jazz', 'Electronic', 'Country', 'R&B', 'Folk',
+  'Blues', 'Soul', 'Punk', 'Heavy Metal', 'Funk', 'Reggae', 'Classical', 'Instrumental',
+  'Musical Theatre', 'Other',
+]
+
+VENUE_WORDS = ['The', 'Blue', 'Velvet', 'Musical', 'Red', 'Golden', 'Old', 'Electric', 'Silver', 'Rusty']
+VENUE_NOUNS = ['Hop', 'Room', 'Lounge', 'Hall', 'Club', 'Garden', 'Theatre', 'Tavern', 'Arena', 'Cellar']
+ARTIST_WORDS = ['Guns', 'Matt', 'Wild', 'Sad', 'Lost', 'Neon', 'Quiet', 'Young', 'Midnight', 'Paper']
+ARTIST_NOUNS = ['Petty', 'Quevedo', 'Sax Band', 'Kids', 'Wolves', 'Lights', 'Riot', 'Ghosts', 'Echo', 'Trio']
+STREETS = ['Main St', 'Market St', 'Broadway', 'Valencia St', 'Elm St', 'Sunset Blvd', 'Congress Ave']
+
+# Shows are spread from this many days before the anchor to SHOWS_DAYS_AFTER after it
+SHOWS_DAYS_BEFORE = 730
+SHOWS_DAYS_AFTER = 365
+
+def zipf_weights(count, exponent=1.0):
+  return list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(count)))
+
+def slug(name):
+  return ''.join(char if char.isalnum() else '-' for char in name.lower())
+
+
+class Generator:
+  def __init__(self, seed=42, anchor=None):
+    self.seed = seed
+    self.anchor = anchor or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    self.city_weights = list(itertools.accumulate(city[2] for city in CITIES))
+    self.genre_weights = zipf_weights(len(GENRES))
+
+  # A fresh random source per kind of rows, so venues don't change with the number of artists
+  def random(self, kind):
+    return random.Random('%s-%s' % (self.seed, kind))
+
+  def genres(self, generator):
+    picked = generator.choices(GENRES, cum_weights=self.genre_weights, k=generator.randint(1, 3))
+    return list(dict.fromkeys(picked))
+
+  def entity(self, generator, name):
+    city, state, _ = generator.choices(CITIES, cum_weights=self.city_weights)[0]
+    return {
+      'name': name,
+      'city': city,
+      'state': state,
+      'phone': '%03d%03d%04d' % (generator.randint(200, 999), generator.randint(200, 999), generator.randint(0, 9999)),
+      'genres': self.genres(generator),
+      'facebook_link': 'https://www.facebook.com/' + slug(name),
+      'website': 'https://www.' + slug(name) + '.com' if generator.random() < 0.6 else '',
+      'image_link': 'https://images.example.com/' + slug(name) + '.jpg',
+      'seeking_description': '',
+    }
+
+  def venues(self, count):
+    generator = self.random('venues')
+    for i in range(count):
+      name = '%s %s %d' % (generator.choice(VENUE_WORDS), generator.choice(VENUE_NOUNS), i + 1)
+      venue = self.entity(generator, name)
+      venue['address'] = '%d %s' % (generator.randint(1, 9999), generator.choice(STREETS))
+      venue['seeking_talent'] = generator.random() < 0.3
+      yield venue
+
+  def artists(self, count):
+    generator = self.random('artists')
+    for i in range(count):
+      name = '%s %s %d' % (generator.choice(ARTIST_WORDS), generator.choice(ARTIST_NOUNS), i + 1)
+      artist = self.entity(generator, name)
+      artist['seeking_venues'] = generator.random() < 0.4
+      yield artist
+
+  # Shows between the generated venues and artists, popular ones getting most of them
+  def shows(self, count, venues, artists):
+    generator = self.random('shows')
+    venue_names = [venue['name'] for venue in self.venues(venues)]
+    artist_names = [artist['name'] for artist in self.artists(artists)]
+    venue_weights = zipf_weights(venues, 0.8)
+    artist_weights = zipf_weights(artists, 0.8)
+    for i in range(count):
+      day = self.anchor + timedelta(days=generator.randint(-SHOWS_DAYS_BEFORE, SHOWS_DAYS_AFTER))
+      if day.weekday() < 4 and generator.random() < 0.5:
+        # half of the weekday shows move to the next Friday or Saturday
+        day += timedelta(days=4 - day.weekday() + generator.randint(0, 1))
+      yield {
+        'venue_name': generator.choices(venue_names, cum_weights=venue_weights)[0],
+        'artist_name': generator.choices(artist_names, cum_weights=artist_weights)[0],
+        'start_time': day.replace(hour=generator.randint(18, 22), minute=generator.choice((0, 30))),
+      }
@@ -0,0 +1,265 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime
+import dateutil.parser
+from werkzeug.datastructures import MultiDict
+from forms import VenueForm, ArtistForm
+from formatters import format_phone
+from models import Venue, Artist, Show, Genre, venue_genres, artist_genres, db
+from search import engines
+from cache import page_cache, show_day_tags
+from partitions import archived_until
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+# Rows are streamed from CSV or JSON lines files, validated with the same
+# rules as the forms and written in batches: COPY on Postgres, executemany
+# elsewhere, except venues and artists whose inserts return their ids. Bulk statements don't go through the session events, so the
+# search indexes, updated_at columns and page cache are maintained here.
+#----------------------------------------------------------------------------#
+
+# Number of invalid rows whose errors are kept for the report, the others are only counted
+MAX_REPORTED_ERRORS = 20
+
+# Form fields that may be left empty in an imported row
+OPTIONAL_FIELDS = ('phone', 'facebook_link', 'website', 'image_link', 'seeking_description')
+
+# Rows read from a .csv file (header line required) or a .jsonl file
+def read_rows(path, format=None):
+  format = format or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+  with open(path, newline='') as file:
+    if format == 'csv':
+      yield from csv.DictReader(file)
+    else:
+      for line in file:
+        if line.strip():
+          yield json.loads(line)
+
+def split_genres(value):
+  if isinstance(value, (list, tuple)):
+    names = [str(name) for name in value]
+  else:
+    names = str(value or '').split(',')
+  return [name.strip() for name in names if name.strip()]
+
+def parse_start_time(value):
+  if isinstance(value, datetime):
+    return value
+  try:
+    return datetime.fromisoformat(value)
+  except ValueError:
+    return dateutil.parser.parse(value)
+
+# Writes rows (dicts keyed by column name) to a table in one statement
+def insert_rows(table, rows):
+  if not rows:
+    return
+  connection = db.session.connection()
+  if connection.dialect.name != 'postgresql':
+    connection.execute(table.insert(), rows)
+    return
+  columns = list(rows[0])
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  for row in rows:
+    writer.writerow([row[column] for column in columns])
+  buffer.seek(0)
+  cursor = connection.connection.cursor()
+  cursor.copy_expert('COPY %s (%s) FROM STDIN WITH (FORMAT csv)' % (table.name, ', '.join(columns)), buffer)
+
+
+# Rows per INSERT ... RETURNING statement, within Postgres' 65535 bind parameters
+RETURNING_CHUNK_SIZE = 1000
+
+# Inserts rows (dicts keyed by column name) and returns the (id, name) of each inserted row:
+# INSERT ... RETURNING on Postgres, one statement per row elsewhere
+def insert_returning_names(table, rows):
+  connection = db.session.connection()
+  if connection.dialect.name != 'postgresql':
+    return [
+      (connection.execute(table.insert(), row).inserted_primary_key[0], row['name'])
+      for row in rows
+    ]
+  inserted = []
+  for i in range(0, len(rows), RETURNING_CHUNK_SIZE):
+    statement = table.insert().values(rows[i:i + RETURNING_CHUNK_SIZE]).returning(table.c.id, table.c.name)
+    inserted += [tuple(row) for row in connection.execute(statement)]
+  return inserted
+
+
+class Importer:
+  # Imports one kind of rows ('venues', 'artists' or 'shows'), `batch_size` rows per transaction.
+  # `report` is called with (rows imported so far, seconds elapsed) after each batch.
+  def __init__(self, kind, batch_size=10000, report=None):
+    self.kind = kind
+    self.batch_size = batch_size
+    self.report = report
+    self.imported = 0
+    self.errors = []
+    self.skipped = 0
+
+  def run(self, rows):
+    start = time.perf_counter()
+    self.prepare()
+    batch = []
+    for number, row in enumerate(rows, 1):
+      value, errors = self.clean(row)
+      if errors:
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+          self.errors.append((number, errors))
+        continue
+      batch.append(value)
+      if len(batch) == self.batch_size:
+        self.write(batch)
+        batch = []
+        if self.report:
+          self.report(self.imported, time.perf_counter() - start)
+    if batch:
+      self.write(batch)
+    if self.kind in ('venues', 'artists'):
+      engines[Venue if self.kind == 'venues' else Artist].index.reset()
+    return time.perf_counter() - start
+
+  def write(self, batch):
+    try:
+      tags = getattr(self, 'write_' + self.kind)(batch)
+      db.session.commit()
+    except Exception:
+      db.session.rollback()
+      raise
+    page_cache.invalidate(tags)
+    self.imported += len(batch)
+
+  # Loads the names and ids needed to check for duplicates and resolve references
+  def prepare(self):
+    self.genres = dict(db.session.query(Genre.name, Genre.id))
+    if self.kind == 'shows':
+      self.venues = self.ids_by_name(Venue)
+      self.artists = self.ids_by_name(Artist)
+      self.venue_ids = {id for ids in self.venues.values() for id in ids}
+      self.artist_ids = {id for ids in self.artists.values() for id in ids}
+      # shows can't be written to the range archived by `flask fyyur partitions`
+      self.archived_until = archived_until()
+    else:
+      model = Venue if self.kind == 'venues' else Artist
+      self.names = {name for name, in db.session.query(model.name)}
+
+  # {name: [ids]}, as distinct rows may share a name
+  def ids_by_name(self, model):
+    ids = {}
+    for name, id in db.session.query(model.name, model.id):
+      ids.setdefault(name, []).append(id)
+    return ids
+
+  # Returns (values, None) for a valid row, (None, errors) otherwise
+  def clean(self, row):
+    if self.kind == 'shows':
+      return self.clean_show(row)
+    form_class = VenueForm if self.kind == 'venues' else ArtistForm
+    formdata = MultiDict()
+    for name, value in row.items():
+      if name == 'genres':
+        for genre in split_genres(value):
+          formdata.add('genres', genre)
+      elif value is not None:
+        formdata.add(name, str(value).lower() if isinstance(value, bool) else str(value))
+    form = form_class(formdata=formdata, meta={'csrf': False})
+    form.validate()
+    errors = [
+      '%s: %s' % (name, ', '.join(field.errors))
+      for name, field in form._fields.items()
+      if field.errors and not (name in OPTIONAL_FIELDS and not field.data)
+    ]
+    name = (form.name.data or '').strip()
+    if name in self.names:
+      errors.append('name: "%s" already exists' % name)
+    if errors:
+      return None, errors
+    self.names.add(name)
+    data = form.data
+    data['name'] = name
+    data['phone'] = format_phone(data['phone'] or '') or None
+    for field in OPTIONAL_FIELDS:
+      data[field] = data[field] or None
+    return data, None
+
+  # Shows reference their venue and artist by name (venue_name/artist_name) or id
+  def clean_show(self, row):
+    errors = []
+    references = {}
+    for kind, by_name, ids in (('venue', self.venues, self.venue_ids), ('artist', self.artists, self.artist_ids)):
+      if row.get(kind + '_id') not in (None, ''):
+        try:
+          id = int(row[kind + '_id'])
+        except ValueError:
+          id = None
+        if id not in ids:
+          errors.append('%s_id: there is no %s with this id' % (kind, kind))
+      else:
+        named = by_name.get((row.get(kind + '_name') or '').strip(), [])
+        id = named[0] if len(named) == 1 else None
+        if not named:
+          errors.append('%s_name: there is no %s with this name' % (kind, kind))
+        elif len(named) > 1:
+          errors.append('%s_name: several %ss have this name, give %s_id instead' % (kind, kind, kind))
+      references[kind + '_id'] = id
+    try:
+      references['start_time'] = parse_start_time(row.get('start_time') or '')
+    except (ValueError, OverflowError):
+      errors.append('start_time: not a valid date and time')
+    else:
+      if self.archived_until is not None and references['start_time'] < self.archived_until:
+        errors.append('start_time: shows before %s are archived' % self.archived_until.date().isoformat())
+    if errors:
+      return None, errors
+    return references, None
+
+  # The write_* methods return the page cache tags to invalidate once committed
+  def write_venues(self, batch):
+    return self.write_entities(Venue, venue_genres, 'venue_id', batch, [
+      'name', 'address', 'city', 'state', 'phone', 'website', 'facebook_link',
+      'seeking_talent', 'seeking_description', 'image_link'
+    ])
+
+  def write_artists(self, batch):
+    return self.write_entities(Artist, artist_genres, 'artist_id', batch, [
+      'name', 'city', 'state', 'phone', 'website', 'facebook_link',
+      'seeking_venues', 'seeking_description', 'image_link'
+    ])
+
+  # Inserts the rows, returning their ids to link their genres; names are
+  # unique within an import (clean() rejects the repeated ones)
+  def write_entities(self, model, link_table, link_column, batch, columns):
+    now = datetime.utcnow()
+    inserted = insert_returning_names(model.__table__, [
+      dict({column: data[column] for column in columns}, created_at=now, updated_at=now)
+      for data in batch
+    ])
+    ids = {name: id for id, name in inserted}
+    missing = {genre for data in batch for genre in data['genres'] if genre not in self.genres}
+    if missing:
+      db.session.execute(Genre.__table__.insert(), [{'name': name} for name in sorted(missing)])
+      self.genres.update(db.session.query(Genre.name, Genre.id).filter(Genre.name.in_(missing)))
+    links = {
+      (ids[data['name']], self.genres[genre])
+      for data in batch if data['name'] in ids
+      for genre in data['genres']
+    }
+    insert_rows(link_table, [{link_column: id, 'genre_id': genre_id} for id, genre_id in sorted(links)])
+    return [self.kind]
+
+  # New shows change their venue and artist pages like a flushed Show would
+  def write_shows(self, batch):
+    insert_rows(Show.__table__, batch)
+    now = datetime.utcnow()
+    venue_ids = sorted({show['venue_id'] for show in batch})
+    artist_ids = sorted({show['artist_id'] for show in batch})
+    for model, ids in ((Venue, venue_ids), (Artist, artist_ids)):
+      for i in range(0, len(ids), 1000):
+        model.query.filter(model.id.in_(ids[i:i + 1000])) \
+          .update({model.updated_at: now}, synchronize_session=False)
+    return ['venues', 'shows'] + ['venue:%d' % id for id in venue_ids] + ['artist:%d' % id for id in artist_ids] \
+      + sorted(show_day_tags(show['start_time'] for show in batch))
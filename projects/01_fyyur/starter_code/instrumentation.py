@@ -0,0 +1,109 @@
+import hashlib
+import json
+import random
+import re
+import time
+from collections import Counter
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# Request instrumentation.
+# Every statement run while handling a request is counted and timed through
+# the engine cursor events, and grouped by fingerprint (the statement with
+# its parameters and IN lists collapsed). Responses get a Server-Timing
+# header; slow requests and requests repeating the same statement (the N+1
+# signature) are logged, sampled, with their fingerprints.
+#----------------------------------------------------------------------------#
+
+PARAMETER = re.compile(r"\?|%\(\w+\)s|'(?:[^']|'')*'|\b\d+\b")
+IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+SPACES = re.compile(r'\s+')
+
+# Statement with literals and bind parameters replaced by ?, and IN lists by (?)
+def normalize(statement):
+  statement = PARAMETER.sub('?', statement)
+  statement = IN_LIST.sub('(?)', statement)
+  return SPACES.sub(' ', statement).strip()
+
+def fingerprint(statement):
+  return hashlib.sha1(statement.encode()).hexdigest()[:12]
+
+
+class RequestStats:
+  def __init__(self):
+    self.start = time.perf_counter()
+    self.queries = 0
+    self.db_seconds = 0.0
+    self.statements = Counter()
+    self.texts = {}
+
+  def record(self, statement, seconds):
+    normalized = normalize(statement)
+    key = fingerprint(normalized)
+    self.queries += 1
+    self.db_seconds += seconds
+    self.statements[key] += 1
+    self.texts.setdefault(key, normalized)
+
+  # Fingerprints run at least `threshold` times, most repeated first
+  def repeated(self, threshold):
+    return [(key, count) for key, count in self.statements.most_common() if count >= threshold]
+
+
+class Instrumentation:
+  def __init__(self):
+    self.app = None
+
+  def init_app(self, app):
+    self.app = app
+    app.before_request(self.start_request)
+    app.after_request(self.finish_request)
+    if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+      event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+      event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+  def start_request(self):
+    g.request_stats = RequestStats()
+
+  def finish_request(self, response):
+    stats = g.pop('request_stats', None)
+    if stats is None:
+      return response
+    config = self.app.config
+    total_ms = (time.perf_counter() - stats.start) * 1000
+    db_ms = stats.db_seconds * 1000
+    if config.get('SERVER_TIMING', True):
+      response.headers.add('Server-Timing', 'db;desc="%d queries";dur=%.1f' % (stats.queries, db_ms))
+      response.headers.add('Server-Timing', 'app;dur=%.1f' % total_ms)
+    repeated = stats.repeated(config.get('N_PLUS_ONE_THRESHOLD', 5))
+    slow = total_ms >= config.get('SLOW_REQUEST_MS', 500)
+    if (slow or repeated) and random.random() < config.get('SLOW_REQUEST_SAMPLE_RATE', 1.0):
+      self.app.logger.warning('%s request %s', 'slow' if slow else 'repeated statements', json.dumps({
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'duration_ms': round(total_ms, 1),
+        'db_ms': round(db_ms, 1),
+        'queries': stats.queries,
+        'repeated': [key for key, count in repeated],
+        'statements': [
+          {'fingerprint': key, 'count': count, 'statement': stats.texts[key]}
+          for key, count in stats.statements.most_common()
+        ],
+      }, sort_keys=True))
+    return response
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  if has_request_context() and 'request_stats' in g:
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  if has_request_context() and 'request_stats' in g and conn.info.get('query_start'):
+    g.request_stats.record(statement, time.perf_counter() - conn.info['query_start'].pop())
+
+
+instrumentation = Instrumentation()
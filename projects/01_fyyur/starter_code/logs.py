@@ -0,0 +1,135 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import time
+import uuid
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+#----------------------------------------------------------------------------#
+# Logging.
+# Request threads only put records on a bounded queue; a listener thread
+# formats them as JSON lines and writes them to a size-rotated file. When
+# the queue is full records are dropped rather than blocking the request,
+# counted, and the count is written with the next record that gets through.
+#----------------------------------------------------------------------------#
+
+class DroppingQueueHandler(QueueHandler):
+  def __init__(self, queue):
+    super().__init__(queue)
+    self.dropped = 0
+    self.unreported = 0
+
+  # Runs on the thread that logs: the request details are read here, while the
+  # request context is still there, and the message is rendered once
+  def prepare(self, record):
+    record = copy.copy(record)
+    record.message = record.getMessage()
+    record.msg = record.message
+    record.args = None
+    if record.exc_info:
+      record.exc_text = logging.Formatter().formatException(record.exc_info)
+      record.exc_info = None
+    if has_request_context():
+      record.request_id = g.get('request_id')
+      record.method = request.method
+      record.path = request.path
+      if 'request_start' in g:
+        record.latency_ms = round((time.perf_counter() - g.request_start) * 1000, 1)
+    return record
+
+  # Called under the handler lock (Handler.handle), so the counters need no other
+  def enqueue(self, record):
+    record.dropped = self.unreported
+    try:
+      self.queue.put_nowait(record)
+    except queue.Full:
+      self.dropped += 1
+      self.unreported += 1
+      return
+    self.unreported = 0
+
+
+class JsonFormatter(logging.Formatter):
+  FIELDS = ('request_id', 'method', 'path', 'status', 'latency_ms')
+
+  def format(self, record):
+    entry = {
+      'time': datetime.utcfromtimestamp(record.created).isoformat(timespec='milliseconds') + 'Z',
+      'level': record.levelname,
+      'logger': record.name,
+      'message': record.getMessage(),
+    }
+    for field in self.FIELDS:
+      value = getattr(record, field, None)
+      if value is not None:
+        entry[field] = value
+    if record.exc_text:
+      entry['exception'] = record.exc_text
+    if getattr(record, 'dropped', 0):
+      entry['dropped_before'] = record.dropped
+    return json.dumps(entry)
+
+
+class AppLogging:
+  def __init__(self):
+    self.handler = None
+    self.listener = None
+    self.access_log = False
+
+  def init_app(self, app):
+    app.before_request(start_request)
+    app.after_request(self.finish_request)
+    self.logger = app.logger
+    if app.debug:
+      # the default stderr handler is kept while debugging
+      self.access_log = False
+      return
+    config = app.config
+    file_handler = RotatingFileHandler(
+      config.get('LOG_FILE', 'error.log'),
+      maxBytes=config.get('LOG_MAX_BYTES', 10 * 1024 * 1024),
+      backupCount=config.get('LOG_BACKUP_COUNT', 5)
+    )
+    file_handler.setFormatter(JsonFormatter())
+    self.handler = DroppingQueueHandler(queue.Queue(config.get('LOG_QUEUE_SIZE', 10000)))
+    self.listener = QueueListener(self.handler.queue, file_handler)
+    self.listener.start()
+    atexit.register(self.stop)
+    # the default handler writes to stderr on the request thread
+    app.logger.removeHandler(default_handler)
+    app.logger.addHandler(self.handler)
+    self.access_log = config.get('ACCESS_LOG', True)
+
+  def stop(self):
+    if self.listener is not None:
+      self.listener.stop()
+      self.listener = None
+
+  def stats(self):
+    return {
+      'queued': self.handler.queue.qsize() if self.handler else 0,
+      'dropped': self.handler.dropped if self.handler else 0,
+    }
+
+  # One access line per request, with its status and latency
+  def finish_request(self, response):
+    if self.access_log:
+      self.logger.info('%s %s %s', request.method, request.full_path.rstrip('?'), response.status_code,
+                       extra={'status': response.status_code})
+    if 'request_id' in g:
+      response.headers['X-Request-Id'] = g.request_id
+    return response
+
+
+# Requests keep the X-Request-Id they come with, or get a new one
+def start_request():
+  g.request_id = request.headers.get('X-Request-Id', '')[:64] or uuid.uuid4().hex
+  g.request_start = time.perf_counter()
+
+
+app_logging = AppLogging()
@@ -0,0 +1,34 @@
+"""trigram indexes for venue and artist name search
+
+Revision ID: 3f9a1c2b7d4e
+Revises: 52d3658496ad
+Create Date: 2026-10-18 09:12:40.118902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c2b7d4e'
+down_revision = '52d3658496ad'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # pg_trgm only exists on Postgres, other databases use the in-process index of search.py
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_venues_name_trgm', 'venues', ['name'], unique=False,
+               postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_artists_name_trgm', 'artists', ['name'], unique=False,
+               postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_artists_name_trgm', table_name='artists')
+    op.drop_index('ix_venues_name_trgm', table_name='venues')
@@ -0,0 +1,30 @@
+"""updated_at on venues and artists for conditional GETs
+
+Revision ID: 5e0b9c3d8a21
+Revises: c41d7a9e2f63
+Create Date: 2026-10-18 11:36:02.774410
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e0b9c3d8a21'
+down_revision = 'c41d7a9e2f63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venues', 'artists'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.execute("UPDATE {} SET updated_at = coalesce(created_at, now() at time zone 'utc')".format(table))
+        op.alter_column(table, 'updated_at', existing_type=sa.DateTime(), nullable=False)
+        op.create_index(op.f('ix_{}_updated_at'.format(table)), table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('artists', 'venues'):
+        op.drop_index(op.f('ix_{}_updated_at'.format(table)), table_name=table)
+        op.drop_column(table, 'updated_at')
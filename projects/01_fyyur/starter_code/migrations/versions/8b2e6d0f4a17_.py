@@ -0,0 +1,36 @@
+"""indexes on shows for venue/artist pages and start_time ordering
+
+Revision ID: 8b2e6d0f4a17
+Revises: 3f9a1c2b7d4e
+Create Date: 2026-10-18 10:02:51.507236
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e6d0f4a17'
+down_revision = '3f9a1c2b7d4e'
+branch_labels = None
+depends_on = None
+
+indexes = [
+    ('ix_shows_venue_id_start_time', ['venue_id', 'start_time']),
+    ('ix_shows_artist_id_start_time', ['artist_id', 'start_time']),
+    ('ix_shows_start_time', ['start_time']),
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction, so the indexes are
+    # built in autocommit mode without locking the shows table against writes
+    with op.get_context().autocommit_block():
+        for name, columns in indexes:
+            op.create_index(name, 'shows', columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, columns in reversed(indexes):
+            op.drop_index(name, table_name='shows', postgresql_concurrently=True)
@@ -0,0 +1,41 @@
+"""ON DELETE CASCADE on the shows foreign keys
+
+Revision ID: 9d4f2a6c1b38
+Revises: 5e0b9c3d8a21
+Create Date: 2026-10-18 14:02:51.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4f2a6c1b38'
+down_revision = '5e0b9c3d8a21'
+branch_labels = None
+depends_on = None
+
+foreign_keys = [
+    ('shows_venue_id_fkey', 'venue_id', 'venues'),
+    ('shows_artist_id_fkey', 'artist_id', 'artists'),
+]
+
+
+def replace_foreign_keys(on_delete):
+    # The constraints are swapped NOT VALID, so the short exclusive lock doesn't
+    # cover a scan of shows, and validated once committed, which doesn't block writes
+    for name, column, table in foreign_keys:
+        op.drop_constraint(name, 'shows', type_='foreignkey')
+        op.execute('ALTER TABLE shows ADD CONSTRAINT {} FOREIGN KEY ({}) REFERENCES {} (id){} NOT VALID'.format(
+            name, column, table, ' ON DELETE CASCADE' if on_delete else ''))
+    with op.get_context().autocommit_block():
+        for name, column, table in foreign_keys:
+            op.execute('ALTER TABLE shows VALIDATE CONSTRAINT {}'.format(name))
+
+
+def upgrade():
+    replace_foreign_keys(on_delete=True)
+
+
+def downgrade():
+    replace_foreign_keys(on_delete=False)
@@ -0,0 +1,99 @@
+"""Range partition shows on start_time (Postgres)
+
+Unlike the online index migration 8b2e6d0f4a17, this one is offline: the
+shows are copied to the new table with one INSERT ... SELECT and its
+indexes are built without CONCURRENTLY, while the old table is held by
+an ACCESS EXCLUSIVE lock. Booking and listing shows wait for the whole
+copy, so run it in a maintenance window.
+
+Revision ID: a7c3e91d5b02
+Revises: 9d4f2a6c1b38
+Create Date: 2026-10-18 16:20:37.905113
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e91d5b02'
+down_revision = '9d4f2a6c1b38'
+branch_labels = None
+depends_on = None
+
+# Monthly partitions created ahead of the current month, later ones are
+# added by `flask fyyur partitions`
+MONTHS_AHEAD = 12
+
+indexes = [
+    ('ix_shows_venue_id_start_time', 'venue_id, start_time'),
+    ('ix_shows_artist_id_start_time', 'artist_id, start_time'),
+    ('ix_shows_start_time', 'start_time'),
+]
+
+columns = '''
+    id integer NOT NULL DEFAULT nextval('shows_id_seq'),
+    artist_id integer NOT NULL CONSTRAINT shows_artist_id_fkey REFERENCES artists (id) ON DELETE CASCADE,
+    venue_id integer NOT NULL CONSTRAINT shows_venue_id_fkey REFERENCES venues (id) ON DELETE CASCADE,
+    start_time timestamp without time zone NOT NULL'''
+
+
+def add_months(month, count):
+    month_index = month.year * 12 + month.month - 1 + count
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+
+def copy_shows(source, target):
+    op.execute('INSERT INTO {} (id, artist_id, venue_id, start_time) '
+               'SELECT id, artist_id, venue_id, start_time FROM {}'.format(target, source))
+
+
+def swap_tables(create):
+    # The new table is filled from the old one, which is then dropped; the id
+    # sequence is detached from the old table first so it survives the drop
+    op.execute('ALTER SEQUENCE shows_id_seq OWNED BY NONE')
+    op.execute('ALTER TABLE shows RENAME TO shows_old')
+    op.execute('ALTER INDEX shows_pkey RENAME TO shows_old_pkey')
+    for name, index_columns in indexes:
+        op.execute('ALTER INDEX {0} RENAME TO {0}_old'.format(name))
+    create()
+    for name, index_columns in indexes:
+        op.execute('CREATE INDEX {} ON shows ({})'.format(name, index_columns))
+    copy_shows('shows_old', 'shows')
+    op.execute('DROP TABLE shows_old')
+    op.execute('ALTER SEQUENCE shows_id_seq OWNED BY shows.id')
+
+
+def create_partitioned():
+    # Past shows go to one cold partition, the current and coming months get
+    # their own (hot) ones and shows booked further ahead the default one.
+    # The partition key has to be part of the primary key.
+    op.execute('CREATE TABLE shows ({}, PRIMARY KEY (id, start_time)) '
+               'PARTITION BY RANGE (start_time)'.format(columns))
+    current = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    op.execute("CREATE TABLE shows_archive PARTITION OF shows "
+               "FOR VALUES FROM (MINVALUE) TO ('{}')".format(current.isoformat(' ')))
+    for i in range(MONTHS_AHEAD + 1):
+        month = add_months(current, i)
+        op.execute("CREATE TABLE shows_{:%Y_%m} PARTITION OF shows FOR VALUES FROM ('{}') TO ('{}')".format(
+            month, month.isoformat(' '), add_months(month, 1).isoformat(' ')))
+    op.execute('CREATE TABLE shows_default PARTITION OF shows DEFAULT')
+
+
+def create_flat():
+    op.execute('CREATE TABLE shows ({}, PRIMARY KEY (id))'.format(columns))
+
+
+def upgrade():
+    # SQLite keeps the plain table
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    swap_tables(create_partitioned)
+
+
+def downgrade():
+    # partitions detached to the archive schema are left there
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    swap_tables(create_flat)
@@ -0,0 +1,168 @@
+"""normalize venue and artist genres into association tables
+
+Revision ID: c41d7a9e2f63
+Revises: 8b2e6d0f4a17
+Create Date: 2026-10-18 10:47:19.360554
+
+"""
+from contextlib import contextmanager
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d7a9e2f63'
+down_revision = '8b2e6d0f4a17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('genres',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('venue_genres',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['genre_id'], ['genres.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['venues.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id', 'genre_id')
+    )
+    op.create_index('ix_venue_genres_genre_id_venue_id', 'venue_genres', ['genre_id', 'venue_id'], unique=False)
+    op.create_table('artist_genres',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artists.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['genre_id'], ['genres.id'], ),
+    sa.PrimaryKeyConstraint('artist_id', 'genre_id')
+    )
+    op.create_index('ix_artist_genres_genre_id_artist_id', 'artist_genres', ['genre_id', 'artist_id'], unique=False)
+
+    # backfill from the comma-joined genres strings
+    if op.get_bind().dialect.name == 'postgresql':
+        backfill_postgresql()
+        op.drop_column('venues', 'genres')
+        op.drop_column('artists', 'genres')
+    else:
+        with foreign_keys_off():
+            backfill_portable()
+            # batch mode recreates the tables on SQLite, which can't drop columns
+            with op.batch_alter_table('venues') as batch_op:
+                batch_op.drop_column('genres')
+            with op.batch_alter_table('artists') as batch_op:
+                batch_op.drop_column('genres')
+
+
+@contextmanager
+def foreign_keys_off():
+    # Recreating venues/artists drops the old tables, which with foreign keys
+    # enforced (see models.enable_sqlite_foreign_keys) would cascade to their
+    # genres and shows. The pragma only applies outside of a transaction.
+    if op.get_bind().dialect.name != 'sqlite':
+        yield
+        return
+    with op.get_context().autocommit_block():
+        op.execute('PRAGMA foreign_keys=OFF')
+    try:
+        yield
+    finally:
+        with op.get_context().autocommit_block():
+            op.execute('PRAGMA foreign_keys=ON')
+
+
+def backfill_postgresql():
+    op.execute("""
+        INSERT INTO genres (name)
+        SELECT DISTINCT trim(name) FROM (
+            SELECT unnest(string_to_array(genres, ',')) AS name FROM venues
+            UNION
+            SELECT unnest(string_to_array(genres, ',')) AS name FROM artists
+        ) AS names
+        WHERE trim(name) <> ''
+    """)
+    op.execute("""
+        INSERT INTO venue_genres (venue_id, genre_id)
+        SELECT DISTINCT venues.id, genres.id
+        FROM venues
+        CROSS JOIN LATERAL unnest(string_to_array(venues.genres, ',')) AS name
+        JOIN genres ON genres.name = trim(name)
+    """)
+    op.execute("""
+        INSERT INTO artist_genres (artist_id, genre_id)
+        SELECT DISTINCT artists.id, genres.id
+        FROM artists
+        CROSS JOIN LATERAL unnest(string_to_array(artists.genres, ',')) AS name
+        JOIN genres ON genres.name = trim(name)
+    """)
+
+
+def backfill_portable():
+    # Same backfill for databases without unnest/LATERAL (SQLite): the genres
+    # strings are split in Python and the rows bulk inserted
+    bind = op.get_bind()
+    names = {}
+    for table in ('venues', 'artists'):
+        names[table] = [
+            (id, {name.strip() for name in (genres or '').split(',') if name.strip()})
+            for id, genres in bind.execute(sa.text('SELECT id, genres FROM {}'.format(table)))
+        ]
+    all_names = sorted(set().union(*[genres for rows in names.values() for id, genres in rows]))
+    if all_names:
+        op.bulk_insert(sa.table('genres', sa.column('name')), [{'name': name} for name in all_names])
+    genre_ids = {name: id for id, name in bind.execute(sa.text('SELECT id, name FROM genres'))}
+    for table, link_table, column in (('venues', 'venue_genres', 'venue_id'), ('artists', 'artist_genres', 'artist_id')):
+        links = [{column: id, 'genre_id': genre_ids[name]} for id, genres in names[table] for name in sorted(genres)]
+        if links:
+            op.bulk_insert(sa.table(link_table, sa.column(column), sa.column('genre_id')), links)
+
+
+def downgrade():
+    op.add_column('artists', sa.Column('genres', sa.VARCHAR(length=120), server_default='', nullable=False))
+    op.add_column('venues', sa.Column('genres', sa.VARCHAR(), server_default='', nullable=False))
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("""
+            UPDATE venues SET genres = names.genres
+            FROM (
+                SELECT venue_id, string_agg(genres.name, ',' ORDER BY genres.name) AS genres
+                FROM venue_genres JOIN genres ON genres.id = venue_genres.genre_id
+                GROUP BY venue_id
+            ) AS names
+            WHERE names.venue_id = venues.id
+        """)
+        op.execute("""
+            UPDATE artists SET genres = names.genres
+            FROM (
+                SELECT artist_id, string_agg(genres.name, ',' ORDER BY genres.name) AS genres
+                FROM artist_genres JOIN genres ON genres.id = artist_genres.genre_id
+                GROUP BY artist_id
+            ) AS names
+            WHERE names.artist_id = artists.id
+        """)
+        op.alter_column('artists', 'genres', server_default=None)
+        op.alter_column('venues', 'genres', server_default=None)
+    else:
+        # SQLite keeps the '' server default, it can't alter columns in place
+        join_genres_portable()
+    op.drop_index('ix_artist_genres_genre_id_artist_id', table_name='artist_genres')
+    op.drop_table('artist_genres')
+    op.drop_index('ix_venue_genres_genre_id_venue_id', table_name='venue_genres')
+    op.drop_table('venue_genres')
+    op.drop_table('genres')
+
+
+def join_genres_portable():
+    # string_agg/UPDATE ... FROM are Postgres only: join the names in Python
+    bind = op.get_bind()
+    for table, link_table, column in (('venues', 'venue_genres', 'venue_id'), ('artists', 'artist_genres', 'artist_id')):
+        genres = {}
+        rows = bind.execute(sa.text(
+            'SELECT {0}.{1}, genres.name FROM {0} JOIN genres ON genres.id = {0}.genre_id '
+            'ORDER BY genres.name'.format(link_table, column)))
+        for id, name in rows:
+            genres.setdefault(id, []).append(name)
+        for id, names in genres.items():
+            bind.execute(sa.text('UPDATE {} SET genres = :genres WHERE id = :id'.format(table)),
+                         genres=','.join(names), id=id)
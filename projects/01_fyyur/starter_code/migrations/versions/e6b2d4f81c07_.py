@@ -0,0 +1,32 @@
+"""deletions log for incremental exports
+
+Revision ID: e6b2d4f81c07
+Revises: a7c3e91d5b02
+Create Date: 2026-10-18 19:12:44.093251
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b2d4f81c07'
+down_revision = 'a7c3e91d5b02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('deletions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('record_id', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_deletions_kind_deleted_at', 'deletions', ['kind', 'deleted_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_deletions_kind_deleted_at', table_name='deletions')
+    op.drop_table('deletions')
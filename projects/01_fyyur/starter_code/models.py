@@ -1,19 +1,65 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
 
 db = SQLAlchemy()
 
+# SQLite only enforces foreign keys, and so ON DELETE CASCADE, when asked to
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+  if type(dbapi_connection).__module__.startswith('sqlite3'):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+# Genres are normalized into their own table and linked to venues/artists through
+# association tables indexed on (genre_id, venue_id/artist_id) for genre filtering
+venue_genres = db.Table('venue_genres',
+  db.Column('venue_id', db.Integer, db.ForeignKey('venues.id', ondelete='CASCADE'), primary_key=True),
+  db.Column('genre_id', db.Integer, db.ForeignKey('genres.id'), primary_key=True),
+  db.Index('ix_venue_genres_genre_id_venue_id', 'genre_id', 'venue_id')
+)
+
+artist_genres = db.Table('artist_genres',
+  db.Column('artist_id', db.Integer, db.ForeignKey('artists.id', ondelete='CASCADE'), primary_key=True),
+  db.Column('genre_id', db.Integer, db.ForeignKey('genres.id'), primary_key=True),
+  db.Index('ix_artist_genres_genre_id_artist_id', 'genre_id', 'artist_id')
+)
+
+class Genre(db.Model):
+  __tablename__ = 'genres'
+
+  id = db.Column(db.Integer, primary_key=True)
+  name = db.Column(db.String(120), nullable=False, unique=True)
+
+  # Returns the Genre rows for the given names, adding the ones that don't exist yet
+  @classmethod
+  def from_names(cls, names):
+    names = list(dict.fromkeys(name.strip() for name in names if name.strip()))
+    if not names:
+      return []
+    existing = {genre.name: genre for genre in cls.query.filter(cls.name.in_(names)).all()}
+    genres = []
+    for name in names:
+      genre = existing.get(name)
+      if genre is None:
+        genre = cls(name=name)
+        db.session.add(genre)
+      genres.append(genre)
+    return(genres)
+
 class Venue(db.Model):
   __tablename__ = 'venues'
 
   # Adjusted the model to the account for new attributes
   id = db.Column(db.Integer, primary_key=True)
   name = db.Column(db.String, nullable=False)
-  genres = db.Column(db.String, nullable=False)
   address = db.Column(db.String(120),nullable=False)
   city = db.Column(db.String(120),nullable=False)
   state = db.Column(db.String(120),nullable=False)
@@ -24,8 +70,16 @@ class Venue(db.Model):
   seeking_description = db.Column(db.String())
   image_link = db.Column(db.String(500))
   created_at = db.Column(db.DateTime, default=datetime.utcnow)
+  # bumped on every edit and whenever one of its shows is added or removed (see touch_updated_at)
+  updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
+  genres = db.relationship('Genre', secondary=venue_genres, lazy='joined', order_by=Genre.name)
   
-  shows = db.relationship('Show', backref='venue', lazy=True,cascade="all, delete")
+  # shows are removed by the ON DELETE CASCADE foreign key, without being loaded
+  shows = db.relationship('Show', backref='venue', lazy=True,cascade="all, delete", passive_deletes=True)
+
+  @property
+  def genre_names(self):
+    return [genre.name for genre in self.genres]
 
   # Compares the show start time with now, to show upcoming and past shows. 
   def showsDictionary(self):
@@ -38,7 +92,7 @@ class Venue(db.Model):
       entry['artist_id'] = show.artist.id
       entry['artist_name'] = show.artist.name
       entry['artist_image_link'] = show.artist.image_link
-      entry['start_time'] = str(show.start_time)
+      entry['start_time'] = show.start_time
       if (show.start_time > time_now):
         upcoming_shows.append(entry)
       else:
@@ -58,11 +112,12 @@ class Venue(db.Model):
     return(num_upcoming)
 
   #converts venue object to data dictionary required for the view
-  def adjust_data(self):
+  #shows can be passed in already split (see queries.venue_detail) to avoid loading self.shows
+  def adjust_data(self, shows=None):
     data = {}
     data['id'] = self.id
     data['name'] = self.name
-    data['genres'] = self.genres.split(',')
+    data['genres'] = self.genre_names
     data['address'] = self.address
     data['city'] = self.city
     data['state'] = self.state
@@ -72,11 +127,12 @@ class Venue(db.Model):
     data['seeking_talent'] = self.seeking_talent
     data['seeking_description'] = self.seeking_description
     data['image_link'] = self.image_link
-    shows = self.showsDictionary()
+    if shows is None:
+      shows = self.showsDictionary()
     data['past_shows']  = shows['past_shows']
     data['upcoming_shows'] = shows['upcoming_shows']
-    data['past_shows_count']  = len(shows['past_shows'])
-    data['upcoming_shows_count'] = len(shows['upcoming_shows']) 
+    data['past_shows_count']  = shows.get('past_shows_count', len(shows['past_shows']))
+    data['upcoming_shows_count'] = shows.get('upcoming_shows_count', len(shows['upcoming_shows']))
     return(data)
 
 class Artist(db.Model):
@@ -85,7 +141,6 @@ class Artist(db.Model):
   # Adjusted the model to the account for new attributes
   id = db.Column(db.Integer, primary_key=True)
   name = db.Column(db.String,nullable=False)
-  genres = db.Column(db.String(120),nullable=False)
   city = db.Column(db.String(120))
   state = db.Column(db.String(120))
   phone = db.Column(db.String(120))
@@ -95,7 +150,14 @@ class Artist(db.Model):
   seeking_description = db.Column(db.String())
   image_link = db.Column(db.String(500))
   created_at = db.Column(db.DateTime, default=datetime.utcnow)
-  shows = db.relationship('Show', backref='artist', lazy=True,cascade="all, delete")
+  # bumped on every edit and whenever one of its shows is added or removed (see touch_updated_at)
+  updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
+  genres = db.relationship('Genre', secondary=artist_genres, lazy='joined', order_by=Genre.name)
+  shows = db.relationship('Show', backref='artist', lazy=True,cascade="all, delete", passive_deletes=True)
+
+  @property
+  def genre_names(self):
+    return [genre.name for genre in self.genres]
 
   def num_upcoming_shows(self):
     num_upcoming = 0 
@@ -117,7 +179,7 @@ class Artist(db.Model):
       entry['venue_id'] = show.venue.id
       entry['venue_name'] = show.venue.name
       entry['venue_image_link'] = show.venue.image_link
-      entry['start_time'] = str(show.start_time)
+      entry['start_time'] = show.start_time
       if (show.start_time > time_now):
         upcoming_shows.append(entry)
       else:
@@ -127,11 +189,11 @@ class Artist(db.Model):
     shows_dict['past_shows'] = past_shows
     return(shows_dict)
     
-  def adjust_data(self):
+  def adjust_data(self, shows=None):
     data = {}
     data['id'] = self.id
     data['name'] = self.name
-    data['genres'] = self.genres.split(',')
+    data['genres'] = self.genre_names
     data['city'] = self.city
     data['state'] = self.state
     data['phone'] = self.phone
@@ -140,16 +202,117 @@ class Artist(db.Model):
     data['seeking_venue'] = self.seeking_venues
     data['seeking_description'] = self.seeking_description
     data['image_link'] = self.image_link
-    shows = self.showsDictionary()
+    if shows is None:
+      shows = self.showsDictionary()
     data['past_shows']  = shows['past_shows']
     data['upcoming_shows'] = shows['upcoming_shows']
-    data['past_shows_count']  = len(shows['past_shows'])
-    data['upcoming_shows_count'] = len(shows['upcoming_shows']) 
+    data['past_shows_count']  = shows.get('past_shows_count', len(shows['past_shows']))
+    data['upcoming_shows_count'] = shows.get('upcoming_shows_count', len(shows['upcoming_shows']))
     return(data)
 
 class Show(db.Model):
   __tablename__ = 'shows'
+  # venue/artist pages filter on the foreign key and split on start_time, /shows orders by start_time.
+  # On Postgres the table is range partitioned on start_time, with (id, start_time) as primary key (see partitions.py).
+  # The model keeps `id` alone as its primary key: ids still come from one sequence and are unique,
+  # so Show.query.get(id) needs no start_time, and SQLite only autoincrements a single integer key.
+  # Alembic autogenerate doesn't compare primary keys, so it doesn't report the difference.
+  __table_args__ = (
+    db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+    db.Index('ix_shows_start_time', 'start_time'),
+  )
   id = db.Column(db.Integer, primary_key=True)
-  artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'), nullable=False)
-  venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'), nullable=False)
-  start_time = db.Column(db.DateTime(), nullable=False)
\ No newline at end of file
+  artist_id = db.Column(db.Integer, db.ForeignKey('artists.id', ondelete='CASCADE'), nullable=False)
+  venue_id = db.Column(db.Integer, db.ForeignKey('venues.id', ondelete='CASCADE'), nullable=False)
+  start_time = db.Column(db.DateTime(), nullable=False)
+
+# Deleted venues, artists and shows, for incremental exports (see exporter.py).
+# Rows older than the `since` of every export consumer can be removed.
+class Deletion(db.Model):
+  __tablename__ = 'deletions'
+  __table_args__ = (
+    db.Index('ix_deletions_kind_deleted_at', 'kind', 'deleted_at'),
+  )
+  id = db.Column(db.Integer, primary_key=True)
+  # table of the deleted row: venues, artists or shows
+  kind = db.Column(db.String(20), nullable=False)
+  record_id = db.Column(db.Integer, nullable=False)
+  deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+# Logs the shows matching `condition` as deleted, in one INSERT ... SELECT run
+# before they are removed (by a bulk delete or ON DELETE CASCADE)
+def log_deleted_shows(connection, condition, now):
+  connection.execute(Deletion.__table__.insert().from_select(
+    ['kind', 'record_id', 'deleted_at'],
+    db.select([db.literal('shows'), Show.id, db.literal(now)]).where(condition)
+  ))
+
+#----------------------------------------------------------------------------#
+# Modification times.
+#----------------------------------------------------------------------------#
+
+# Edited venues/artists get a new updated_at even when only their genres changed,
+# renaming one (or changing its image) touches the other side of its shows,
+# and adding, moving or removing a show touches its venue and artist
+@event.listens_for(Session, 'before_flush')
+def touch_updated_at(session, flush_context, instances):
+  now = datetime.utcnow()
+  touched = session.info.setdefault('touched', {Venue: set(), Artist: set()})
+  with session.no_autoflush:
+    for obj in session.dirty:
+      if isinstance(obj, (Venue, Artist)) and session.is_modified(obj):
+        obj.updated_at = now
+        # the pages of the other side of its shows list its name and image
+        state = inspect(obj)
+        if state.attrs.name.history.has_changes() or state.attrs.image_link.history.has_changes():
+          other, column, own = (Artist, Show.artist_id, Show.venue_id) if isinstance(obj, Venue) \
+            else (Venue, Show.venue_id, Show.artist_id)
+          touched[other].update(id for id, in session.query(column).filter(own == obj.id).distinct())
+  for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+    if isinstance(obj, Show):
+      state = inspect(obj)
+      for model, attribute, relationship in ((Venue, 'venue_id', 'venue'), (Artist, 'artist_id', 'artist')):
+        history = state.attrs[attribute].history
+        touched[model].update(value for value in history.sum() if value is not None)
+        # shows built from objects (Show(artist=artist)) only get their ids during the flush
+        related = state.dict.get(relationship)
+        if related is not None and related.id is not None:
+          touched[model].add(related.id)
+
+  # deleted venues/artists take their shows with them through ON DELETE CASCADE;
+  # the other side of those shows is read before the delete runs
+  # (kept in session.info['cascaded'] for the page cache)
+  with session.no_autoflush:
+    for obj in session.deleted:
+      if isinstance(obj, (Venue, Artist)) and obj.id is not None:
+        other, column, own = (Artist, Show.artist_id, Show.venue_id) if isinstance(obj, Venue) \
+          else (Venue, Show.venue_id, Show.artist_id)
+        ids = {id for id, in session.query(column).filter(own == obj.id).distinct()}
+        touched[other].update(ids)
+        session.info.setdefault('cascaded', {Venue: set(), Artist: set()})[other].update(ids)
+
+# Deleted venues, artists and shows go to the deletions log, with the shows
+# their venue/artist takes with it, in the transaction deleting them
+@event.listens_for(Session, 'before_flush')
+def log_deletions(session, flush_context, instances):
+  now = datetime.utcnow()
+  rows = []
+  for obj in session.deleted:
+    if isinstance(obj, (Venue, Artist, Show)) and obj.id is not None:
+      rows.append({'kind': obj.__tablename__, 'record_id': obj.id, 'deleted_at': now})
+      if isinstance(obj, (Venue, Artist)):
+        fk_column = Show.venue_id if isinstance(obj, Venue) else Show.artist_id
+        log_deleted_shows(session.connection(), fk_column == obj.id, now)
+  if rows:
+    session.connection().execute(Deletion.__table__.insert(), rows)
+
+@event.listens_for(Session, 'after_flush')
+def update_touched(session, flush_context):
+  touched = session.info.pop('touched', {})
+  now = datetime.utcnow()
+  for model, ids in touched.items():
+    if ids:
+      session.connection().execute(
+        model.__table__.update().where(model.id.in_(ids)).values(updated_at=now)
+      )
@@ -0,0 +1,151 @@
+import re
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
+from models import db
+from cache import page_cache
+
+#----------------------------------------------------------------------------#
+# Shows partitions (Postgres).
+# shows is range partitioned on start_time (migration a7c3e91d5b02): a cold
+# shows_archive partition for the past, one partition per month from the
+# month of the migration on, and shows_default for shows booked beyond the
+# last month. Queries on upcoming shows only scan the hot partitions.
+# `flask fyyur partitions` keeps monthly partitions created ahead and can
+# detach the old ones to the archive schema, taking their shows off the site.
+# The archived range is then covered by shows_archived, an empty partition
+# whose CHECK (false) constraint refuses new shows dated in it; without it
+# they would silently land in shows_default.
+#----------------------------------------------------------------------------#
+
+ARCHIVE_SCHEMA = 'archive'
+
+# Empty partition standing for the archived range
+ARCHIVED = 'shows_archived'
+
+BOUND = re.compile(r"FROM \((?:MINVALUE|'([^']+)')\) TO \((?:MAXVALUE|'([^']+)')\)")
+
+def partition_name(month):
+  return 'shows_%04d_%02d' % (month.year, month.month)
+
+def is_partitioned():
+  if db.engine.dialect.name != 'postgresql':
+    return False
+  return db.session.execute("SELECT relkind FROM pg_class WHERE oid = 'shows'::regclass").scalar() == 'p'
+
+# (name, start, end) of the partitions, None standing for an open bound; the default partition has no bounds
+def partitions():
+  rows = db.session.execute('''
+    SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+    FROM pg_inherits
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = 'shows'::regclass
+    ORDER BY child.relname
+  ''')
+  result = []
+  for name, bound in rows:
+    match = BOUND.search(bound)
+    start, end = (None, None) if match is None else match.groups()
+    result.append((
+      name,
+      datetime.fromisoformat(start) if start else None,
+      datetime.fromisoformat(end) if end else None,
+    ))
+  return result
+
+# Creates the partition of one month, moving its shows out of shows_default.
+# A CHECK constraint matching the bounds spares ATTACH a scan of the new table.
+def create_month_partition(month):
+  name = partition_name(month)
+  start, end = month.isoformat(' '), (month + relativedelta(months=1)).isoformat(' ')
+  statements = [
+    'CREATE TABLE %s (LIKE shows INCLUDING DEFAULTS)' % name,
+    "ALTER TABLE %s ADD CONSTRAINT %s_bounds CHECK (start_time >= '%s' AND start_time < '%s')" % (name, name, start, end),
+    "WITH moved AS (DELETE FROM shows_default WHERE start_time >= '%s' AND start_time < '%s' RETURNING *) "
+    "INSERT INTO %s SELECT * FROM moved" % (start, end, name),
+    "ALTER TABLE shows ATTACH PARTITION %s FOR VALUES FROM ('%s') TO ('%s')" % (name, start, end),
+    'ALTER TABLE %s DROP CONSTRAINT %s_bounds' % (name, name),
+  ]
+  for statement in statements:
+    db.session.execute(statement)
+  db.session.commit()
+
+# Detaches a partition ending at `end` and moves its table to the archive
+# schema, extending shows_archived over its range in the same transaction.
+# Returns the page cache tags of the venues/artists that lost shows.
+def archive_partition(name, end):
+  tags = ['venues', 'shows', 'calendar']
+  for column, prefix in (('venue_id', 'venue:'), ('artist_id', 'artist:')):
+    ids = db.session.execute('SELECT DISTINCT %s FROM %s' % (column, name))
+    tags += [prefix + str(id) for id, in ids]
+  db.session.execute('CREATE SCHEMA IF NOT EXISTS %s' % ARCHIVE_SCHEMA)
+  db.session.execute('ALTER TABLE shows DETACH PARTITION %s' % name)
+  db.session.execute('ALTER TABLE %s SET SCHEMA %s' % (name, ARCHIVE_SCHEMA))
+  close_archived_range(end)
+  db.session.commit()
+  return tags
+
+# End of the archived range, before which shows can't be booked, or None
+def archived_until():
+  if db.engine.dialect.name != 'postgresql':
+    return None
+  bound = db.session.execute('''
+    SELECT pg_get_expr(child.relpartbound, child.oid)
+    FROM pg_inherits
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = 'shows'::regclass AND child.relname = :name
+  ''', {'name': ARCHIVED}).scalar()
+  match = BOUND.search(bound) if bound else None
+  return datetime.fromisoformat(match.group(2)) if match and match.group(2) else None
+
+# (Re)attaches shows_archived over MINVALUE..end. It is empty, so detaching
+# and attaching it again is instant.
+def close_archived_range(end):
+  if db.session.execute("SELECT to_regclass('%s')" % ARCHIVED).scalar() is not None:
+    db.session.execute('ALTER TABLE shows DETACH PARTITION %s' % ARCHIVED)
+    db.session.execute('DROP TABLE %s' % ARCHIVED)
+  statements = [
+    'CREATE TABLE %s (LIKE shows INCLUDING DEFAULTS)' % ARCHIVED,
+    'ALTER TABLE %s ADD CONSTRAINT %s_closed CHECK (false)' % (ARCHIVED, ARCHIVED),
+    "ALTER TABLE shows ATTACH PARTITION %s FOR VALUES FROM (MINVALUE) TO ('%s')" % (ARCHIVED, end.isoformat(' ')),
+  ]
+  for statement in statements:
+    db.session.execute(statement)
+
+# Creates the missing monthly partitions up to `ahead` months after the current
+# one and, with `archive_before`, archives the partitions ending before it.
+# Returns the actions as printable lines; `dry_run` only returns them.
+def maintain_partitions(ahead, archive_before=None, dry_run=False, now=None):
+  now = now or datetime.utcnow()
+  current = datetime(now.year, now.month, 1)
+  existing = partitions()
+  names = {name for name, start, end in existing}
+  # months already covered by the archive partition don't get their own
+  covered_until = max([end for name, start, end in existing if start is None and end is not None] or [current])
+  actions = []
+  for i in range(ahead + 1):
+    month = current + relativedelta(months=i)
+    if partition_name(month) not in names and month >= covered_until:
+      actions.append('create %s' % partition_name(month))
+      if not dry_run:
+        create_month_partition(month)
+  if archive_before is not None:
+    tags = set()
+    # oldest first, so shows_archived grows one contiguous range at a time
+    archived = sorted((end, name) for name, start, end in existing
+                      if name != ARCHIVED and end is not None and end <= archive_before)
+    for end, name in archived:
+      actions.append('archive %s' % name)
+      if not dry_run:
+        tags.update(archive_partition(name, end))
+    page_cache.invalidate(sorted(tags))
+  return actions
+
+# Rows per partition, as (name, start, end, rows) with the estimated row counts of the statistics
+def partition_sizes():
+  sizes = dict(db.session.execute('''
+    SELECT child.relname, child.reltuples::bigint
+    FROM pg_inherits
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = 'shows'::regclass
+  '''))
+  return [(name, start, end, sizes.get(name, 0)) for name, start, end in partitions()]
@@ -0,0 +1,286 @@
+import base64
+from datetime import datetime, timedelta
+from itertools import groupby
+from sqlalchemy import func, select, union_all, literal, null, and_, or_
+from models import Venue, Artist, Show, Genre, venue_genres, artist_genres, db
+from cache import page_cache
+
+#----------------------------------------------------------------------------#
+# Set-based read queries.
+# Each helper returns plain dictionaries built from a fixed number of
+# queries, so the pages using them don't lazily load relationships per row.
+#----------------------------------------------------------------------------#
+
+# Shows starting after `now`. The condition goes in the WHERE or JOIN clause rather
+# than in a COUNT FILTER, so Postgres only scans the partitions of upcoming shows.
+def upcoming_shows(now=None):
+  if now is None:
+    now = datetime.now()
+  return Show.start_time > now
+
+# Artists ordered by id, optionally only those having the given genre
+def artists_list(genre=None):
+  query = db.session.query(Artist.id, Artist.name)
+  if genre:
+    query = filter_genre(query, artist_genres.c.artist_id, Artist.id, genre)
+  return [{'id': row.id, 'name': row.name} for row in query.order_by(Artist.id)]
+
+# Number of upcoming shows of each of the given venue/artist ids, in one grouped query
+def upcoming_counts(fk_column, ids, now=None):
+  if not ids:
+    return {}
+  rows = db.session.query(fk_column, func.count(Show.id)) \
+    .filter(fk_column.in_(ids), upcoming_shows(now)) \
+    .group_by(fk_column) \
+    .all()
+  counts = dict.fromkeys(ids, 0)
+  counts.update(rows)
+  return(counts)
+
+# Restricts a query over venues/artists to the ones having the named genre,
+# going through genres.name and the (genre_id, venue_id/artist_id) index
+def filter_genre(query, link_column, id_column, genre):
+  return query.join(link_column.table, link_column == id_column) \
+    .join(Genre, Genre.id == link_column.table.c.genre_id) \
+    .filter(Genre.name == genre)
+
+# Returns the venues grouped by city/state with their number of upcoming shows,
+# computed with a single grouped query (LEFT JOIN the shows starting after now, COUNT)
+def venues_by_area(genre=None, now=None):
+  query = db.session.query(
+      Venue.id,
+      Venue.name,
+      Venue.city,
+      Venue.state,
+      func.count(Show.id).label('num_upcoming_shows')
+    ).outerjoin(Show, and_(Show.venue_id == Venue.id, upcoming_shows(now)))
+  if genre:
+    query = filter_genre(query, venue_genres.c.venue_id, Venue.id, genre)
+  rows = query.group_by(Venue.id, Venue.name, Venue.city, Venue.state) \
+    .order_by(Venue.state, Venue.city, Venue.id) \
+    .all()
+
+  areas = []
+  for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+    entry = {}
+    entry['city'] = city
+    entry['state'] = state
+    entry['venues'] = [
+      {
+        'id': venue.id,
+        'name': venue.name,
+        'num_upcoming_shows': venue.num_upcoming_shows
+      } for venue in venues
+    ]
+    areas.append(entry)
+  return(areas)
+
+#----------------------------------------------------------------------------#
+# HTTP validators.
+# Each returns (etag, last_modified) from one indexed lookup, or None when
+# the entity doesn't exist.
+#----------------------------------------------------------------------------#
+
+# Show start times are local (datetime.now()), updated_at is UTC
+def local_to_utc(value):
+  offset = (datetime.utcnow() - datetime.now()).total_seconds()
+  return value + timedelta(minutes=round(offset / 60))
+
+# A venue/artist page shows the names of the other side of its shows, which
+# touch_updated_at keeps in updated_at, and splits its shows on now: the
+# validators change when its next upcoming show starts, and Last-Modified
+# follows the start of its latest past show
+def entity_validators(model, entity_id, now=None):
+  if now is None:
+    now = datetime.now()
+  fk_column = Show.venue_id if model is Venue else Show.artist_id
+  next_start = select([func.min(Show.start_time)]).where(and_(fk_column == entity_id, Show.start_time > now))
+  last_start = select([func.max(Show.start_time)]).where(and_(fk_column == entity_id, Show.start_time <= now))
+  row = db.session.query(model.updated_at, next_start.label('next_start'), last_start.label('last_start')) \
+    .filter(model.id == entity_id) \
+    .first()
+  if row is None:
+    return None
+  updated_at, next_start, last_start = row
+  last_modified = updated_at
+  if last_start is not None:
+    last_modified = max(last_modified, local_to_utc(last_start))
+  etag = '%s-%s-%s-%s' % (model.__tablename__, entity_id, updated_at.isoformat(),
+                          next_start.isoformat() if next_start else '')
+  return etag, last_modified
+
+# A listing changes with the page cache version of its tag ('venues', 'artists'),
+# bumped by every commit touching what it shows, which costs no query. The
+# venues listing also counts upcoming shows, which change when the next
+# upcoming show starts (one lookup on the start_time index). Listings have
+# no Last-Modified.
+def listing_validators(tag, upcoming=False, now=None):
+  versions = page_cache.tag_versions([tag])
+  if versions is None:
+    return None
+  etag = '%s-%s-%s' % (tag, page_cache.backend.token, versions[0])
+  if upcoming:
+    next_start = db.session.query(func.min(Show.start_time)).filter(upcoming_shows(now)).scalar()
+    etag += '-' + (next_start.isoformat() if next_start else '')
+  return etag, None
+
+# Totals of past/upcoming shows shown on a venue/artist page are counted up
+# to this many shows, larger histories showing as "1000+"
+SHOWS_COUNT_CAP = 1000
+
+# Returns the past and upcoming shows of one venue/artist in a single query.
+# Each side is partitioned by start_time in the database, capped to `limit` rows
+# (soonest upcoming first, latest past first), and counted up to `count_cap`
+# rows by a separate branch, so neither depends on the size of the history.
+def split_shows(fk_column, entity_id, joined, columns, limit, now=None, count_cap=SHOWS_COUNT_CAP):
+  if now is None:
+    now = datetime.now()
+  sides = (
+    ('upcoming_shows', Show.start_time > now, Show.start_time.asc()),
+    ('past_shows', Show.start_time <= now, Show.start_time.desc()),
+  )
+  branches = []
+  for key, condition, order in sides:
+    matching = and_(fk_column == entity_id, condition)
+    if limit > 0:
+      branch = select(
+          [Show.id, Show.start_time] + columns + [
+            literal(key).label('side'),
+            func.row_number().over(order_by=[order, Show.id]).label('position'),
+            null().label('total')
+          ]
+        ).select_from(Show.__table__.join(joined.__table__)) \
+        .where(matching) \
+        .order_by(order, Show.id) \
+        .limit(limit) \
+        .alias()
+      branches.append(select([branch]))
+    # the count reads at most count_cap + 1 index entries
+    first = select([Show.id]).where(matching).limit(count_cap + 1).alias()
+    branches.append(
+      select([null().label('id'), null().label('start_time')] + [null().label(column.key) for column in columns] + [
+        literal(key).label('side'),
+        literal(0).label('position'),
+        func.count().label('total')
+      ]).select_from(first)
+    )
+  query = union_all(*branches).order_by('side', 'position')
+
+  shows_dict = {}
+  for key, condition, order in sides:
+    shows_dict[key] = []
+    shows_dict[key + '_count'] = 0
+  for row in db.session.execute(query):
+    if row['position'] == 0:
+      total = row['total']
+      shows_dict[row['side'] + '_count'] = total if total <= count_cap else '%d+' % count_cap
+      continue
+    entry = {}
+    entry['id'] = row['id']
+    for column in columns:
+      entry[column.key] = row[column.key]
+    entry['start_time'] = row['start_time']
+    shows_dict[row['side']].append(entry)
+  return(shows_dict)
+
+# Venue page data: the venue and its capped past/upcoming shows in two queries
+def venue_detail(venue_id, limit, now=None, count_cap=SHOWS_COUNT_CAP):
+  venue = Venue.query.get(venue_id)
+  if venue is None:
+    return None
+  shows = split_shows(Show.venue_id, venue_id, Artist, [
+      Artist.id.label('artist_id'),
+      Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link')
+    ], limit, now, count_cap)
+  return(venue.adjust_data(shows))
+
+# Artist page data: the artist and its capped past/upcoming shows in two queries
+def artist_detail(artist_id, limit, now=None, count_cap=SHOWS_COUNT_CAP):
+  artist = Artist.query.get(artist_id)
+  if artist is None:
+    return None
+  shows = split_shows(Show.artist_id, artist_id, Venue, [
+      Venue.id.label('venue_id'),
+      Venue.name.label('venue_name'),
+      Venue.image_link.label('venue_image_link')
+    ], limit, now, count_cap)
+  return(artist.adjust_data(shows))
+
+#----------------------------------------------------------------------------#
+# Shows listing.
+# /shows is paginated with a keyset on (start_time, id), newest first, so a
+# page costs the same whatever its depth. The cursor is opaque to clients.
+#----------------------------------------------------------------------------#
+
+def encode_cursor(start_time, show_id):
+  raw = start_time.isoformat() + '|' + str(show_id)
+  return base64.urlsafe_b64encode(raw.encode()).decode()
+
+# Returns the (start_time, id) pair of a cursor, raising ValueError if it can't be decoded
+def decode_cursor(cursor):
+  try:
+    start_time, show_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(start_time), int(show_id)
+  except (ValueError, UnicodeDecodeError):
+    raise ValueError('invalid cursor: %r' % cursor)
+
+# Shows with their venue and artist columns joined in the same query
+def shows_listing_query():
+  return db.session.query(
+      Show.id,
+      Show.start_time,
+      Venue.id.label('venue_id'),
+      Venue.name.label('venue_name'),
+      Artist.id.label('artist_id'),
+      Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link')
+    ).join(Venue, Show.venue_id == Venue.id) \
+    .join(Artist, Show.artist_id == Artist.id) \
+    .order_by(Show.start_time.desc(), Show.id.desc())
+
+# One page of shows starting strictly after the `after` key, and the key of its last row
+def shows_after(after, limit):
+  query = shows_listing_query()
+  if after is not None:
+    start_time, show_id = after
+    # the plain bound lets the start_time index drive the scan
+    query = query.filter(Show.start_time <= start_time, or_(
+      Show.start_time < start_time,
+      and_(Show.start_time == start_time, Show.id < show_id)
+    ))
+  rows = query.limit(limit).all()
+  data = []
+  for row in rows:
+    data.append({
+      'id': row.id,
+      'venue_id': row.venue_id,
+      'venue_name': row.venue_name,
+      'artist_id': row.artist_id,
+      'artist_name': row.artist_name,
+      'artist_image_link': row.artist_image_link,
+      'start_time': row.start_time
+    })
+  last = (rows[-1].start_time, rows[-1].id) if rows else None
+  return data, last
+
+# Returns a page of shows and the cursor of the next page (None on the last page).
+# A cursor that can't be decoded raises ValueError rather than restarting at page one.
+def shows_page(limit, cursor=None):
+  after = decode_cursor(cursor) if cursor else None
+  data, last = shows_after(after, limit + 1)
+  if len(data) <= limit:
+    return data, None
+  data = data[:limit]
+  last = data[-1]
+  return data, encode_cursor(last['start_time'], last['id'])
+
+# Yields every show, fetching `batch_size` rows at a time by keyset so memory stays flat
+def iter_shows(batch_size=500):
+  after = None
+  while True:
+    data, after = shows_after(after, batch_size)
+    for entry in data:
+      yield entry
+    if len(data) < batch_size:
+      return
@@ -0,0 +1,69 @@
+import bisect
+from datetime import datetime
+from dateutil import rrule
+from sqlalchemy import or_
+from models import Venue, Artist, Show, db
+from cache import page_cache, show_day_tags
+
+#----------------------------------------------------------------------------#
+# Scheduling.
+# A show, or every occurrence of a recurrence rule (a weekly residency, a
+# monthly night...), is booked in one transaction: the venue and artist rows
+# are locked, their shows around the requested times are read with one range
+# query on the (venue_id, start_time)/(artist_id, start_time) indexes, and
+# when nothing overlaps all the shows are written with one multi-row INSERT.
+#----------------------------------------------------------------------------#
+
+FREQUENCIES = {
+  'daily': rrule.DAILY,
+  'weekly': rrule.WEEKLY,
+  'monthly': rrule.MONTHLY,
+}
+
+# Start times of `count` occurrences of the rule, from `start` on
+def occurrences(start, frequency='weekly', count=1, interval=1):
+  if frequency not in FREQUENCIES:
+    raise ValueError('frequency must be one of ' + ', '.join(FREQUENCIES))
+  if count < 1 or interval < 1:
+    raise ValueError('count and interval must be positive')
+  return list(rrule.rrule(FREQUENCIES[frequency], dtstart=start, count=count, interval=interval))
+
+# Existing shows of the venue or the artist starting less than `length` from
+# one of the (sorted) start times, as (requested start time, show) pairs
+def find_conflicts(venue_id, artist_id, start_times, length):
+  shows = Show.query \
+    .filter(or_(Show.venue_id == venue_id, Show.artist_id == artist_id)) \
+    .filter(Show.start_time > start_times[0] - length, Show.start_time < start_times[-1] + length) \
+    .order_by(Show.start_time) \
+    .all()
+  conflicts = []
+  for show in shows:
+    # the requested times closest to the show, on either side
+    i = bisect.bisect_left(start_times, show.start_time)
+    for start_time in start_times[max(i - 1, 0):i + 1]:
+      if abs(start_time - show.start_time) < length:
+        conflicts.append((start_time, show))
+        break
+  return conflicts
+
+# Books the shows, or returns the conflicts and writes nothing.
+# Returns (rows inserted, conflicts); the caller rolls back when there are conflicts.
+def schedule_shows(venue_id, artist_id, start_times, length):
+  start_times = sorted(start_times)
+  # concurrent bookings of the same venue or artist wait for this transaction;
+  # every booking locks the venue first, then the artist
+  db.session.query(Venue.id).filter(Venue.id == venue_id).with_for_update().all()
+  db.session.query(Artist.id).filter(Artist.id == artist_id).with_for_update().all()
+  conflicts = find_conflicts(venue_id, artist_id, start_times, length)
+  if conflicts:
+    return [], conflicts
+
+  rows = [{'venue_id': venue_id, 'artist_id': artist_id, 'start_time': start_time} for start_time in start_times]
+  db.session.execute(Show.__table__.insert().values(rows))
+  # the insert skips the session events, so updated_at and the cache are kept here
+  now = datetime.utcnow()
+  Venue.query.filter(Venue.id == venue_id).update({Venue.updated_at: now}, synchronize_session=False)
+  Artist.query.filter(Artist.id == artist_id).update({Artist.updated_at: now}, synchronize_session=False)
+  db.session.commit()
+  page_cache.invalidate(['venues', 'shows', 'venue:%d' % venue_id, 'artist:%d' % artist_id] + sorted(show_day_tags(start_times)))
+  return rows, []
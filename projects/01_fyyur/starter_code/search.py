@@ -0,0 +1,247 @@
+import re
+import threading
+from collections import Counter
+from sqlalchemy import event, func, or_
+from sqlalchemy.orm import Session
+from models import Venue, Artist, db
+
+#----------------------------------------------------------------------------#
+# Name search.
+# On Postgres the names are matched through the pg_trgm GIN indexes created by
+# the trigram migration (ILIKE substring or `%` similarity). Other databases
+# (SQLite in the tests) use an in-process trigram index kept in sync with the
+# writes committed by this process only: it is meant for a single process,
+# other workers' writes are only seen once their index is rebuilt. Results
+# rank substring matches first, then by similarity, so small typos
+# ("Musicl Hop") still find the venue. Terms without three letters in a row
+# ("A") have no trigram to look up: they are matched by reading every name
+# (a scan of the in-process names, or an ILIKE pg_trgm can't serve).
+#----------------------------------------------------------------------------#
+
+# Same default as pg_trgm.similarity_threshold
+SIMILARITY_THRESHOLD = 0.3
+
+# pg_trgm splits on anything but letters and digits
+WORD = re.compile(r'[^\W_]+')
+
+# Trigrams of the lowercased words, each padded like pg_trgm so short words still get some
+def trigrams(text):
+  grams = set()
+  for word in WORD.findall(text.lower()):
+    padded = '  ' + word + ' '
+    grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+  return grams
+
+# Unpadded trigrams inside the words of the term, which any name containing the term also has
+def inner_trigrams(text):
+  grams = set()
+  for word in WORD.findall(text.lower()):
+    grams.update(word[i:i + 3] for i in range(len(word) - 2))
+  return grams
+
+def escape_like(term):
+  return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class NgramIndex:
+  # In-process trigram index over the `name` column of a model.
+  # Postings are sets of ids, so the postings of the previous name of a
+  # renamed or deleted row are pruned in constant time per trigram.
+  def __init__(self, model):
+    self.model = model
+    self.names = None
+    self.sizes = {}
+    self.postings = {}
+    self.lock = threading.Lock()
+
+  def build(self):
+    names = {}
+    sizes = {}
+    postings = {}
+    for id, name in db.session.query(self.model.id, self.model.name).yield_per(10000):
+      grams = trigrams(name)
+      names[id] = name
+      sizes[id] = len(grams)
+      for gram in grams:
+        postings.setdefault(gram, set()).add(id)
+    self.names = names
+    self.sizes = sizes
+    self.postings = postings
+
+  def ensure_built(self):
+    if self.names is None:
+      with self.lock:
+        if self.names is None:
+          self.build()
+
+  def reset(self):
+    with self.lock:
+      self.names = None
+      self.sizes = {}
+      self.postings = {}
+
+  def apply(self, changes):
+    # changes are (id, name) pairs, name being None for deleted rows
+    with self.lock:
+      if self.names is None:
+        return
+      for id, name in changes:
+        previous = self.names.get(id)
+        if previous == name:
+          continue
+        if previous is not None:
+          self.prune(id, previous)
+        if name is None:
+          continue
+        grams = trigrams(name)
+        self.names[id] = name
+        self.sizes[id] = len(grams)
+        for gram in grams:
+          self.postings.setdefault(gram, set()).add(id)
+
+  # Drops a row and the postings of its previous name
+  def prune(self, id, name):
+    del self.names[id]
+    del self.sizes[id]
+    for gram in trigrams(name):
+      posting = self.postings.get(gram)
+      if posting is None:
+        continue
+      posting.discard(id)
+      if not posting:
+        del self.postings[gram]
+
+  # Returns {id: number of trigrams shared with the term} for the possible matches
+  def candidates(self, term):
+    term_grams = trigrams(term)
+    inner = inner_trigrams(term)
+    counts = Counter()
+    for gram in term_grams:
+      counts.update(self.postings.get(gram, ()))
+    # a similar name shares at least SIMILARITY_THRESHOLD of the term's trigrams
+    similar = SIMILARITY_THRESHOLD * len(term_grams)
+    if not inner:
+      # no trigram inside a word of the term ('', 'A', 'a b'): the names
+      # containing it are found by reading them all
+      lowered = term.lower()
+      found = {id: counts[id] for id, name in self.names.items() if lowered in name.lower()}
+      found.update((id, shared) for id, shared in counts.items() if shared >= similar)
+      return found
+    # a name containing the term has all its inner trigrams
+    needed = min(len(inner), similar)
+    return {id: shared for id, shared in counts.items() if shared >= needed}
+
+  # With prefix=True names starting with the term are ranked first (typeahead)
+  def search(self, term, limit, offset, prefix=False):
+    self.ensure_built()
+    lowered = term.lower()
+    term_grams = trigrams(term)
+    term_size = len(term_grams)
+    matches = []
+    for id, shared in self.candidates(term).items():
+      name = self.names.get(id)
+      if name is None:
+        continue
+      size = self.sizes[id]
+      score = shared / (term_size + size - shared)
+      substring = lowered in name.lower()
+      if substring or score >= SIMILARITY_THRESHOLD:
+        starts = prefix and name.lower().startswith(lowered)
+        matches.append((not starts, not substring, -score, id, name, score))
+    matches.sort()
+    page = matches[offset:offset + limit]
+    return len(matches), [{'id': id, 'name': name, 'score': score} for _, _, _, id, name, score in page]
+
+
+class SearchEngine:
+  # Ranked, paginated name search over one model (Venue or Artist)
+  def __init__(self, model):
+    self.model = model
+    self.index = NgramIndex(model)
+
+  def search(self, term, limit=10, page=1):
+    term = term.strip()
+    offset = (max(page, 1) - 1) * limit
+    if db.engine.dialect.name == 'postgresql':
+      count, data = self.search_trigram(term, limit, offset)
+    else:
+      count, data = self.index.search(term, limit, offset)
+    return {'count': count, 'data': data, 'page': max(page, 1), 'limit': limit}
+
+  # Id and name of the best `limit` matches for a picker, names starting
+  # with the term first
+  def typeahead(self, term, limit=10):
+    term = term.strip()
+    if not term:
+      return []
+    if db.engine.dialect.name == 'postgresql':
+      return self.typeahead_trigram(term, limit)
+    count, data = self.index.search(term, limit, 0, prefix=True)
+    return [{'id': entry['id'], 'name': entry['name']} for entry in data]
+
+  # Same matches as search_trigram without the total, selecting only id and name
+  def typeahead_trigram(self, term, limit):
+    model = self.model
+    starts = model.name.ilike(escape_like(term) + '%')
+    substring = model.name.ilike('%' + escape_like(term) + '%')
+    rows = db.session.query(model.id, model.name) \
+      .filter(self.matches(term)) \
+      .order_by(starts.desc(), substring.desc(), func.similarity(model.name, term).desc(), model.id) \
+      .limit(limit) \
+      .all()
+    return [{'id': row.id, 'name': row.name} for row in rows]
+
+  # Names containing or similar to the term; the GIN index serves both unless
+  # the term has no trigram ('A'), which then reads the whole table
+  def matches(self, term):
+    model = self.model
+    return or_(model.name.ilike('%' + escape_like(term) + '%'), model.name.op('%')(term))
+
+  # pg_trgm backed search, served by the GIN (name gin_trgm_ops) indexes
+  def search_trigram(self, term, limit, offset):
+    model = self.model
+    substring = model.name.ilike('%' + escape_like(term) + '%')
+    score = func.similarity(model.name, term)
+    rows = db.session.query(
+        model.id,
+        model.name,
+        score.label('score'),
+        func.count().over().label('total')
+      ).filter(self.matches(term)) \
+      .order_by(substring.desc(), score.desc(), model.id) \
+      .limit(limit) \
+      .offset(offset) \
+      .all()
+    count = rows[0].total if rows else 0
+    return count, [{'id': row.id, 'name': row.name, 'score': row.score} for row in rows]
+
+
+venue_search = SearchEngine(Venue)
+artist_search = SearchEngine(Artist)
+engines = {Venue: venue_search, Artist: artist_search}
+
+#----------------------------------------------------------------------------#
+# Index maintenance.
+# Name changes are collected per session on flush and only applied to the
+# in-process indexes once the transaction commits.
+#----------------------------------------------------------------------------#
+
+@event.listens_for(Session, 'after_flush')
+def collect_name_changes(session, flush_context):
+  changes = session.info.setdefault('search_changes', [])
+  for obj in list(session.new) + list(session.dirty):
+    if type(obj) in engines:
+      changes.append((type(obj), obj.id, obj.name))
+  for obj in session.deleted:
+    if type(obj) in engines:
+      changes.append((type(obj), obj.id, None))
+
+@event.listens_for(Session, 'after_commit')
+def apply_name_changes(session):
+  changes = session.info.pop('search_changes', [])
+  for model, engine in engines.items():
+    engine.index.apply([(id, name) for kind, id, name in changes if kind is model])
+
+@event.listens_for(Session, 'after_soft_rollback')
+def discard_name_changes(session, previous_transaction):
+  session.info.pop('search_changes', None)
@@ -2,3 +2,35 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Fills the datalist of a .typeahead input from its data-url as the user types,
+// and copies the id of the picked name into the field named by data-target
+document.addEventListener('DOMContentLoaded', function () {
+  document.querySelectorAll('input.typeahead').forEach(function (input) {
+    var options = document.getElementById(input.getAttribute('list'));
+    var target = document.getElementById(input.dataset.target);
+    var ids = {};
+    var timer = null;
+    input.addEventListener('input', function () {
+      if (ids[input.value] !== undefined) {
+        target.value = ids[input.value];
+        return;
+      }
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        if (!input.value.trim()) return;
+        fetch(input.dataset.url + '?q=' + encodeURIComponent(input.value))
+          .then(function (response) { return response.json(); })
+          .then(function (result) {
+            options.innerHTML = '';
+            result.data.forEach(function (entry) {
+              var option = document.createElement('option');
+              option.value = entry.name + ' (id:' + entry.id + ')';
+              ids[option.value] = entry.id;
+              options.appendChild(option);
+            });
+          });
+      }, 150);
+    });
+  });
+});
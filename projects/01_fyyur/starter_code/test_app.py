@@ -0,0 +1,912 @@
+import json
+import logging
+import os
+import queue
+import tempfile
+import unittest
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+from flask import g
+from sqlalchemy import event
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import app
+from models import db, Venue, Artist, Show, Genre
+from search import engines, venue_search, artist_search
+from facets import venue_facets, artist_facets
+from cache import page_cache
+from formatters import format_datetime
+from generator import Generator
+from instrumentation import RequestStats, normalize
+from logs import DroppingQueueHandler, JsonFormatter, start_request
+from deletion import delete_shows_in_batches, background_deletes
+from partitions import BOUND
+
+
+@contextmanager
+def count_queries(engine):
+    """Counts the statements sent to the database inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def explain(query):
+    """Returns the database's plan for an ORM query as text"""
+    statement = query.statement.compile(dialect=db.engine.dialect)
+    params = statement.params
+    if statement.positional:
+        params = tuple(params[name] for name in statement.positiontup)
+    connection = db.session.connection()
+    if db.engine.dialect.name == 'postgresql':
+        # the test tables are tiny, so make sequential scans look as expensive as on a large table
+        connection.execute('SET LOCAL enable_seqscan = off')
+        rows = connection.execute('EXPLAIN ' + str(statement), params)
+    else:
+        rows = connection.execute('EXPLAIN QUERY PLAN ' + str(statement), params)
+    return '\n'.join(str(row[-1]) for row in rows)
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        for engine in engines.values():
+            engine.index.reset()
+        for browse in (venue_facets, artist_facets):
+            browse.counts_cache.clear()
+        page_cache.clear()
+
+    def tearDown(self):
+        """Executed after reach test"""
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def add_venues(self, count, city='San Francisco', state='CA', genres=['Jazz']):
+        artist = Artist(name='Artist', genres=Genre.from_names(genres), city=city, state=state)
+        db.session.add(artist)
+        now = datetime.now()
+        for i in range(count):
+            venue = Venue(name=f'Venue {i}', genres=Genre.from_names(genres), address='1 Main St', city=city, state=state)
+            venue.shows = [
+                Show(artist=artist, start_time=now + timedelta(days=1)),
+                Show(artist=artist, start_time=now + timedelta(days=2)),
+                Show(artist=artist, start_time=now - timedelta(days=1)),
+            ]
+            db.session.add(venue)
+        db.session.commit()
+
+    def test_venues_grouped_by_area(self):
+        """ /venues groups venues by city and state """
+        self.add_venues(2, city='San Francisco', state='CA')
+        self.add_venues(1, city='New York', state='NY')
+
+        res = self.client().get('/venues')
+        body = res.get_data(as_text=True)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('San Francisco, CA', body)
+        self.assertIn('New York, NY', body)
+
+    def test_venues_by_area_counts_upcoming_shows(self):
+        """ Upcoming shows are counted by the database """
+        from queries import venues_by_area
+        self.add_venues(3)
+
+        areas = venues_by_area()
+
+        self.assertEqual(len(areas), 1)
+        self.assertEqual(len(areas[0]['venues']), 3)
+        for venue in areas[0]['venues']:
+            self.assertEqual(venue['num_upcoming_shows'], 2)
+
+    def test_venues_query_budget(self):
+        """ /venues issues the same number of queries whatever the venue count """
+        self.add_venues(5)
+        with count_queries(db.engine) as small:
+            self.client().get('/venues')
+
+        self.add_venues(50, city='Austin', state='TX')
+        with count_queries(db.engine) as large:
+            self.client().get('/venues')
+
+        # the conditional GET validators and the grouped venues query
+        self.assertLessEqual(len(large), 2)
+        self.assertEqual(len(small), len(large))
+
+    def test_venue_detail_splits_and_caps_shows(self):
+        """ Venue page data holds capped past/upcoming lists with their totals """
+        from queries import venue_detail
+        self.add_venues(1)
+        now = datetime.now()
+        for days in range(1, 6):
+            db.session.add(Show(venue_id=1, artist_id=1, start_time=now - timedelta(days=days * 10)))
+        db.session.commit()
+        db.session.expunge_all()
+
+        with count_queries(db.engine) as statements:
+            data = venue_detail(1, 2)
+
+        self.assertEqual(len(statements), 2)
+        self.assertEqual(data['upcoming_shows_count'], 2)
+        self.assertEqual(data['past_shows_count'], 6)
+        self.assertEqual(len(data['past_shows']), 2)
+        self.assertEqual(data['past_shows'][0]['artist_name'], 'Artist')
+        self.assertGreater(data['past_shows'][0]['start_time'], data['past_shows'][1]['start_time'])
+        self.assertLess(data['upcoming_shows'][0]['start_time'], data['upcoming_shows'][1]['start_time'])
+
+    def test_venue_detail_counts_are_capped_and_independent_of_limit(self):
+        """ Show totals are counted up to the cap, with or without listed shows """
+        from queries import venue_detail
+        self.add_venues(1)
+        now = datetime.now()
+        for days in range(1, 6):
+            db.session.add(Show(venue_id=1, artist_id=1, start_time=now - timedelta(days=days * 10)))
+        db.session.commit()
+
+        data = venue_detail(1, 0)
+        self.assertEqual((data['upcoming_shows_count'], data['past_shows_count']), (2, 6))
+        self.assertEqual(data['past_shows'], [])
+
+        data = venue_detail(1, 1, count_cap=3)
+        self.assertEqual((data['upcoming_shows_count'], data['past_shows_count']), (2, '3+'))
+        self.assertEqual(len(data['past_shows']), 1)
+
+    def test_show_venue_and_artist_pages(self):
+        """ Venue and artist pages render, unknown ids give a 404 """
+        self.add_venues(1)
+
+        self.assertEqual(self.client().get('/venues/1').status_code, 200)
+        self.assertEqual(self.client().get('/artists/1').status_code, 200)
+        self.assertEqual(self.client().get('/venues/1000').status_code, 404)
+        self.assertEqual(self.client().get('/artists/1000').status_code, 404)
+
+    def test_search_substring_and_typos(self):
+        """ Venue search matches substrings and tolerates typos """
+        for name in ['The Musical Hop', 'Park Square Live Music & Coffee', 'The Dueling Pianos Bar']:
+            db.session.add(Venue(name=name, address='1 Main St', city='Austin', state='TX'))
+        db.session.commit()
+
+        names = [entry['name'] for entry in venue_search.search('Music')['data']]
+        self.assertEqual(sorted(names), ['Park Square Live Music & Coffee', 'The Musical Hop'])
+        self.assertEqual(venue_search.search('Hop')['data'][0]['name'], 'The Musical Hop')
+        self.assertEqual(venue_search.search('Musicl Hop')['data'][0]['name'], 'The Musical Hop')
+        self.assertEqual(venue_search.search('zzzz')['count'], 0)
+
+    def test_search_follows_commits_and_paginates(self):
+        """ The search index sees committed renames and results are paginated """
+        self.add_venues(5)
+        self.assertEqual(venue_search.search('Venue', limit=2, page=3)['count'], 5)
+        self.assertEqual(len(venue_search.search('Venue', limit=2, page=3)['data']), 1)
+
+        venue = Venue.query.get(1)
+        venue.name = 'Blue Note'
+        db.session.commit()
+        db.session.delete(Venue.query.get(2))
+        db.session.commit()
+
+        self.assertEqual(venue_search.search('Venue')['count'], 3)
+        self.assertEqual(venue_search.search('Blue Note')['data'][0]['id'], 1)
+
+    def test_search_index_prunes_postings(self):
+        """ Renamed and deleted names leave no postings """
+        for name in ['Blue Note', 'The Blues Bar']:
+            db.session.add(Venue(name=name, address='1 Main St', city='Austin', state='TX'))
+        db.session.commit()
+        index = venue_search.index
+        index.ensure_built()
+
+        venue = Venue.query.get(1)
+        venue.name = 'Jazz Club'
+        db.session.commit()
+        db.session.delete(Venue.query.get(2))
+        db.session.commit()
+
+        self.assertEqual(sorted(id for posting in index.postings.values() for id in posting), [1] * len(index.postings))
+        self.assertEqual([entry['name'] for entry in venue_search.search('ja')['data']], ['Jazz Club'])
+        self.assertEqual(venue_search.search('ue')['count'], 0)
+
+    def test_search_short_terms_match_substrings(self):
+        """ Terms too short for a trigram still match anywhere in the name, case-insensitively """
+        for name in ['Guns N Petals', 'Matt Quevado', 'The Wild Sax Band', 'Bo Diddley']:
+            db.session.add(Artist(name=name, city='Austin', state='TX'))
+        db.session.commit()
+
+        names = [entry['name'] for entry in artist_search.search('A')['data']]
+        self.assertEqual(sorted(names), ['Guns N Petals', 'Matt Quevado', 'The Wild Sax Band'])
+        self.assertEqual([entry['name'] for entry in artist_search.search('dd')['data']], ['Bo Diddley'])
+        self.assertEqual(artist_search.search('')['count'], 4)
+
+    def test_search_artists_endpoint(self):
+        """ /artists/search lists matching artists """
+        self.add_venues(1)
+
+        res = self.client().post('/artists/search', data={'search_term': 'art'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Artist', res.get_data(as_text=True))
+        self.assertEqual(artist_search.search('Artst')['count'], 1)
+
+    def test_venue_shows_use_index(self):
+        """ Venue shows split on start_time are read from (venue_id, start_time) """
+        query = Show.query.filter(Show.venue_id == 1, Show.start_time > datetime.now()).order_by(Show.start_time)
+        self.assertIn('ix_shows_venue_id_start_time', explain(query))
+
+    def test_artist_shows_use_index(self):
+        """ Artist shows split on start_time are read from (artist_id, start_time) """
+        query = Show.query.filter(Show.artist_id == 1, Show.start_time <= datetime.now()).order_by(Show.start_time.desc())
+        self.assertIn('ix_shows_artist_id_start_time', explain(query))
+
+    def test_shows_ordering_uses_index(self):
+        """ /shows ordering by start_time walks the start_time index """
+        query = Show.query.order_by(db.desc(Show.start_time)).limit(10)
+        self.assertIn('ix_shows_start_time', explain(query))
+
+    def test_shows_keyset_pages(self):
+        """ Walking the /shows cursors lists every show once, newest first """
+        from queries import shows_page
+        self.add_venues(7)
+
+        seen = []
+        data, cursor = shows_page(4)
+        seen.extend(data)
+        while cursor:
+            data, cursor = shows_page(4, cursor)
+            seen.extend(data)
+
+        self.assertEqual(len(seen), 21)
+        self.assertEqual(len({show['id'] for show in seen}), 21)
+        self.assertEqual(seen, sorted(seen, key=lambda show: (show['start_time'], show['id']), reverse=True))
+
+    def test_shows_page_and_stream(self):
+        """ /shows renders a page with a cursor link, ?stream=1 renders all shows """
+        self.addCleanup(app.config.__setitem__, 'SHOWS_PER_PAGE', app.config['SHOWS_PER_PAGE'])
+        app.config['SHOWS_PER_PAGE'] = 2
+        self.add_venues(2)
+
+        res = self.client().get('/shows')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('/shows?cursor=', res.get_data(as_text=True))
+
+        res = self.client().get('/shows?stream=1')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.is_streamed)
+        self.assertEqual(res.get_data(as_text=True).count('tile-show'), 6)
+
+    def test_shows_rejects_malformed_cursor(self):
+        """ A cursor that can't be decoded gets a 400 instead of the first page """
+        import base64
+        self.add_venues(1)
+        tampered = base64.urlsafe_b64encode(b'2035-04-01T20:00|x').decode()
+
+        for cursor in ('not-a-cursor', tampered):
+            self.assertEqual(self.client().get('/shows?cursor=' + cursor).status_code, 400)
+
+    def test_genre_filters(self):
+        """ /venues?genre= and /artists?genre= only list matching entities """
+        from queries import venues_by_area, artists_list
+        self.add_venues(2, city='New York', state='NY', genres=['Jazz', 'Blues'])
+        self.add_venues(3, city='Austin', state='TX', genres=['Rock n Roll'])
+
+        areas = venues_by_area(genre='Jazz')
+        self.assertEqual([(area['city'], len(area['venues'])) for area in areas], [('New York', 2)])
+        self.assertEqual(len(artists_list(genre='Rock n Roll')), 1)
+        self.assertEqual(len(artists_list()), 2)
+        self.assertEqual(Genre.query.count(), 3)
+
+        res = self.client().get('/venues?genre=Rock n Roll')
+        self.assertIn('Austin, TX', res.get_data(as_text=True))
+        self.assertNotIn('New York, NY', res.get_data(as_text=True))
+
+    def test_genres_listed_on_venue_page(self):
+        """ Venue page data lists the venue's genre names """
+        from queries import venue_detail
+        self.add_venues(1, genres=['Jazz', 'Blues'])
+
+        self.assertEqual(venue_detail(1, 10)['genres'], ['Blues', 'Jazz'])
+
+    def test_browse_venues_facet_counts(self):
+        """ /venues/browse returns the filtered page and the counts of every facet """
+        self.add_venues(2, city='New York', state='NY', genres=['Jazz', 'Blues'])
+        self.add_venues(3, city='Austin', state='TX', genres=['Jazz'])
+        venue = Venue.query.filter_by(city='Austin').first()
+        venue.seeking_talent = False
+        Show.query.filter_by(venue_id=venue.id).delete()
+        db.session.commit()
+
+        res = self.client().get('/venues/browse?genre=Jazz')
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total'], 5)
+        self.assertEqual(len(data['data']), 5)
+        self.assertEqual(data['facets']['city'], {'New York': 2, 'Austin': 3})
+        self.assertEqual(data['facets']['genre'], {'Jazz': 5, 'Blues': 2})
+        self.assertEqual(data['facets']['seeking_talent'], {'true': 4, 'false': 1})
+        self.assertEqual(data['facets']['has_upcoming_shows'], {'true': 4, 'false': 1})
+
+        data = self.client().get('/venues/browse?state=TX&has_upcoming_shows=false').get_json()
+        self.assertEqual(data['total'], 1)
+        self.assertEqual(data['data'][0]['id'], venue.id)
+
+    def test_browse_counts_single_cached_query(self):
+        """ Facet counts take one query and are then served from the cache """
+        self.add_venues(1, genres=['Jazz', 'Blues'])
+        self.add_venues(1, genres=['Jazz'])
+
+        with count_queries(db.engine) as first:
+            artist_facets.counts({'genre': 'Jazz'})
+        with count_queries(db.engine) as second:
+            total, facets = artist_facets.counts({'genre': 'Jazz'})
+
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(second), 0)
+        self.assertEqual(total, 2)
+        self.assertIn('seeking_venues', facets)
+
+    def test_browse_counts_invalidated_by_writes(self):
+        """ Cached facet counts are dropped by commits to their entities or to shows """
+        self.add_venues(2)
+        self.assertEqual(venue_facets.counts({})[0], 2)
+        self.assertEqual(artist_facets.counts({})[1]['has_upcoming_shows'], {'true': 1})
+
+        db.session.add(Venue(name='New Venue', address='1 Main St', city='Austin', state='TX'))
+        db.session.commit()
+        self.assertEqual(venue_facets.counts({})[0], 3)
+
+        for show in Show.query.filter(Show.start_time > datetime.now()):
+            db.session.delete(show)
+        db.session.commit()
+        self.assertEqual(artist_facets.counts({})[1]['has_upcoming_shows'], {'false': 1})
+
+    def test_page_cache_hits_and_invalidation(self):
+        """ Venue pages are served from the cache until the venue changes """
+        self.add_venues(1)
+
+        self.client().get('/venues/1')
+        res = self.client().get('/venues/1')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(page_cache.stats()['hits'], 1)
+
+        # only the updated_at lookup of the conditional GET is left
+        with count_queries(db.engine) as statements:
+            self.client().get('/venues/1')
+        self.assertEqual(len(statements), 1)
+
+        venue = Venue.query.get(1)
+        venue.name = 'The Musical Hop'
+        db.session.commit()
+
+        res = self.client().get('/venues/1')
+        self.assertIn('The Musical Hop', res.get_data(as_text=True))
+        self.assertEqual(page_cache.stats()['hits'], 2)
+        self.assertEqual(page_cache.stats()['misses'], 2)
+
+    def test_page_cache_invalidated_by_related_writes(self):
+        """ Artist pages drop when a venue they list changes or a show is added """
+        self.add_venues(1)
+        self.client().get('/artists/1')
+        self.client().get('/artists')
+
+        venue = Venue.query.get(1)
+        venue.name = 'Park Square Live Music & Coffee'
+        db.session.commit()
+        self.assertIn('Park Square Live Music', self.client().get('/artists/1').get_data(as_text=True))
+
+        db.session.add(Show(venue_id=1, artist_id=1, start_time=datetime.now() + timedelta(days=3)))
+        db.session.commit()
+        self.assertIn('3 Upcoming', self.client().get('/artists/1').get_data(as_text=True))
+
+        self.client().get('/artists')
+        self.assertEqual(self.client().get('/cache/stats').get_json()['misses'], 4)
+
+    def test_conditional_get_on_venue_page(self):
+        """ A matching If-None-Match gets a 304 after one query """
+        self.add_venues(1)
+        res = self.client().get('/venues/1')
+        etag = res.headers['ETag']
+        self.assertTrue(res.headers['Last-Modified'])
+
+        with count_queries(db.engine) as statements:
+            res = self.client().get('/venues/1', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(len(statements), 1)
+
+        venue = Venue.query.get(1)
+        venue.phone = '123-456-7890'
+        db.session.commit()
+        res = self.client().get('/venues/1', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_venue_page_validators_follow_related_names_and_time(self):
+        """ Renaming an artist or a show starting changes the venue page validators """
+        from queries import entity_validators
+        self.add_venues(1)
+        etag = self.client().get('/venues/1').headers['ETag']
+
+        artist = Artist.query.get(1)
+        artist.name = 'Guns N Petals'
+        db.session.commit()
+        res = self.client().get('/venues/1', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Guns N Petals', res.get_data(as_text=True))
+
+        now = datetime.now()
+        later = now + timedelta(days=1, hours=1)
+        self.assertNotEqual(entity_validators(Venue, 1, now)[0], entity_validators(Venue, 1, later)[0])
+        self.assertGreater(entity_validators(Venue, 1, later)[1], entity_validators(Venue, 1, now)[1])
+
+    def test_listing_validators_skip_table_aggregates(self):
+        """ Listing validators come from tag versions and the next upcoming show """
+        from queries import listing_validators
+        self.add_venues(1)
+        artists_etag = self.client().get('/artists').headers['ETag']
+        venues_etag = self.client().get('/venues').headers['ETag']
+
+        with count_queries(db.engine) as statements:
+            self.assertEqual(self.client().get('/artists', headers={'If-None-Match': artists_etag}).status_code, 304)
+            self.assertEqual(self.client().get('/venues', headers={'If-None-Match': venues_etag}).status_code, 304)
+        self.assertEqual(len(statements), 1)
+
+        later = datetime.now() + timedelta(days=1, hours=1)
+        self.assertNotEqual(listing_validators('venues', upcoming=True)[0], listing_validators('venues', upcoming=True, now=later)[0])
+        db.session.add(Artist(name='New Artist'))
+        db.session.commit()
+        self.assertEqual(self.client().get('/artists', headers={'If-None-Match': artists_etag}).status_code, 200)
+
+    def test_show_writes_touch_venue_and_artist(self):
+        """ Adding or removing a show bumps updated_at of its venue and artist """
+        self.add_venues(1)
+        artist_etag = self.client().get('/artists/1').headers['ETag']
+        listing_etag = self.client().get('/venues').headers['ETag']
+        before = Venue.query.get(1).updated_at
+
+        db.session.add(Show(venue_id=1, artist_id=1, start_time=datetime.now()))
+        db.session.commit()
+        self.assertGreater(Venue.query.get(1).updated_at, before)
+        self.assertEqual(self.client().get('/artists/1', headers={'If-None-Match': artist_etag}).status_code, 200)
+
+        db.session.delete(Venue.query.get(1))
+        db.session.commit()
+        self.assertEqual(self.client().get('/venues', headers={'If-None-Match': listing_etag}).status_code, 200)
+        self.assertEqual(self.client().get('/venues/1').status_code, 404)
+
+    def test_delete_venue_cascades_shows_in_database(self):
+        """ Deleting a venue removes its shows with one statement and drops the artist page """
+        self.add_venues(2)
+        self.client().get('/artists/1')
+        before = Artist.query.get(1).updated_at
+        db.session.expire_all()
+
+        with count_queries(db.engine) as statements:
+            res = self.client().post('/venues/1/Delete')
+        self.assertEqual(res.status_code, 302)
+        self.assertFalse(any(statement.startswith('DELETE FROM shows') for statement in statements))
+        self.assertEqual(Show.query.filter_by(venue_id=1).count(), 0)
+        self.assertEqual(Show.query.count(), 3)
+        self.assertGreater(Artist.query.get(1).updated_at, before)
+        self.assertNotIn('Venue 0', self.client().get('/artists/1').get_data(as_text=True))
+
+        res = self.client().post('/artists/1/Delete')
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual(Show.query.count(), 0)
+        self.assertEqual(Venue.query.count(), 1)
+
+    def test_delete_forms_need_csrf_token(self):
+        """ Delete buttons post a CSRF token, filled in per session even on cached pages """
+        self.add_venues(2)
+        self.addCleanup(app.config.__setitem__, 'WTF_CSRF_ENABLED', False)
+        app.config['WTF_CSRF_ENABLED'] = True
+        self.client().get('/venues/1')
+
+        res = self.client().post('/venues/1/Delete')
+        self.assertEqual(res.status_code, 302)
+        self.assertIsNotNone(Venue.query.get(1))
+
+        # requests share the app context pushed by setUp, where Flask-WTF keeps the last token
+        g.pop('csrf_token', None)
+        client = self.client()
+        page = client.get('/venues/1').get_data(as_text=True)
+        self.assertNotIn('__page_csrf_token__', page)
+        token = page.split('name="csrf_token" value="')[1].split('"')[0]
+        self.assertEqual(client.post('/venues/1/Delete', data={'csrf_token': token}).status_code, 302)
+        self.assertEqual(Venue.query.filter_by(id=1).count(), 0)
+
+    def test_background_deletes_are_coalesced_and_bounded(self):
+        """ Deletes need a POST, one already running is not started again, waiting ones are capped """
+        self.add_venues(2)
+        self.addCleanup(background_deletes.in_flight.clear)
+        self.assertEqual(self.client().get('/venues/1/Delete').status_code, 405)
+
+        background_deletes.in_flight.add((Venue, 1))
+        res = self.client().post('/venues/1/Delete')
+        self.assertEqual(res.status_code, 302)
+        self.assertIsNotNone(Venue.query.get(1))
+
+        background_deletes.in_flight.update((Artist, id) for id in range(100, 100 + app.config['BACKGROUND_DELETE_PENDING']))
+        with self.assertRaises(RuntimeError):
+            background_deletes.submit(app, Venue, 2)
+        self.assertNotIn((Venue, 2), background_deletes.in_flight)
+
+    def test_delete_shows_in_batches(self):
+        """ Large show histories are deleted a batch per transaction, touching the other side """
+        self.add_venues(3)
+        before = Venue.query.get(2).updated_at
+
+        with count_queries(db.engine) as statements:
+            deleted = delete_shows_in_batches(Artist, 1, batch_size=4)
+        self.assertEqual(deleted, 9)
+        self.assertEqual(sum(1 for statement in statements if statement.startswith('DELETE FROM shows')), 3)
+        self.assertEqual(Show.query.count(), 0)
+        self.assertGreater(Venue.query.get(2).updated_at, before)
+
+    def test_datetime_filter_formats_objects_and_strings(self):
+        """ The datetime filter takes datetime objects as well as strings, and memoizes """
+        value = datetime(2035, 4, 1, 20, 0)
+        self.assertEqual(format_datetime(value, 'full'), 'Sunday April, 1, 2035 at 8:00PM')
+        self.assertEqual(format_datetime(str(value), 'full'), format_datetime(value, 'full'))
+        hits = format_datetime.cache_info().hits
+        format_datetime(value, 'full')
+        self.assertEqual(format_datetime.cache_info().hits, hits + 1)
+
+    def test_typeahead_ranks_prefix_matches_first(self):
+        """ /venues/typeahead returns id and name, names starting with the term first """
+        for name in ['The Jazz Hall', 'Jazz Club', 'Jazzy Lounge', 'Blue Note']:
+            db.session.add(Venue(name=name, address='1 Main St', city='Austin', state='TX'))
+        db.session.commit()
+
+        res = self.client().get('/venues/typeahead?q=jazz&limit=2')
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([entry['name'] for entry in data['data']], ['Jazz Club', 'Jazzy Lounge'])
+        self.assertEqual(set(data['data'][0]), {'id', 'name'})
+        self.assertEqual(self.client().get('/artists/typeahead?q=').get_json()['data'], [])
+
+    def test_new_show_form_does_not_load_artists_or_venues(self):
+        """ /shows/create renders without reading the artists and venues """
+        self.add_venues(3)
+        with count_queries(db.engine) as statements:
+            res = self.client().get('/shows/create')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(statements, [])
+
+    def test_create_show_checks_ids_exist(self):
+        """ A show for an unknown artist or venue is rejected before touching the shows table """
+        self.add_venues(1)
+        shows = Show.query.count()
+        form = {'artist_id': '1', 'venue_id': '99', 'start_time': '2035-04-01 20:00:00'}
+
+        res = self.client().post('/shows/create', data=form)
+        self.assertIn('There is no venue with this id', res.get_data(as_text=True))
+        self.assertEqual(Show.query.count(), shows)
+
+        form.update(artist_id='7', venue_id='1')
+        res = self.client().post('/shows/create', data=form)
+        self.assertIn('There is no artist with this id', res.get_data(as_text=True))
+        self.assertEqual(Show.query.count(), shows)
+
+    def test_create_show_rejects_double_booking(self):
+        """ A show starting while the venue is already booked is not listed """
+        self.add_venues(1)
+        db.session.add(Artist(name='Other Artist', city='San Francisco', state='CA'))
+        db.session.commit()
+        form = {'artist_id': '2', 'venue_id': '1', 'start_time': '2035-04-01T20:00'}
+
+        res = self.client().post('/shows/create', data=form)
+        self.assertIn('was successfully listed', res.get_data(as_text=True))
+        self.assertEqual(Show.query.filter_by(artist_id=2).count(), 1)
+
+        form.update(artist_id='1', start_time='2035-04-01T21:30')
+        res = self.client().post('/shows/create', data=form)
+        self.assertIn('already booked', res.get_data(as_text=True))
+        self.assertEqual(Show.query.filter_by(artist_id=1).count(), 3)
+
+    def test_schedule_recurring_shows_in_one_insert(self):
+        """ A weekly residency is checked with one range query and written with one INSERT """
+        self.add_venues(2)
+        db.session.add(Artist(name='Resident', city='San Francisco', state='CA'))
+        db.session.commit()
+        residency = {'venue_id': 1, 'artist_id': 2, 'start_time': '2035-01-05T21:00', 'frequency': 'weekly', 'count': 52}
+
+        with count_queries(db.engine) as statements:
+            res = self.client().post('/shows/schedule', json=residency)
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.get_json()['scheduled'], 52)
+        self.assertEqual(sum(1 for statement in statements if statement.startswith('INSERT INTO shows')), 1)
+        self.assertEqual(Show.query.filter_by(artist_id=2).count(), 52)
+        self.assertEqual(Show.query.filter_by(artist_id=2).order_by(Show.start_time.desc()).first().start_time,
+                         datetime(2035, 12, 28, 21, 0))
+
+        # the same artist at the second venue, overlapping the residency in June
+        res = self.client().post('/shows/schedule', json=dict(residency, venue_id=2, start_time='2035-06-01T22:00',
+                                                              frequency='daily', count=3))
+        self.assertEqual(res.status_code, 409)
+        self.assertEqual([conflict['booked'] for conflict in res.get_json()['conflicts']], ['artist'])
+        self.assertEqual(Show.query.filter_by(venue_id=2, artist_id=2).count(), 0)
+
+        res = self.client().post('/shows/schedule', json=dict(residency, count=1000))
+        self.assertEqual(res.status_code, 400)
+        res = self.client().post('/shows/schedule', json=dict(residency, frequency='hourly'))
+        self.assertEqual(res.status_code, 400)
+        for body in ([residency], 'weekly', 52):
+            self.assertEqual(self.client().post('/shows/schedule', json=body).status_code, 400)
+
+    def test_schedule_form_posts_need_csrf_token(self):
+        """ Form posts to /shows/schedule are CSRF checked, JSON bodies are not """
+        self.add_venues(1)
+        self.addCleanup(app.config.__setitem__, 'WTF_CSRF_ENABLED', False)
+        app.config['WTF_CSRF_ENABLED'] = True
+        residency = {'venue_id': 1, 'artist_id': 1, 'start_time': '2035-01-05T21:00', 'count': 2}
+
+        res = self.client().post('/shows/schedule', data=residency)
+        self.assertEqual(res.status_code, 400)
+        self.assertIn('The CSRF token is missing.', res.get_json()['errors'])
+        self.assertEqual(self.client().post('/shows/schedule', json=residency).status_code, 201)
+
+    def test_calendar_buckets_counts_and_first_shows(self):
+        """ The calendar counts shows per day/week/month and lists the first ones of each bucket """
+        self.add_venues(1, city='Austin', state='TX')
+        self.add_venues(1, city='Boston', state='MA')
+        Show.query.delete()
+        for venue_id, day, hour in ((1, 1, 20), (1, 1, 18), (1, 1, 22), (2, 1, 21), (1, 9, 20), (2, 30, 19)):
+            db.session.add(Show(venue_id=venue_id, artist_id=1, start_time=datetime(2035, 4, day, hour)))
+        db.session.commit()
+
+        res = self.client().get('/shows/calendar?unit=day&from=2035-04-01&to=2035-05-01&city=Austin&per_bucket=2')
+        data = res.get_json()
+        self.assertEqual(len(data['buckets']), 30)
+        first = data['buckets'][0]
+        self.assertEqual(first['count'], 3)
+        self.assertEqual([show['start_time'] for show in first['shows']], ['2035-04-01T18:00:00', '2035-04-01T20:00:00'])
+        self.assertEqual([bucket['count'] for bucket in data['buckets'] if bucket['count']], [3, 1])
+
+        # 2035-04-01 is a Sunday, its week starts on Monday March 26
+        data = self.client().get('/shows/calendar?unit=week&from=2035-04-01&to=2035-04-10').get_json()
+        self.assertEqual([(bucket['start'], bucket['count']) for bucket in data['buckets']],
+                         [('2035-03-26T00:00:00', 4), ('2035-04-02T00:00:00', 0), ('2035-04-09T00:00:00', 1)])
+        data = self.client().get('/shows/calendar?unit=month&from=2035-04-15&to=2035-05-01&venue_id=2').get_json()
+        self.assertEqual([bucket['count'] for bucket in data['buckets']], [2])
+
+        self.assertEqual(self.client().get('/shows/calendar?unit=year').status_code, 400)
+        self.assertEqual(self.client().get('/shows/calendar?from=2035-04-01&to=2040-01-01').status_code, 400)
+
+    def test_calendar_buckets_cached_per_day(self):
+        """ Calendar buckets are served from the cache until a show of their days changes """
+        self.add_venues(1)
+        Show.query.delete()
+        db.session.add(Show(venue_id=1, artist_id=1, start_time=datetime(2035, 4, 2, 20)))
+        db.session.commit()
+        url = '/shows/calendar?unit=day&from=2035-04-01&to=2035-04-08'
+        self.client().get(url)
+
+        with count_queries(db.engine) as statements:
+            self.assertEqual(self.client().get(url).get_json()['buckets'][1]['count'], 1)
+        self.assertEqual(len(statements), 0)
+
+        db.session.add(Show(venue_id=1, artist_id=1, start_time=datetime(2035, 4, 5, 20)))
+        db.session.commit()
+        misses = page_cache.stats()['misses']
+        data = self.client().get(url).get_json()
+        self.assertEqual(page_cache.stats()['misses'] - misses, 1)
+        self.assertEqual([bucket['count'] for bucket in data['buckets']], [0, 1, 0, 0, 1, 0, 0])
+
+    def test_import_command_loads_and_validates_rows(self):
+        """ flask fyyur import validates rows like the forms and resolves shows by name """
+        directory = tempfile.mkdtemp()
+        venues = os.path.join(directory, 'venues.csv')
+        with open(venues, 'w') as file:
+            file.write('name,address,city,state,phone,genres,seeking_talent\n'
+                       'The Hop,1 Main St,San Francisco,CA,4155551234,"Jazz,Blues",true\n'
+                       'Bad Phone,2 Main St,San Francisco,CA,12,Jazz,false\n'
+                       'The Hop,3 Main St,San Francisco,CA,,Jazz,true\n')
+        shows = os.path.join(directory, 'shows.jsonl')
+        with open(shows, 'w') as file:
+            file.write('{"venue_name": "The Hop", "artist_name": "Artist", "start_time": "2035-04-01T20:00:00"}\n'
+                       '{"venue_name": "The Hop", "artist_name": "Nobody", "start_time": "2035-04-01T20:00:00"}\n')
+        db.session.add(Artist(name='Artist', city='Austin', state='TX'))
+        db.session.commit()
+        runner = app.test_cli_runner()
+
+        result = runner.invoke(args=['fyyur', 'import', 'venues', venues])
+        self.assertIn('imported 1 venues', result.output)
+        self.assertIn('row 2 skipped: phone', result.output)
+        self.assertIn('row 3 skipped: name: "The Hop" already exists', result.output)
+        venue = Venue.query.filter_by(name='The Hop').one()
+        self.assertEqual(venue.genre_names, ['Blues', 'Jazz'])
+        self.assertEqual(venue.phone, '415-555-1234')
+        self.assertEqual(venue_search.search('hop')['count'], 1)
+        venue_id = venue.id
+
+        result = runner.invoke(args=['fyyur', 'import', 'shows', shows])
+        self.assertIn('imported 1 shows', result.output)
+        self.assertIn('row 2 skipped: artist_name', result.output)
+        self.assertEqual([show.venue_id for show in Show.query.all()], [venue_id])
+
+        db.session.add(Artist(name='Artist', city='Boston', state='MA'))
+        db.session.commit()
+        result = runner.invoke(args=['fyyur', 'import', 'shows', shows])
+        self.assertIn('row 1 skipped: artist_name: several artists have this name', result.output)
+
+    def test_import_skips_shows_in_archived_range(self):
+        """ Imported shows dated before the archived range end are row errors, not a failed batch """
+        from importer import Importer
+        self.add_venues(1)
+        importer = Importer('shows')
+        importer.prepare()
+        self.assertIsNone(importer.archived_until)
+        importer.archived_until = datetime(2035, 1, 1)
+
+        value, errors = importer.clean({'venue_id': 1, 'artist_id': 1, 'start_time': '2034-12-31T20:00'})
+        self.assertEqual(errors, ['start_time: shows before 2035-01-01 are archived'])
+        value, errors = importer.clean({'venue_id': 1, 'artist_id': 1, 'start_time': '2035-01-01T20:00'})
+        self.assertIsNone(errors)
+
+    def test_export_streams_rows_changed_since(self):
+        """ /export/<kind> streams csv or jsonl, ?since= only returns the rows changed after it """
+        self.add_venues(2)
+        res = self.client().get('/export/venues')
+        lines = res.get_data(as_text=True).splitlines()
+        self.assertEqual(res.mimetype, 'text/csv')
+        self.assertTrue(lines[0].startswith('id,name,address'))
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].endswith(',Jazz'))
+
+        since = datetime.utcnow()
+        venue = Venue.query.get(2)
+        venue.name = 'Renamed'
+        db.session.commit()
+        res = self.client().get('/export/venues?format=jsonl&since=' + since.isoformat())
+        rows = [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+        self.assertEqual([(row['id'], row['name'], row['genres']) for row in rows], [(2, 'Renamed', ['Jazz'])])
+
+        res = self.client().get('/export/shows?format=jsonl&since=' + since.isoformat())
+        self.assertEqual({json.loads(line)['venue_id'] for line in res.get_data(as_text=True).splitlines()}, {2})
+        self.assertEqual(self.client().get('/export/shows?since=yesterday').status_code, 400)
+
+        # an offset is converted to the naive UTC of the columns
+        before = (since - timedelta(hours=2)).replace(tzinfo=timezone(timedelta(hours=-2)))
+        res = self.client().get('/export/venues?format=jsonl&since=' + quote(before.isoformat()))
+        self.assertEqual([json.loads(line)['id'] for line in res.get_data(as_text=True).splitlines()], [2])
+
+    def test_parquet_export_schema_follows_columns(self):
+        """ Parquet exports type nullable columns even when the first batch only has None """
+        import pyarrow.parquet
+        from exporter import export_batches, write_parquet
+        self.add_venues(2)
+        Venue.query.get(1).phone = None
+        Venue.query.get(2).phone = '415-555-1234'
+        db.session.commit()
+        path = os.path.join(tempfile.mkdtemp(), 'venues.parquet')
+
+        write_parquet('venues', export_batches('venues', batch_size=1), path)
+
+        table = pyarrow.parquet.read_table(path)
+        self.assertEqual(str(table.schema.field('phone').type), 'string')
+        self.assertEqual(table.column('phone').to_pylist(), [None, '415-555-1234'])
+
+    def test_incremental_export_lists_deletions(self):
+        """ Incremental exports end with the ids deleted since, cascaded shows included """
+        from exporter import export_batches
+        self.add_venues(2)
+        since = datetime.utcnow()
+        shows = [id for id, in db.session.query(Show.id).filter(Show.venue_id == 1).order_by(Show.id)]
+        db.session.delete(Venue.query.get(1))
+        db.session.commit()
+
+        rows = [json.loads(line) for line in self.client().get('/export/venues?format=jsonl&since=' + since.isoformat())
+                .get_data(as_text=True).splitlines()]
+        self.assertEqual(rows, [{'op': 'delete', 'id': 1}])
+        deleted = [row['id'] for batch in export_batches('shows', since) for row in batch if row['op'] == 'delete']
+        self.assertEqual(sorted(deleted), shows)
+
+        lines = self.client().get('/export/venues?since=' + since.isoformat()).get_data(as_text=True).splitlines()
+        self.assertTrue(lines[0].startswith('op,id,name'))
+        self.assertTrue(lines[1].startswith('delete,1,,'))
+        self.assertEqual(len(self.client().get('/export/venues').get_data(as_text=True).splitlines()), 2)
+
+    def test_generator_is_deterministic(self):
+        """ The synthetic dataset only depends on the seed and anchor date """
+        anchor = datetime(2026, 1, 1)
+        first = Generator(seed=7, anchor=anchor)
+        second = Generator(seed=7, anchor=anchor)
+        self.assertEqual(list(first.venues(20)), list(second.venues(20)))
+        shows = list(first.shows(200, 20, 20))
+        self.assertEqual(shows, list(second.shows(200, 20, 20)))
+        self.assertNotEqual(list(first.venues(20)), list(Generator(seed=8, anchor=anchor).venues(20)))
+        self.assertTrue(all(18 <= show['start_time'].hour <= 22 for show in shows))
+        self.assertTrue(any(show['start_time'] < anchor for show in shows))
+        self.assertTrue(any(show['start_time'] > anchor for show in shows))
+
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['fyyur', 'generate', '--venues', '20', '--artists', '20', '--shows', '200'])
+        self.assertIn('generated 200 shows', result.output)
+        self.assertEqual(Venue.query.count(), 20)
+
+    def test_partitions_command_needs_partitioned_shows(self):
+        """ The partition maintenance refuses to run on a plain shows table """
+        result = app.test_cli_runner().invoke(args=['fyyur', 'partitions', '--dry-run'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('not a partitioned table', result.output)
+        self.assertEqual(BOUND.search("FOR VALUES FROM (MINVALUE) TO ('2035-04-01 00:00:00')").groups(),
+                         (None, '2035-04-01 00:00:00'))
+
+    def test_server_timing_and_slow_request_log(self):
+        """ Responses carry Server-Timing, slow requests are logged with their statement fingerprints """
+        self.add_venues(2)
+        res = self.client().get('/venues')
+        timings = res.headers.getlist('Server-Timing')
+        self.assertTrue(timings[0].startswith('db;desc="2 queries";dur='))
+        self.assertTrue(timings[1].startswith('app;dur='))
+
+        app.config.update(SLOW_REQUEST_MS=0, SLOW_REQUEST_SAMPLE_RATE=1.0)
+        try:
+            with self.assertLogs(app.logger, 'WARNING') as logs:
+                self.client().get('/venues/1')
+        finally:
+            app.config.update(SLOW_REQUEST_MS=500, SLOW_REQUEST_SAMPLE_RATE=0.1)
+        record = json.loads(logs.records[0].getMessage().split(' ', 2)[2])
+        self.assertEqual(record['path'], '/venues/1')
+        self.assertEqual(record['queries'], sum(entry['count'] for entry in record['statements']))
+        self.assertEqual(record['repeated'], [])
+
+    def test_repeated_statements_share_a_fingerprint(self):
+        """ Statements differing only in their parameters and IN list length are grouped together """
+        stats = RequestStats()
+        for ids in ('(?)', '(?, ?)', '(?, ?, ?)'):
+            stats.record('SELECT shows.id FROM shows WHERE shows.venue_id IN %s LIMIT 10' % ids, 0.001)
+        stats.record('SELECT venues.name FROM venues WHERE venues.id = %(param_1)s', 0.001)
+        self.assertEqual(len(stats.statements), 2)
+        self.assertEqual([count for key, count in stats.repeated(3)], [3])
+        self.assertEqual(normalize("SELECT 1 FROM venues WHERE name = 'it''s'"), 'SELECT ? FROM venues WHERE name = ?')
+
+    def test_log_records_are_queued_as_json_lines(self):
+        """ Log records carry the request id and latency, and overflowing records are dropped and counted """
+        handler = DroppingQueueHandler(queue.Queue(1))
+        logger = logging.getLogger('fyyur.test')
+        logger.addHandler(handler)
+        logger.propagate = False
+        try:
+            with app.test_request_context('/venues', headers={'X-Request-Id': 'abc123'}):
+                start_request()
+                logger.warning('first %s', 'record')
+                logger.warning('dropped')
+                logger.warning('dropped too')
+                self.assertEqual(handler.dropped, 2)
+                first = json.loads(JsonFormatter().format(handler.queue.get_nowait()))
+                logger.warning('after the drops')
+                after = json.loads(JsonFormatter().format(handler.queue.get_nowait()))
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual(first['message'], 'first record')
+        self.assertEqual(first['request_id'], 'abc123')
+        self.assertEqual(first['path'], '/venues')
+        self.assertIn('latency_ms', first)
+        self.assertNotIn('dropped_before', first)
+        self.assertEqual(after['dropped_before'], 2)
+
+        res = self.client().get('/', headers={'X-Request-Id': 'req-1'})
+        self.assertEqual(res.headers['X-Request-Id'], 'req-1')
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+'''
+Quiz benchmark
+    plays quizzes of ROUNDS turns on a table of N questions, drawing each
+    question the way play_quiz() used to (load every question not yet
+    asked, random.choice in Python) and with the question sampler
+
+    python bench_quiz.py --questions 1000000 --rounds 50
+'''
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from flask import Flask
+from models import setup_db, db, Question
+from sampler import question_sampler
+
+parser = argparse.ArgumentParser(description='Benchmark the random question draw of /quizzes/play')
+parser.add_argument('--questions', type=int, default=1000000)
+parser.add_argument('--categories', type=int, default=6)
+parser.add_argument('--rounds', type=int, default=50, help='turns per quiz')
+parser.add_argument('--quizzes', type=int, default=20, help='quizzes played with the sampler')
+parser.add_argument('--full-scan-rounds', type=int, default=3,
+                    help='turns played the old way (each one loads the whole table)')
+parser.add_argument('--database', help='defaults to a new SQLite file')
+args = parser.parse_args()
+
+
+def load_questions(count):
+    rows = []
+    for i in range(count):
+        rows.append({
+            'question': 'Question %d' % i,
+            'answer': 'Answer %d' % i,
+            'category': str(i % args.categories + 1),
+            'difficulty': i % 5 + 1,
+        })
+        if len(rows) == 10000:
+            db.session.execute(Question.__table__.insert(), rows)
+            rows = []
+    if rows:
+        db.session.execute(Question.__table__.insert(), rows)
+    db.session.commit()
+
+
+# The draw of play_quiz() before the sampler
+def full_scan_draw(category, previous_questions):
+    questions = Question.query.filter(Question.id.notin_(previous_questions), Question.category == str(category)).all()
+    return random.choice(questions) if questions else None
+
+
+def play(draw, rounds):
+    category = random.randint(1, args.categories)
+    previous_questions = []
+    timings = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        question = draw(category, previous_questions)
+        timings.append((time.perf_counter() - start) * 1000)
+        previous_questions.append(question.id)
+        # a quiz session doesn't keep the questions it was shown
+        db.session.expunge_all()
+    return timings
+
+
+def report(label, timings):
+    timings = sorted(timings)
+    print('%-22s %5d draws  p50=%9.3fms  p99=%9.3fms' % (
+        label, len(timings), timings[len(timings) // 2], timings[int(0.99 * (len(timings) - 1))]))
+
+
+def main():
+    database = args.database or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'quiz.db')
+    app = Flask(__name__)
+    setup_db(app, database)
+    with app.app_context():
+        if Question.query.count() == 0:
+            start = time.perf_counter()
+            load_questions(args.questions)
+            print('%d questions loaded in %.1fs' % (args.questions, time.perf_counter() - start))
+
+        start = time.perf_counter()
+        question_sampler.invalidate()
+        question_sampler.pool(0)
+        size = sum(ids.buffer_info()[1] * ids.itemsize for ids in question_sampler.ids.values())
+        # dict tables only, the int keys are not counted
+        positions_size = sum(sys.getsizeof(positions) for positions in question_sampler.positions.values())
+        print('sampler loaded in %.2fs, %.1fMB of ids, %.1fMB of positions' % (
+            time.perf_counter() - start, size / 1024 / 1024, positions_size / 1024 / 1024))
+
+        report('full scan', play(full_scan_draw, args.full_scan_rounds))
+        timings = []
+        for i in range(args.quizzes):
+            timings += play(question_sampler.draw, args.rounds)
+        report('sampler', timings)
+
+
+main()
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import Category
+
+'''
+CategoryRegistry
+    the {id: type} dictionary of the categories, loaded once and shared by
+    every request until a commit writes to categories
+'''
+
+
+class CategoryRegistry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.categories = None
+        self.version = None
+
+    # Returns (categories, version); the version is a hash of the categories,
+    # so it is the same in every process serving the same data
+    def get(self):
+        with self.lock:
+            if self.categories is None:
+                categories = {}
+                for category in Category.query.order_by(Category.id).all():
+                    categories[category.id] = category.type.lower()
+                self.categories = categories
+                self.version = hashlib.sha1(json.dumps(categories, sort_keys=True).encode()).hexdigest()[:16]
+            return self.categories, self.version
+
+    def invalidate(self):
+        with self.lock:
+            self.categories = None
+            self.version = None
+
+
+category_registry = CategoryRegistry()
+
+
+'''
+Invalidation
+    flushes and bulk statements touching categories mark the session, and
+    the registry is dropped once the transaction commits
+'''
+
+
+@event.listens_for(Session, 'after_flush')
+def mark_category_writes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Category):
+            session.info['categories_changed'] = True
+            return
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def mark_category_bulk_writes(update_context):
+    if update_context.mapper.class_ is Category:
+        update_context.session.info['categories_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_categories(session):
+    if session.info.pop('categories_changed', False):
+        category_registry.invalidate()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def discard_category_writes(session, previous_transaction):
+    session.info.pop('categories_changed', None)
@@ -1,30 +1,85 @@
+import base64
 import os
 from flask import Flask, request, abort, jsonify, json
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
+from sqlalchemy import func
 from werkzeug.exceptions import HTTPException
 
-from models import setup_db, Question, Category
+from models import setup_db, Question
+from categories import category_registry
+from sampler import question_sampler
+from quizzes import MemoryQuizStore, DatabaseQuizStore
 
 QUESTIONS_PER_PAGE = 10
-
-# Returns a dictionary of {id:type} for all categories
-def get_categories_dict(categories):
-  categories_dict = {}
-  for category in categories:
-    categories_dict[category.id] = category.type.lower()
-  return(categories_dict)
-
-
-def paginate_questions(request, questions):
-  current_questions = []
+MAX_QUESTIONS_PER_PAGE = 100
+# questions dealt to a quiz session, and seconds it lives after its last turn
+QUIZ_DECK_SIZE = 50
+QUIZ_SESSION_TTL = 3600
+
+# Adds the categories and their version to a response body. Clients already
+# holding them send ?categories_version= and only get the version back.
+def embed_categories(request, body):
+  categories, version = category_registry.get()
+  body['categories_version'] = version
+  if request.args.get('categories_version') != version:
+    body['categories'] = categories
+  return body
+
+
+# Returns the formatted questions of the requested page and the total number of
+# questions of the query. The page is cut with LIMIT/OFFSET and the total comes
+# with it from count(*) OVER (), so only the rows of the page are loaded.
+def paginate_questions(request, query):
   page = request.args.get('page', 1, type=int)
-  start = (page-1)*QUESTIONS_PER_PAGE
-  end = start + QUESTIONS_PER_PAGE
-  questions = [question.format() for question in questions]
-  current_questions = questions[start:end]
-  return current_questions
+  if page < 1:
+    return [], query.order_by(None).count()
+  rows = query.add_columns(func.count().over().label('total')) \
+    .limit(QUESTIONS_PER_PAGE) \
+    .offset((page-1)*QUESTIONS_PER_PAGE) \
+    .all()
+  if len(rows) == 0:
+    # past the last page: the window count has no row to come with
+    return [], query.order_by(None).count()
+  current_questions = [question.format() for question, total in rows]
+  return current_questions, rows[0].total
+
+# Cursors are opaque to clients, they hold the id of the last question of a page
+def encode_cursor(question_id):
+  return base64.urlsafe_b64encode(str(question_id).encode()).decode()
+
+# Returns the question id of a cursor, or None if it can't be decoded
+def decode_cursor(cursor):
+  try:
+    return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+  except (ValueError, UnicodeDecodeError):
+    return None
+
+# Cursor mode is asked for with ?after=<cursor> and/or ?limit=
+def wants_cursor(request):
+  return 'after' in request.args or 'limit' in request.args
+
+# Returns the formatted questions following the ?after= cursor, at most ?limit=
+# of them, and the cursor of the next page (None on the last one). The query
+# must be ordered by id: the page seeks on it, so its cost doesn't depend on
+# how deep it is, and deleting questions doesn't shift the following pages.
+def paginate_questions_after(request, query):
+  limit = request.args.get('limit', QUESTIONS_PER_PAGE, type=int)
+  if limit < 1:
+    abort(400)
+  limit = min(limit, MAX_QUESTIONS_PER_PAGE)
+  after = request.args.get('after')
+  if after:
+    after_id = decode_cursor(after)
+    if after_id is None:
+      abort(400)
+    query = query.filter(Question.id > after_id)
+  questions = query.limit(limit + 1).all()
+  next_cursor = None
+  if len(questions) > limit:
+    questions = questions[:limit]
+    next_cursor = encode_cursor(questions[-1].id)
+  return [question.format() for question in questions], next_cursor
 
 def get_question_dict(question):
   if question is None:
@@ -38,8 +93,17 @@ def get_question_dict(question):
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
+  if test_config:
+    app.config.update(test_config)
   setup_db(app)
 
+  # quiz sessions live in this process unless QUIZ_SESSIONS_IN_DATABASE is set,
+  # which shares them between the processes serving the API
+  if app.config.get('QUIZ_SESSIONS_IN_DATABASE'):
+    quiz_store = DatabaseQuizStore(QUIZ_SESSION_TTL)
+  else:
+    quiz_store = MemoryQuizStore(QUIZ_SESSION_TTL)
+
   CORS(app, resources={r"/*": {"origins": "*"}})
 
   @app.after_request
@@ -50,27 +114,36 @@ def create_app(test_config=None):
 
   @app.route('/categories', methods=['GET'])
   def get_categories():
-    categories = Category.query.order_by(Category.id).all()
+    categories, version = category_registry.get()
     if(len(categories) == 0):
       abort(404)
-    return jsonify({
+    # the version is the ETag: a matching If-None-Match gets a 304
+    response = jsonify({
       'success': True,
-      'categories': get_categories_dict(categories)
+      'categories': categories,
+      'categories_version': version
     })
+    response.set_etag(version)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
   @app.route('/questions', methods=['GET'])
   def get_questions():
-    questions = Question.query.order_by(Question.id).all()
-    current_questions = paginate_questions(request, questions)
+    if wants_cursor(request):
+      current_questions, next_cursor = paginate_questions_after(request, Question.query.order_by(Question.id))
+      return jsonify(embed_categories(request, {
+        'success': True,
+        'questions': current_questions,
+        'next_cursor': next_cursor,
+      }))
+    current_questions, total_questions = paginate_questions(request, Question.query.order_by(Question.id))
     if(len(current_questions) == 0):
       abort(404)
-    categories = Category.query.order_by(Category.id).all()
-    return jsonify({
+    return jsonify(embed_categories(request, {
       'success': True,
       'questions': current_questions,
-      'total_questions': len(questions),
-      'categories': get_categories_dict(categories),
-    })
+      'total_questions': total_questions,
+    }))
 
   @app.route('/questions/<int:question_id>', methods=['DELETE'])
   def delete_question(question_id):
@@ -112,33 +185,39 @@ def create_app(test_config=None):
   def search_question():
     body = request.get_json()
     search_term = body.get('searchTerm', None)
-    questions = Question.query.filter(Question.question.ilike(f'%{search_term}%')).all()
-    current_questions = paginate_questions(request, questions)
+    questions = Question.query.filter(Question.question.ilike(f'%{search_term}%')).order_by(Question.id)
+    current_questions, total_questions = paginate_questions(request, questions)
     if(len(current_questions) == 0):
       abort(404)
-    categories = Category.query.order_by(Category.id).all()
-    return jsonify({
+    return jsonify(embed_categories(request, {
       'success': True,
       'questions': current_questions,
-      'total_questions': len(questions),
-      'categories': get_categories_dict(categories),
-    })
+      'total_questions': total_questions,
+    }))
 
 
 
   @app.route('/categories/<int:category_id>/questions', methods=['GET'])
   def get_questions_by_category(category_id):
-    category = Category.query.get(category_id)
-    if category is None:
+    categories, version = category_registry.get()
+    if category_id not in categories:
       abort(404)
 
-    questions = Question.query.order_by(Question.id).filter(Question.category == category_id).all()
-    current_questions = paginate_questions(request, questions)
+    questions = Question.query.order_by(Question.id).filter(Question.category == category_id)
+    if wants_cursor(request):
+      current_questions, next_cursor = paginate_questions_after(request, questions)
+      return jsonify({
+        'success': True,
+        'questions': current_questions,
+        'next_cursor': next_cursor,
+        'current_category': category_id
+      })
+    current_questions, total_questions = paginate_questions(request, questions)
 
     return jsonify({
       'success': True,
       'questions': current_questions,
-      'total_questions': len(questions),
+      'total_questions': total_questions,
       'current_category': category_id
     })
 
@@ -153,14 +232,9 @@ def create_app(test_config=None):
       if previous_questions is None or quiz_category is None:
         abort(400)
       
-      if quiz_category == 0:
-        questions = Question.query.filter(Question.id.notin_(previous_questions)).all()
-      else:
-        questions = Question.query.filter(Question.id.notin_(previous_questions),Question.category == quiz_category).all()
-      current_question = None
-      if len(questions) > 0:
-        current_question = random.choice(questions)
-      
+      # 0 stands for all categories
+      current_question = question_sampler.draw(int(quiz_category), previous_questions)
+
 
       return jsonify({
         'success': True,
@@ -170,6 +244,51 @@ def create_app(test_config=None):
     except:
       abort(400)
 
+  # Starts a quiz: deals a shuffled deck of the category (0 for all) and
+  # returns its id, the only thing later turns send
+  @app.route('/quizzes', methods=['POST'])
+  def start_quiz():
+    body = request.get_json(silent=True) or {}
+    quiz_category = body.get('quiz_category')
+    try:
+      category_id = int(quiz_category['id'])
+    except (TypeError, KeyError, ValueError):
+      abort(400)
+
+    deck = question_sampler.deal(category_id, QUIZ_DECK_SIZE)
+    if not deck:
+      abort(404)
+    quiz_id = quiz_store.create(deck)
+
+    return jsonify({
+      'success': True,
+      'quiz_id': quiz_id,
+      'total_questions': len(deck),
+      'expires_in': QUIZ_SESSION_TTL
+    }), 201
+
+  # Next question of a quiz, null once its deck is done
+  @app.route('/quizzes/<quiz_id>/next', methods=['POST'])
+  def next_quiz_question(quiz_id):
+    while True:
+      try:
+        question_id, remaining = quiz_store.next(quiz_id)
+      except KeyError:
+        abort(404)
+      if question_id is None:
+        current_question = None
+        break
+      current_question = Question.query.get(question_id)
+      # skip questions deleted since the deck was dealt
+      if current_question is not None:
+        break
+
+    return jsonify({
+      'success': True,
+      'question': get_question_dict(current_question),
+      'remaining': remaining
+    })
+
   
 
   @app.errorhandler(HTTPException)
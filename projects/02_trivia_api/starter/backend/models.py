@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, Index, DateTime, LargeBinary, create_engine
 from flask_sqlalchemy import SQLAlchemy
 import json
 import config
@@ -30,6 +30,10 @@ Question
 
 class Question(db.Model):
     __tablename__ = 'questions'
+    # category listings are paginated by seeking on (category, id)
+    __table_args__ = (
+        Index('ix_questions_category_id', 'category', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(String)
@@ -84,3 +88,32 @@ class Category(db.Model):
             'id': self.id,
             'type': self.type
         }
+
+
+'''
+QuizSession
+    the shuffled question ids of a quiz in progress, as a packed int array,
+    and the position of the next one
+'''
+
+
+class QuizSession(db.Model):
+    __tablename__ = 'quiz_sessions'
+
+    id = Column(String, primary_key=True)
+    deck = Column(LargeBinary, nullable=False)
+    position = Column(Integer, nullable=False, default=0)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def __init__(self, id, deck, position, expires_at):
+        self.id = id
+        self.deck = deck
+        self.position = position
+        self.expires_at = expires_at
+
+    def insert(self):
+        db.session.add(self)
+        db.session.commit()
+
+    def update(self):
+        db.session.commit()
@@ -0,0 +1,113 @@
+import random
+import secrets
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from models import db, QuizSession
+
+'''
+Quiz sessions
+    starting a quiz deals a shuffled deck of question ids of its category;
+    each turn then takes the next id of the deck, so the client only sends
+    the quiz id and a turn costs the same whatever the length of the quiz
+'''
+
+
+# Deals `size` ids taken at random from `ids` (an array of question ids), in random order;
+# positions are sampled as random.sample only takes arrays from Python 3.10
+def deal(ids, size):
+    return array('i', [ids[i] for i in random.sample(range(len(ids)), min(size, len(ids)))])
+
+
+'''
+MemoryQuizStore
+    decks kept in the process, each expiring `ttl` seconds after its last
+    turn; past `max_sessions` the least recently played quiz is evicted
+'''
+
+
+class MemoryQuizStore:
+
+    def __init__(self, ttl, max_sessions=100000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def create(self, deck):
+        quiz_id = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self.lock:
+            self.evict(now)
+            # [deck, position of the next id, expiry]
+            self.sessions[quiz_id] = [deck, 0, now + self.ttl]
+        return quiz_id
+
+    # Returns (next question id or None once the deck is done, ids left),
+    # raises KeyError for unknown or expired quizzes
+    def next(self, quiz_id):
+        now = time.monotonic()
+        with self.lock:
+            session = self.sessions[quiz_id]
+            if session[2] < now:
+                del self.sessions[quiz_id]
+                raise KeyError(quiz_id)
+            deck, position = session[0], session[1]
+            session[2] = now + self.ttl
+            self.sessions.move_to_end(quiz_id)
+            if position >= len(deck):
+                return None, 0
+            session[1] = position + 1
+            return deck[position], len(deck) - position - 1
+
+    # Sessions are ordered by expiry, as every turn moves its quiz to the end
+    def evict(self, now):
+        while self.sessions:
+            quiz_id, session = next(iter(self.sessions.items()))
+            if session[2] >= now and len(self.sessions) < self.max_sessions:
+                return
+            self.sessions.popitem(last=False)
+
+
+'''
+DatabaseQuizStore
+    decks kept in the quiz_sessions table, shared by every process; a turn
+    reads and advances one row
+'''
+
+
+class DatabaseQuizStore:
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    def create(self, deck):
+        now = datetime.utcnow()
+        QuizSession.query.filter(QuizSession.expires_at < now).delete(synchronize_session=False)
+        session = QuizSession(
+            id=secrets.token_urlsafe(16),
+            deck=deck.tobytes(),
+            position=0,
+            expires_at=now + timedelta(seconds=self.ttl)
+        )
+        session.insert()
+        return session.id
+
+    def next(self, quiz_id):
+        now = datetime.utcnow()
+        session = QuizSession.query.filter(QuizSession.id == quiz_id).with_for_update().one_or_none()
+        if session is None or session.expires_at < now:
+            db.session.rollback()
+            raise KeyError(quiz_id)
+        deck = array('i')
+        deck.frombytes(session.deck)
+        session.expires_at = now + timedelta(seconds=self.ttl)
+        if session.position >= len(deck):
+            session.update()
+            return None, 0
+        position = session.position
+        session.position = position + 1
+        session.update()
+        return deck[position], len(deck) - position - 1
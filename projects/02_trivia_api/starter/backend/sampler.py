@@ -0,0 +1,203 @@
+import random
+import threading
+from array import array
+from itertools import groupby
+from operator import itemgetter
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from models import db, Question
+from quizzes import deal
+
+'''
+QuestionSampler
+    the question ids of every category (and of all of them, under 0) in
+    compact int arrays, so a quiz turn draws a random unseen id without
+    scanning the table and then loads only that question; each array has a
+    map of id to position so a delete swaps the last id into its slot
+
+    the ids are loaded once and then kept up to date by the session events
+    below, which only see the writes of this process: a question deleted by
+    another process is dropped when a draw misses it, and one added by
+    another process is only picked up after invalidate()
+'''
+
+ALL_CATEGORIES = 0
+
+
+# The pool key of a question's category (a string column holding the category
+# id), None for a missing or non-numeric category, whose questions are only
+# drawn from the pool of all categories
+def category_key(category):
+    try:
+        return int(category)
+    except (TypeError, ValueError):
+        return None
+
+
+class QuestionSampler:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = None
+        # {category: {question id: position in self.ids[category]}}
+        self.positions = None
+
+    def load(self):
+        # read in (category, id) index order with the DBAPI cursor, one array per category
+        cursor = db.session.connection().connection.cursor()
+        cursor.execute('SELECT category, id FROM questions ORDER BY category, id')
+        ids = {ALL_CATEGORIES: array('i')}
+        for category, rows in groupby(cursor, key=itemgetter(0)):
+            category_ids = array('i', map(itemgetter(1), rows))
+            ids[ALL_CATEGORIES].extend(category_ids)
+            key = category_key(category)
+            if key is not None:
+                ids.setdefault(key, array('i')).extend(category_ids)
+        cursor.close()
+        self.ids = ids
+        self.positions = {
+            category: {question_id: position for position, question_id in enumerate(category_ids)}
+            for category, category_ids in ids.items()
+        }
+
+    # A copy of the ids of the category, which commits may change once the lock is released
+    def pool(self, category):
+        with self.lock:
+            if self.ids is None:
+                self.load()
+            ids = self.ids.get(category)
+            return None if ids is None else array('i', ids)
+
+    # The deck of a new quiz, dealt under the lock without copying the pool
+    def deal(self, category, size):
+        with self.lock:
+            if self.ids is None:
+                self.load()
+            ids = self.ids.get(category)
+            return deal(ids, size) if ids else None
+
+    # A random id of the category (0 for all) not in `seen`, or None when all were asked:
+    # a rank among the unseen ids, shifted past the positions of the seen ones
+    def draw_id(self, category, seen):
+        with self.lock:
+            if self.ids is None:
+                self.load()
+            ids = self.ids.get(category)
+            if not ids:
+                return None
+            positions = self.positions[category]
+            seen_positions = sorted({positions[question_id] for question_id in seen if question_id in positions})
+            if len(seen_positions) >= len(ids):
+                return None
+            position = random.randrange(len(ids) - len(seen_positions))
+            for seen_position in seen_positions:
+                if seen_position > position:
+                    break
+                position += 1
+            return ids[position]
+
+    # A random question of the category not in `seen`, loaded by primary key
+    def draw(self, category, seen):
+        seen = set(seen)
+        while True:
+            question_id = self.draw_id(category, seen)
+            if question_id is None:
+                return None
+            question = Question.query.get(question_id)
+            if question is not None:
+                return question
+            # deleted by another process since the ids were loaded
+            self.remove(question_id)
+            seen.add(question_id)
+
+    def add(self, question_id, category):
+        with self.lock:
+            if self.ids is None:
+                return
+            self.append(ALL_CATEGORIES, question_id)
+            key = category_key(category)
+            if key is not None:
+                self.append(key, question_id)
+
+    def remove(self, question_id):
+        with self.lock:
+            if self.ids is None:
+                return
+            for category in list(self.ids):
+                self.swap_remove(category, question_id)
+
+    def append(self, category, question_id):
+        ids = self.ids.setdefault(category, array('i'))
+        positions = self.positions.setdefault(category, {})
+        if question_id not in positions:
+            positions[question_id] = len(ids)
+            ids.append(question_id)
+
+    # Moves the last id of the category into the slot of `question_id`
+    def swap_remove(self, category, question_id):
+        positions = self.positions[category]
+        position = positions.pop(question_id, None)
+        if position is None:
+            return
+        ids = self.ids[category]
+        last = ids.pop()
+        if last != question_id:
+            ids[position] = last
+            positions[last] = position
+
+    def invalidate(self):
+        with self.lock:
+            self.ids = None
+            self.positions = None
+
+
+question_sampler = QuestionSampler()
+
+
+'''
+Maintenance
+    questions inserted, deleted or moved to another category are recorded
+    on the session at flush time and applied to the sampler on commit; bulk
+    statements make it reload
+'''
+
+
+@event.listens_for(Session, 'after_flush')
+def record_question_writes(session, flush_context):
+    changes = session.info.setdefault('question_changes', [])
+    for obj in session.new:
+        if isinstance(obj, Question):
+            changes.append(('add', obj.id, obj.category))
+    for obj in session.deleted:
+        if isinstance(obj, Question):
+            changes.append(('remove', obj.id, None))
+    for obj in session.dirty:
+        if isinstance(obj, Question) and inspect(obj).attrs.category.history.has_changes():
+            changes.append(('remove', obj.id, None))
+            changes.append(('add', obj.id, obj.category))
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def record_question_bulk_writes(update_context):
+    if update_context.mapper.class_ is Question:
+        update_context.session.info['questions_bulk_written'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def apply_question_writes(session):
+    changes = session.info.pop('question_changes', [])
+    if session.info.pop('questions_bulk_written', False):
+        question_sampler.invalidate()
+        return
+    for change, question_id, category in changes:
+        if change == 'add':
+            question_sampler.add(question_id, category)
+        else:
+            question_sampler.remove(question_id)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def discard_question_writes(session, previous_transaction):
+    session.info.pop('question_changes', None)
+    session.info.pop('questions_bulk_written', None)
@@ -5,7 +5,8 @@ from flask_sqlalchemy import SQLAlchemy
 import config
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from models import setup_db, db, Question, Category
+from sampler import question_sampler
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -42,6 +43,30 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(data['categories']))
 
 
+    def test_get_categories_etag(self):
+        """ /categories answers a matching If-None-Match with a 304, and changes version with the categories """
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+        version = json.loads(res.data)['categories_version']
+
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+
+        data = json.loads(self.client().get(f'/questions?categories_version={version}').data)
+        self.assertNotIn('categories', data)
+        self.assertEqual(data['categories_version'], version)
+
+        category = Category.query.order_by(Category.id).first()
+        category.type, original = category.type + ' Renamed', category.type
+        db.session.commit()
+        try:
+            res = self.client().get('/categories', headers={'If-None-Match': etag})
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(json.loads(res.data)['categories'][str(category.id)], original.lower() + ' renamed')
+        finally:
+            category.type = original
+            db.session.commit()
+
     def test_get_questions(self):
         """ Gets all questions using /questions end point """
         res = self.client().get('/questions')
@@ -53,6 +78,36 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['total_questions'])
         self.assertTrue(data['categories'])
 
+    def test_get_questions_last_page(self):
+        """ Pages are cut in the database and carry the total of the whole table """
+        total = Question.query.count()
+        last_page = (total - 1) // 10 + 1
+        res = self.client().get(f'/questions?page={last_page}')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], total)
+        self.assertEqual(len(data['questions']), total - (last_page - 1) * 10)
+
+        res = self.client().get(f'/questions?page={last_page + 1}')
+        self.assertEqual(res.status_code, 404)
+
+    def test_get_questions_with_cursor(self):
+        """ ?limit= and ?after= walk the questions by id, following next_cursor """
+        ids = []
+        res = self.client().get('/questions?limit=5')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        while True:
+            self.assertLessEqual(len(data['questions']), 5)
+            ids += [question['id'] for question in data['questions']]
+            if data['next_cursor'] is None:
+                break
+            data = json.loads(self.client().get(f"/questions?limit=5&after={data['next_cursor']}").data)
+
+        self.assertEqual(ids, [question.id for question in Question.query.order_by(Question.id)])
+        self.assertEqual(self.client().get('/questions?after=not-a-cursor').status_code, 400)
+
     def test_delete_question_existent(self):
         """ Existent question deletion """
         question = Question.query.order_by((Question.id)).first()
@@ -97,6 +152,20 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['total_questions'])
         self.assertTrue(len(data['questions']))
 
+    def test_submit_question_non_numeric_category(self):
+        """ A saved question with a non-numeric category is answered as saved, and only drawn from all categories """
+        self.client().post('/quizzes/play', json={'previous_questions': [], 'quiz_category': {'id': 0}})
+        new_question = {'question': 'Odd one', 'answer': 'Answer', 'difficulty': 1, 'category': 'misc'}
+
+        res = self.client().post('/questions/submit', json=new_question)
+        question = Question.query.filter(Question.question == 'Odd one').one()
+        pools = [category for category, ids in question_sampler.ids.items() if question.id in ids]
+        question.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)['success'], True)
+        self.assertEqual(pools, [0])
+
     def test_submit_question_invalid(self):
         """ Invalid question submission """
 
@@ -200,6 +269,42 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['question'])
 
 
+    def test_play_quiz_asks_every_question_once(self):
+        """ A quiz draws each question of its category once, then runs out """
+        category_ids = {question.id for question in Question.query.filter(Question.category == 2)}
+        previous_questions = []
+        while True:
+            res = self.client().post('/quizzes/play', json={'previous_questions': previous_questions, 'quiz_category': {'id': 2}})
+            question = json.loads(res.data)['question']
+            if question is None:
+                break
+            self.assertNotIn(question['id'], previous_questions)
+            previous_questions.append(question['id'])
+
+        self.assertEqual(set(previous_questions), category_ids)
+
+    def test_play_quiz_skips_deleted_questions(self):
+        """ A question deleted mid-quiz is never drawn, the others still are once each """
+        category_ids = {question.id for question in Question.query.filter(Question.category == 2)}
+        self.client().post('/quizzes/play', json={'previous_questions': [], 'quiz_category': {'id': 2}})
+        deleted = Question(question='Deleted soon', answer='Yes', category=2, difficulty=1)
+        deleted.insert()
+        kept = Question(question='Kept', answer='Yes', category=2, difficulty=1)
+        kept.insert()
+        deleted_id, kept_id = deleted.id, kept.id
+        self.client().delete('/questions/{}'.format(deleted_id))
+
+        previous_questions = []
+        while True:
+            res = self.client().post('/quizzes/play', json={'previous_questions': previous_questions, 'quiz_category': {'id': 2}})
+            drawn = json.loads(res.data)['question']
+            if drawn is None:
+                break
+            previous_questions.append(drawn['id'])
+        self.client().delete('/questions/{}'.format(kept_id))
+
+        self.assertEqual(sorted(previous_questions), sorted(category_ids | {kept_id}))
+
     def test_play_quiz_invalid_category(self):
         """ Invalid category quiz """
 
@@ -217,6 +322,28 @@ class TriviaTestCase(unittest.TestCase):
         data = json.loads(res.data)
         self.assertFalse(data['question'])
 
+    def test_quiz_session(self):
+        """ A quiz session deals the questions of its category once each, then runs out """
+        category_ids = {question.id for question in Question.query.filter(Question.category == 2)}
+        res = self.client().post('/quizzes', json={'quiz_category': {'id': 2}})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(data['total_questions'], len(category_ids))
+
+        asked = []
+        while True:
+            res = self.client().post('/quizzes/{}/next'.format(data['quiz_id']))
+            question = json.loads(res.data)['question']
+            if question is None:
+                break
+            asked.append(question['id'])
+        self.assertEqual(sorted(asked), sorted(category_ids))
+
+        res = self.client().post('/quizzes/unknown/next')
+        self.assertEqual(res.status_code, 404)
+        res = self.client().post('/quizzes', json={'quiz_category': {'id': 20000}})
+        self.assertEqual(res.status_code, 404)
+
         
 
 # Make the tests conveniently executable
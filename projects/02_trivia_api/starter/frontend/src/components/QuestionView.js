@@ -13,6 +13,7 @@ class QuestionView extends Component {
       page: 1,
       totalQuestions: 0,
       categories: {},
+      categoriesVersion: '',
       currentCategory: null,
     }
   }
@@ -23,13 +24,15 @@ class QuestionView extends Component {
 
   getQuestions = () => {
     $.ajax({
-      url: `/questions?page=${this.state.page}`,
+      // the categories are only sent back when they changed since categoriesVersion
+      url: `/questions?page=${this.state.page}&categories_version=${this.state.categoriesVersion}`,
       type: "GET",
       success: (result) => {
         this.setState({
           questions: result.questions,
           totalQuestions: result.total_questions,
-          categories: result.categories,
+          categories: result.categories || this.state.categories,
+          categoriesVersion: result.categories_version,
           currentCategory: result.current_category })
         return;
       },